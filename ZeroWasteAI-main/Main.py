@@ -1,57 +1,40 @@
-import pandas as pd
-import re
 import numpy as np
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import MultiLabelBinarizer
 import json
-from websocket import create_connection
-import threading
-import queue
-from concurrent.futures import ThreadPoolExecutor
+import time
+import hashlib
+import functools
+import argparse
+import asyncio
+import signal
+from catalog import get_catalog
+from ann_index import ANN_RADIUS, ANN_TABLES, get_ann_index
+from bitset_index import get_bitset_index
+from features import get_recipe_features
+from ingredient_index import get_ingredient_index
+from scorer import (
+    EXPIRING_WEIGHT, SIMILARITY_WEIGHT, combined_scores, fused_order, score_batch, score_candidates,
+    top_k as select_top_k, user_profile,
+)
+from neighbours import NEIGHBOURS, get_neighbour_table
+from profiles import PROFILES_PATH, ProfileStore
+from metrics import METRICS_PORT, REGISTRY, observe, serve_metrics, timed_stage
+from micro_batch import BATCH_SIZE, BATCH_WAIT, STATS_COUNTERS as BATCH_STATS_COUNTERS, MicroBatcher
+from result_cache import RESULT_CACHE_SIZE, RESULT_CACHE_TTL, STATS_COUNTERS as CACHE_STATS_COUNTERS, ResultCache, payload_key
+from worker_pool import REPORT_INTERVAL, RequestRunner, ensure_compiled_catalog, warm_up
+from request_queue import MAX_QUEUED, QUEUE_DEADLINE
+from ws_client import MAX_IN_FLIGHT, STATS_COUNTERS as CLIENT_STATS_COUNTERS, RecommendationClient
+
+def filter_candidates(user_allergies, user_preferences, user_type, user_difficulty, user_time):
+    """
+    Returnează rândurile din catalog care trec de filtre, calculate din bitset-urile precalculate.
+    """
+    catalog = get_catalog()
+    return get_bitset_index(catalog).candidate_rows(user_allergies, user_preferences, user_type, user_difficulty, user_time)
 
 def filter_recepies(user_allergies, user_preferences, user_type, user_difficulty, user_time):
-    # Citirea datelor
-    file_path = 'Files/recipesAllergensPreferences.xlsx'
-    df = pd.read_excel(file_path, sheet_name='AI')
-
-    """ TIMPI DE GATIRE
-     1 - pentru retete cu timp de gatire maxim 30 min (inclusiv)
-     2 - max 60 min
-     3 - max 120 min
-     4 - max 180 min """
-
-    allergen_columns = [col for col in df.columns if col in ['Celery', 'Cereals', 'Crustaceans', 'Eggs', 'Fish', 'Lupin', 'Milk', 'Molluscs', 'Mustard', 'Peanuts', 'Sesame', 'Soybeans', 'Sulphur']]
-    preference_columns = [col for col in df.columns if col in ['Dairy-Free', 'Gluten-Free', 'Vegan', 'Vegetarian']]
-    valid_allergies = [allergen for allergen in user_allergies if allergen in allergen_columns]
-    valid_preferences = [preference for preference in user_preferences if preference in preference_columns]
-
-    filtered_recipes = df.copy()
-
-    # Filtrare pe baza alergenilor
-    if valid_allergies:
-        for allergen in valid_allergies:
-            filtered_recipes = filtered_recipes[filtered_recipes[allergen] == 0]
-
-    # Filtrare pe baza preferințelor
-    if valid_preferences:
-        preference_mask = filtered_recipes[valid_preferences].any(axis=1)
-        filtered_recipes = filtered_recipes[preference_mask]
-
-    # Filtrare pe baza tipului
-    if user_type:
-        filtered_recipes = filtered_recipes[filtered_recipes['Type'].isin(user_type)]
-
-    # Filtrare pe baza dificultății
-    if user_difficulty:
-        filtered_recipes = filtered_recipes[filtered_recipes['Difficulty'].isin(user_difficulty)]
-
-    if user_time is not None:
-        time_limits = {1: 30, 2: 60, 3: 120, 4: 180}
-        if user_time in time_limits:
-            max_time = time_limits[user_time]
-            filtered_recipes = filtered_recipes[filtered_recipes['Total time'] <= max_time]
-    return filtered_recipes
+    # Catalogul este ținut în memorie; se construiește un singur DataFrame, din rândurile candidate
+    rows = filter_candidates(user_allergies, user_preferences, user_type, user_difficulty, user_time)
+    return get_catalog().df.iloc[rows]
 
 
 
@@ -59,192 +42,390 @@ def use_expiring_ingredients(recipes_df, expiring_products):
 
     # Lista de produse care expiră ---- PRIMUL INGREDIENT E CEL CARE EXPIRA CEL MAI REPEDE
 
-    # Normalizarea listei de produse care expiră la litere mici
-    expiring_products = [product.lower() for product in expiring_products]
-
-    # Funcție pentru a calcula numărul de potriviri între ingrediente și expiring_products,
-    # excluzând cazurile cu "mini mozzarella"
-    def count_matches_excluding(ingredients, expiring_products):
-        ingredients_lower = ingredients.lower()
-        count = 0
-        for product in expiring_products:
-            if product in ingredients_lower and f'mini {product}' not in ingredients_lower:
-                count += 1
-        return count
-
-    # Funcție pentru a returna poziția ingredientului de prioritate cea mai mare,
-    # excluzând cazurile cu "mini mozzarella"
-    def highest_priority_match_excluding(ingredients, expiring_products):
-        ingredients_lower = ingredients.lower()
-        for idx, product in enumerate(expiring_products):
-            if product in ingredients_lower and f'mini {product}' not in ingredients_lower:
-                return idx  # Returnăm poziția primului ingredient găsit
-        return len(expiring_products)  # Dacă nu se găsește niciunul, returnăm o valoare mare
-
-    # Calcularea numărului de potriviri și a priorității maxime pentru fiecare rețetă
-    recipes_df['Match Count'] = recipes_df['Ingredients'].apply(
-        lambda x: count_matches_excluding(str(x), expiring_products)
-    )
-    recipes_df['Priority'] = recipes_df['Ingredients'].apply(
-        lambda x: highest_priority_match_excluding(str(x), expiring_products)
-    )
+    # Numărul de potriviri și prioritatea maximă pentru fiecare rețetă, excluzând cazurile
+    # cu "mini mozzarella", calculate din indexul inversat al segmentelor de ingrediente:
+    # costul e proporțional cu rețetele care conțin produsele, nu cu mărimea catalogului
+    catalog = get_catalog()
+    rows = catalog.rows_for_ids(recipes_df['id'].to_numpy())
+    match_count, priority = get_ingredient_index(catalog).dense_match(expiring_products, rows)
+
+    # recipes_df poate fi chiar catalogul rezident, deci nu adăugăm coloane pe el
+    scored_recipes = recipes_df.assign(**{'Match Count': match_count, 'Priority': priority})
 
     #sortarea rețetelor
-    sorted_recipes = recipes_df.sort_values(by=['Match Count', 'Priority'], ascending=[False, True])
+    sorted_recipes = scored_recipes.sort_values(by=['Match Count', 'Priority'], ascending=[False, True])
 
     return sorted_recipes
 
 
 
 
-def preprocess_ingredients(text):
-    return re.sub(r'\b\d+\b', '', text)  # elimina numerele
-
-def recomendations(retete_df, user_liked_recipe_ids, user_disliked_recipe_ids):
+def prepare_recommendations(retete_df, user_liked_recipe_ids, user_disliked_recipe_ids):
+    """
+    Pregătește scorarea: returnează (retete_df fără dislike-uri, rândurile candidate, rândurile
+    plăcute, rândurile respinse), rândurile fiind poziții în catalog.
+    Dacă nu avem ce scora, rândurile sunt None și retete_df e rezultatul final.
+    """
     # Setăm ID-ul ca index pentru referințe mai ușoare
     retete_df = retete_df.set_index('id', drop=False)
 
-    # Preprocesare ingrediente
-    retete_df['Processed_Ingredients'] = retete_df['Ingredients'].apply(preprocess_ingredients)
-    retete_df['Ingredients_List'] = retete_df['Processed_Ingredients'].apply(
-        lambda x: [item.strip().lower() for item in x.split(',')]
-    )
-
     # Validare ID-uri
     valid_liked_ids = [rid for rid in user_liked_recipe_ids if rid in retete_df.index]
     valid_disliked_ids = [rid for rid in user_disliked_recipe_ids if rid in retete_df.index]
 
     if not valid_liked_ids and not valid_disliked_ids:
         print("Nu există rețete plăcute sau respinse valide pentru utilizator. Returnăm toate rețetele disponibile.")
-        return retete_df.reset_index(drop=True)
+        return retete_df.reset_index(drop=True), None, None, None
 
     # Excludem rețetele respinse
     retete_df = retete_df[~retete_df.index.isin(valid_disliked_ids)]
 
-    # Vectorizare
-    mlb = MultiLabelBinarizer()
-    ingredient_matrix = mlb.fit_transform(retete_df['Ingredients_List'])
-
-    vectorizer = CountVectorizer()
-    word_matrix = vectorizer.fit_transform(retete_df['Processed_Ingredients'])
-
-    combined_matrix = np.hstack([ingredient_matrix, word_matrix.toarray()])
-
     # Obținem indicii pentru ID-uri plăcute
-    liked_indices = [retete_df.index.get_loc(rid) for rid in valid_liked_ids if rid in retete_df.index]
+    liked_indices = retete_df.index.get_indexer(valid_liked_ids)
+    liked_indices = liked_indices[liked_indices >= 0]
 
-    if not liked_indices:
+    if not len(liked_indices):
         print("Nu există potriviri pentru rețetele plăcute de utilizator. Returnăm rețetele fără dislike-uri.")
-        return retete_df.reset_index(drop=True)
+        return retete_df.reset_index(drop=True), None, None, None
 
-    # Calcul similaritate
-    similarities = cosine_similarity(combined_matrix[liked_indices], combined_matrix)
-    average_similarity = similarities.mean(axis=0)
-    retete_df['similarity'] = average_similarity
+    catalog = get_catalog()
+    candidate_rows = catalog.rows_for_ids(retete_df['id'].to_numpy())
+    return retete_df, candidate_rows, candidate_rows[liked_indices], catalog.rows_for_ids(valid_disliked_ids)
 
-    # Sortare
-    recommended_recipes = retete_df.sort_values(by='similarity', ascending=False)
+def profile_vector(features, liked_rows, stored=None):
+    # Profilul stocat (vezi profiles.ProfileStore) evită recalcularea mediei din toate rândurile plăcute
+    return stored.vector(features, liked_rows) if stored is not None else user_profile(features, liked_rows)
+
+def rank_recommendations(retete_df, similarity, top_k=None):
+    # Sortare: selectăm doar primele top_k
+    order = select_top_k(similarity, top_k)
+    recommended_recipes = retete_df.iloc[order].assign(similarity=similarity[order])
 
     return recommended_recipes.reset_index(drop=True) if not recommended_recipes.empty else retete_df.reset_index(drop=True)
 
+def recomendations(retete_df, user_liked_recipe_ids, user_disliked_recipe_ids, top_k=None):
+    retete_df, candidate_rows, liked_rows, _ = prepare_recommendations(retete_df, user_liked_recipe_ids, user_disliked_recipe_ids)
+    if candidate_rows is None:
+        return retete_df
+
+    # Trăsăturile sunt calculate o singură dată pe tot catalogul (matrice CSR normalizată L2).
+    # Media similarităților cu rețetele plăcute = produsul scalar cu profilul (media rândurilor plăcute),
+    # deci toți candidații sunt scorați cu un singur produs matrice-vector
+    features = get_recipe_features(get_catalog())
+    similarity = score_candidates(features, candidate_rows, user_profile(features, liked_rows))
+    return rank_recommendations(retete_df, similarity, top_k)
 
 
 
-# Flag global pentru oprirea thread-urilor
-stop_event = threading.Event()
 
-def websocket_listener(ws_url, request_queue):
+def prepare_request(payload):
     """
-    Thread-ul care ascultă mesajele de la WebSocket și le pune în stack.
+    Etapele de dinainte de scorare, fără DataFrame-uri: rândurile candidate (din bitset-uri),
+    potrivirile lor cu produsele care expiră și rândurile plăcute/respinse, ca în
+    recomendations: cu like-uri, rețetele respinse sunt scoase din candidați, iar profilul e
+    făcut din rețetele plăcute rămase candidate (liked_rows e None dacă nu rămâne niciuna).
+    disliked_rows cuprinde toate rețetele respinse, și pe cele eliminate de filtre: vecinii lor
+    (neighbours.NeighbourTable) pot fi totuși printre candidați.
+    Returnează (rows, match_count, priority, n_products, liked_rows, disliked_rows).
     """
-    global stop_event
-    try:
-        ws = create_connection(ws_url)
-        raspuns = ws.recv()
-        raspuns = json.loads(raspuns)
-
-        if raspuns['type'] == "connected":
-            print("Connected to WebSocket server.")
-            while ws.connected:
-                try:
-                    cerere = ws.recv()
-                    cerere = json.loads(cerere)
-                    request_queue.put((cerere, ws))  # Pune cererea și conexiunea în stack
-                except Exception as e:
-                    print(f"Error receiving message: {e}")
-                    break
-        ws.close()
-    except Exception as e:
-        print(f"WebSocket error: {e}")
-    finally:
-        print("WebSocket disconnected. Stopping workers...")
-        stop_event.set()  # Setează flag-ul pentru oprirea thread-urilor
+    catalog = get_catalog()
+    with timed_stage('filter'):
+        rows = filter_candidates(payload['Allergens'], payload['Preferences'], payload.get('Type'),
+                                 payload.get('Difficulty'), payload.get('Time'))
+    observe('candidates', len(rows))
+    expiring_products = payload.get('Expiring Products') or []
+    if expiring_products:
+        with timed_stage('expiring'):
+            match_count, priority = get_ingredient_index(catalog).dense_match(expiring_products, rows)
+    else:
+        match_count = priority = np.zeros(len(rows), dtype=np.int64)
+
+    liked_rows = disliked_rows = None
+    if payload.get('Liked Recipes'):
+        disliked_rows = catalog.rows_for_ids(payload.get('Disliked Recipes') or [])
+        if len(disliked_rows):
+            keep = ~np.isin(rows, disliked_rows)
+            rows, match_count, priority = rows[keep], match_count[keep], priority[keep]
+        liked_rows = catalog.rows_for_ids(payload['Liked Recipes'])
+        liked_rows = liked_rows[np.isin(liked_rows, rows)]
+        if not len(liked_rows):
+            liked_rows = None
+    return rows, match_count, priority, len(expiring_products), liked_rows, disliked_rows
+
+# Câmpurile unei cereri pentru un segment al clasamentului: 'Limit' (câte id-uri) și
+# 'Continuation' (token-ul primit cu segmentul anterior); nu schimbă clasamentul în sine
+SEGMENT_FIELDS = ('Limit', 'Continuation')
+
+def ranking_digest(payload):
+    """
+    Amprenta datelor de care depinde clasamentul (payload-ul canonic, fără câmpurile de segment).
+    """
+    canonical = payload_key({field: value for field, value in payload.items() if field not in SEGMENT_FIELDS})
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=8).hexdigest()
+
+def continuation_token(payload, offset, catalog_version):
+    return f"{catalog_version}:{offset}:{ranking_digest(payload)}"
 
-def process_request(cerere, ws):
+def continuation_offset(payload, catalog_version):
     """
-    Funcția care procesează o cerere și trimite răspunsul înapoi.
+    Poziția de la care continuă cererea. Un token lipsă, invalid sau emis pentru alt catalog ori
+    alte date ale utilizatorului (produse, preferințe, rating-uri schimbate) înseamnă un
+    clasament nou, de la 0; backend-ul înlocuiește atunci lista păstrată.
     """
     try:
-        # Procesare logică (simulat aici cu un print)
-        email = cerere['payload']['email']
-        user_allergies = cerere['payload']['Allergens']
-        user_preferences = cerere['payload']['Preferences']
-        user_difficulty = cerere['payload'].get('Difficulty')
-        user_time = cerere['payload'].get('Time')
-        user_type = cerere['payload'].get('Type')
-        user_liked_recipe_ids = cerere['payload'].get('Liked Recipes')
-        user_disliked_recipe_ids = cerere['payload'].get('Disliked Recipes')
-        expiring_products = cerere['payload'].get('Expiring Products')
-
-        # Aplicați funcțiile de filtrare și recomandare
-        filtered_recipies = filter_recepies(user_allergies, user_preferences, user_type, user_difficulty, user_time)
-        if expiring_products:
-            filtered_recipies = use_expiring_ingredients(filtered_recipies, expiring_products)
-        if user_liked_recipe_ids:
-            filtered_recipies = recomendations(filtered_recipies, user_liked_recipe_ids, user_disliked_recipe_ids)
-
-        recipe_ids = filtered_recipies["id"].tolist()
-        message = {"type": "run", "payload": {"recipe_ids": recipe_ids, "email": email}}
-        ws.send(json.dumps(message))  # Trimite răspunsul înapoi
-    except Exception as e:
-        print(f"Error processing request: {e}")
-
-def process_requests_worker(request_queue):
-    """
-    Funcție worker care extrage cereri din queue și le procesează.
-    """
-    global stop_event
-    while not stop_event.is_set():  # Verifică dacă trebuie să se oprească
+        version, offset, digest = (payload.get('Continuation') or '').split(':')
+        offset = int(offset)
+    except ValueError:
+        return 0
+    if version != catalog_version or digest != ranking_digest(payload) or offset < 0:
+        return 0
+    return offset
+
+def compute_recipe_ids(payload):
+    """
+    Calculează lista de id-uri recomandate pentru payload-ul unei cereri askScript.
+    Nu depinde de conexiune, deci poate rula și într-un proces worker.
+    """
+    result = compute_recipe_ids_batch([payload])[0]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+def compute_recipe_ids_batch(payloads, ann_top_k=0, ann_radius=ANN_RADIUS, ann_tables=None, neighbours=False,
+                             similarity_weight=SIMILARITY_WEIGHT, expiring_weight=EXPIRING_WEIGHT, top_k=None):
+    """
+    compute_recipe_ids pentru un lot de cereri: filtrarea rămâne per cerere, dar profilurile
+    tuturor utilizatorilor cu like-uri sunt scorate împreună, cu un singur produs matrice-matrice.
+    Cu ann_top_k > 0 și un index ANN în catalog, doar primele ann_top_k rețete sunt ordonate
+    (aproximativ) după similaritate, iar restul candidaților le urmează nescorați.
+    Cu neighbours și un tabel al vecinilor în catalog, scorul e agregat din vecinii precalculați
+    ai rețetelor plăcute, minus cei ai rețetelor respinse (vezi neighbours.NeighbourTable).
+
+    Similaritatea și potrivirile cu produsele care expiră sunt combinate cu ponderile date
+    (vezi scorer.combined_scores) și ordonate într-un singur pas (scorer.fused_order); cu top_k,
+    doar primele top_k rețete sunt returnate.
+    Returnează, în ordine, lista de id-uri sau excepția fiecărei cereri. O cerere cu 'Limit'
+    primește doar segmentul următor al clasamentului (vezi continuation_offset), ca dicționar:
+    {'recipe_ids', 'Offset', 'Total' (numărul candidaților), 'Continuation' (None la final)}.
+    """
+    results = [None] * len(payloads)
+    prepared = {}
+    for position, payload in enumerate(payloads):
         try:
-            cerere, ws = request_queue.get(timeout=1)  # Timeout pentru a verifica periodic flag-ul
-            process_request(cerere, ws)
-            request_queue.task_done()  # Marchează cererea ca procesată
-        except queue.Empty:
-            continue  # Continuă dacă coada este goală
-
-def main():
-    global stop_event
-    # Stack pentru cereri (folosim un Queue FIFO thread-safe)
-    request_queue = queue.Queue()
-    # URL-ul WebSocket
-    ws_url = "ws://localhost:8000/ws/python-script/"
-
-    # Pornirea thread-ului pentru WebSocket listener
-    listener_thread = threading.Thread(target=websocket_listener, args=(ws_url, request_queue))
-    listener_thread.start()
-
-    # Crearea unui pool de thread-uri pentru procesare
-    NUM_THREADS = 5  # Numărul de thread-uri pentru procesare
-    with ThreadPoolExecutor(max_workers=NUM_THREADS) as executor:
-        for _ in range(NUM_THREADS):
-            executor.submit(process_requests_worker, request_queue)
-
-    # Așteaptă finalizarea ascultării WebSocket
-    listener_thread.join()
-
-    # Așteaptă finalizarea cererilor rămase în coadă
-    request_queue.join()
+            prepared[position] = prepare_request(payload)
+        except Exception as e:
+            results[position] = e
+
+    catalog = get_catalog()
+    pending = [(position, request) for position, request in prepared.items() if request[4] is not None]
+    similarities = {}
+    neighbour_table = get_neighbour_table(catalog) if neighbours and pending else None
+    ann_index = get_ann_index(catalog) if ann_top_k and pending and neighbour_table is None else None
+    features = get_recipe_features(catalog) if pending else None
+    if neighbour_table is not None or ann_index is not None:
+        for position, (rows, _, _, _, liked_rows, disliked_rows) in pending:
+            start = time.perf_counter()
+            try:
+                if neighbour_table is not None:
+                    similarities[position] = neighbour_table.score_candidates(rows, liked_rows, disliked_rows)
+                else:
+                    profile = profile_vector(features, liked_rows, payloads[position].get('Profile'))
+                    positions, scores = ann_index.search(profile, rows, ann_top_k, ann_radius, ann_tables)
+                    # candidații nescorați urmează, în ordinea potrivirilor cu produsele care expiră
+                    similarity = np.full(len(rows), -np.inf, dtype=np.float32)
+                    similarity[positions] = scores
+                    similarities[position] = similarity
+            except Exception as e:
+                results[position] = e
+                del prepared[position]
+            observe('stage_seconds', time.perf_counter() - start, stage='similarity')
+    elif pending:
+        start = time.perf_counter()
+        profiles = [profile_vector(features, request[4], payloads[position].get('Profile')) for position, request in pending]
+        scores = score_batch(features, [request[0] for _, request in pending], profiles)
+        similarities.update(zip([position for position, _ in pending], scores))
+        # produsul matrice-matrice e comun lotului: fiecare cerere primește partea ei egală
+        shared_seconds = (time.perf_counter() - start) / len(pending)
+        for _ in pending:
+            observe('stage_seconds', shared_seconds, stage='similarity')
+
+    for position, (rows, match_count, priority, n_products, _, _) in prepared.items():
+        with timed_stage('rank'):
+            combined = combined_scores(similarities.get(position), match_count, n_products,
+                                       similarity_weight, expiring_weight)
+            payload = payloads[position]
+            if not payload.get('Limit'):
+                results[position] = catalog.ids[rows[fused_order(combined, match_count, priority, top_k)]].tolist()
+                continue
+            offset = continuation_offset(payload, catalog.version)
+            end = offset + int(payload['Limit'])
+            # primele `end` poziții ale aceleiași ordini ca fused_order fără k
+            recipe_ids = catalog.ids[rows[fused_order(combined, match_count, priority, end)[offset:]]].tolist()
+            end = offset + len(recipe_ids)
+            results[position] = {
+                'recipe_ids': recipe_ids,
+                'Offset': offset,
+                'Total': len(rows),
+                'Continuation': continuation_token(payload, end, catalog.version) if end < len(rows) else None,
+            }
+    return results
+
+async def report_stats(cache, batcher, stop_event, interval=REPORT_INTERVAL):
+    while not stop_event.is_set():
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+        print(f"Result cache: {cache.stats()}")
+        print(f"Micro-batches: {batcher.stats()}")
+
+async def push_stats(client, stop_event, interval):
+    """
+    Trimite periodic metricile pe WebSocket, ca mesaj de tip 'stats'.
+    """
+    while not stop_event.is_set():
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            await client.send({"type": "stats", "payload": REGISTRY.snapshot()})
+
+async def serve(ws_url, runner, max_in_flight, cache_size, cache_ttl, batch_size, batch_wait,
+                metrics_port=METRICS_PORT, stats_interval=0, profiles_path=PROFILES_PATH, max_queued=MAX_QUEUED,
+                queue_deadline=QUEUE_DEADLINE, redis_url=None, consumer=None, result_sink=None,
+                result_key_prefix='', result_varint=False):
+    """
+    Rulează clientul WebSocket (sau, cu redis_url, clientul pentru stream-urile Redis) până la SIGINT/SIGTERM.
+    """
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    # Cererile care sosesc aproape simultan sunt calculate într-un singur lot
+    batcher = MicroBatcher(runner.submit, max_size=batch_size, max_wait=batch_wait)
+    # Cererile cu același payload (fără email) sunt servite din cache sau așteaptă calculul deja pornit
+    cache = ResultCache(batcher.submit, max_size=cache_size, ttl=cache_ttl)
+    # Cererile care poartă doar versiunea profilului sunt completate din profilurile stocate,
+    # actualizate de mesajele 'rating'
+    profiles = ProfileStore(profiles_path)
+
+    async def compute(payload):
+        return await cache.get(await profiles.run(profiles.resolve, payload))
+
+    handlers = {'rating': lambda payload: profiles.run(profiles.apply_rating, payload)}
+    sink = None
+    if result_sink:
+        # importat doar aici: redis e necesar numai pentru acest mod
+        from result_sink import CacheResultSink
+        sink = CacheResultSink(result_sink, key_prefix=result_key_prefix, varint=result_varint)
+    if redis_url:
+        # importat doar aici: redis e necesar numai pentru acest transport
+        from stream_client import StreamClient
+        client = StreamClient(redis_url, compute, max_in_flight=max_in_flight, handlers=handlers,
+                              max_queued=max_queued, queue_deadline=queue_deadline, consumer=consumer, sink=sink)
+    else:
+        client = RecommendationClient(ws_url, compute, max_in_flight=max_in_flight,
+                                      handlers=handlers,
+                                      max_queued=max_queued, queue_deadline=queue_deadline, sink=sink,
+                                      worker_id=consumer)
+
+    REGISTRY.register_collector('client', client.stats, counters=CLIENT_STATS_COUNTERS)
+    REGISTRY.register_collector('result_cache', cache.stats, counters=CACHE_STATS_COUNTERS)
+    REGISTRY.register_collector('batch', batcher.stats, counters=BATCH_STATS_COUNTERS)
+    metrics_server = None
+    if metrics_port:
+        metrics_server = await serve_metrics(port=metrics_port)
+        print(f"Metrics available at http://127.0.0.1:{metrics_port}/metrics")
+    tasks = [asyncio.create_task(report_stats(cache, batcher, stop_event))]
+    if stats_interval:
+        tasks.append(asyncio.create_task(push_stats(client, stop_event, stats_interval)))
+
+    await client.run(stop_event)
+    await asyncio.gather(*tasks)
+    if metrics_server is not None:
+        metrics_server.close()
+        await metrics_server.wait_closed()
+    if sink is not None:
+        await sink.close()
+    profiles.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ZeroWaste recipe recommendation worker.')
+    parser.add_argument('--mode', choices=RequestRunner.MODES, default='thread',
+                        help="'process' runs the recommendations in a pool of worker processes")
+    parser.add_argument('--workers', type=int, default=5, help='number of worker threads or processes')
+    parser.add_argument('--max-in-flight', type=int, default=MAX_IN_FLIGHT,
+                        help='requests computed concurrently; the others wait in the request queue')
+    parser.add_argument('--max-queued', type=int, default=MAX_QUEUED,
+                        help='requests waiting in the queue before the oldest lowest-priority one is shed')
+    parser.add_argument('--queue-deadline', type=float, default=QUEUE_DEADLINE,
+                        help='seconds a queued request stays worth computing before it is shed')
+    parser.add_argument('--url', default="ws://localhost:8000/ws/python-script/")
+    parser.add_argument('--redis-url', default=None,
+                        help="read jobs from the backend's Redis streams instead of the websocket "
+                             "(AI_TRANSPORT = 'redis_stream'), e.g. redis://localhost:6379/3")
+    parser.add_argument('--result-sink', default=None,
+                        help="write results straight into the backend's Redis cache (CACHES['default']), "
+                             "e.g. redis://localhost:6379/2; run `manage.py listen_recipe_results` in the backend")
+    parser.add_argument('--result-key-prefix', default='', help="the backend cache's KEY_PREFIX")
+    parser.add_argument('--result-varint', action='store_true',
+                        help='write the ids in the smaller delta+varint form instead of packed uint32 '
+                             '(as RANKED_IDS_VARINT in the backend settings)')
+    parser.add_argument('--consumer-name', default=None,
+                        help='name of this worker (default: host-pid): its consumer name in the jobs stream group, '
+                             'or the id it sends when connecting to the websocket, which keeps the same users on '
+                             'it across reconnects; keep it across restarts to resume the jobs taken before the restart')
+    parser.add_argument('--cache-size', type=int, default=RESULT_CACHE_SIZE,
+                        help='results kept for repeated payloads (0 disables the cache, duplicates are still coalesced)')
+    parser.add_argument('--cache-ttl', type=float, default=RESULT_CACHE_TTL, help='seconds a cached result stays valid')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help='requests scored together in one matrix-matrix product (1 disables batching)')
+    parser.add_argument('--batch-wait-ms', type=float, default=BATCH_WAIT * 1000,
+                        help='longest a request waits for its batch to fill')
+    parser.add_argument('--ann-top-k', type=int, default=0,
+                        help='rank only the top K recipes, through the approximate (LSH) index (0 = exact ranking)')
+    parser.add_argument('--ann-radius', type=int, default=ANN_RADIUS,
+                        help='LSH buckets visited per table: bit flips around the profile code (higher = better recall, slower)')
+    parser.add_argument('--ann-tables', type=int, default=ANN_TABLES, help='LSH tables queried (at most the tables built)')
+    parser.add_argument('--neighbours', action='store_true',
+                        help=f'score from the precomputed top-{NEIGHBOURS} neighbours of the liked and disliked recipes '
+                             '(faster, approximate: similarities outside the table count as 0)')
+    parser.add_argument('--similarity-weight', type=float, default=SIMILARITY_WEIGHT,
+                        help='weight of the similarity to the liked recipes in the combined score')
+    parser.add_argument('--expiring-weight', type=float, default=EXPIRING_WEIGHT,
+                        help='weight of the share of expiring products a recipe uses (0 = only breaks similarity ties)')
+    parser.add_argument('--top-k', type=int, default=0, help='return only the K best recipes (0 = all candidates)')
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                        help='localhost port for the Prometheus /metrics endpoint (0 disables it)')
+    parser.add_argument('--stats-interval', type=float, default=0,
+                        help="seconds between 'stats' messages sent over the websocket (0 disables them)")
+    parser.add_argument('--profiles', default=PROFILES_PATH,
+                        help='SQLite file with the user profile vectors, updated on every rating change')
+    args = parser.parse_args(argv)
+    if args.neighbours and args.ann_top_k:
+        parser.error('--neighbours and --ann-top-k are alternative scorers')
+
+    # Catalogul compilat este mapat în memorie, deci e împărțit între procesele worker
+    ensure_compiled_catalog(ann_tables=ANN_TABLES if args.ann_top_k else 0,
+                            neighbours=NEIGHBOURS if args.neighbours else 0)
+    # Încărcăm catalogul o singură dată, înainte de a primi cereri
+    warm_up()
+    compute = functools.partial(compute_recipe_ids_batch, neighbours=args.neighbours,
+                                similarity_weight=args.similarity_weight, expiring_weight=args.expiring_weight,
+                                top_k=args.top_k or None)
+    if args.ann_top_k:
+        compute = functools.partial(compute, ann_top_k=args.ann_top_k,
+                                    ann_radius=args.ann_radius, ann_tables=args.ann_tables)
+    runner = RequestRunner(compute, args.mode, args.workers)
+    print(f"Serving recommendations with {args.workers} {args.mode} workers, "
+          f"batches of up to {args.batch_size} requests or {args.batch_wait_ms:g} ms.")
+    try:
+        asyncio.run(serve(args.url, runner, args.max_in_flight, args.cache_size, args.cache_ttl,
+                          args.batch_size, args.batch_wait_ms / 1000, args.metrics_port, args.stats_interval,
+                          args.profiles, args.max_queued, args.queue_deadline, args.redis_url, args.consumer_name,
+                          args.result_sink, args.result_key_prefix, args.result_varint))
+    finally:
+        runner.shutdown()
     print("All workers stopped. Program exiting.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
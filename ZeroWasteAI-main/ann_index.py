@@ -0,0 +1,156 @@
+from itertools import combinations
+
+import numpy as np
+
+from features import get_recipe_features
+from scorer import score_candidates, top_k as select_top_k
+
+ANN_TABLES = 8
+# raza implicită a căutării: câți biți pot diferi între codul profilului și codul unei găleți vizitate
+ANN_RADIUS = 1
+ANN_SEED = 0
+# rândurile sunt codificate pe bucăți, ca proiecțiile să nu ocupe n_rows x tabele x biți deodată
+BUILD_CHUNK_ROWS = 65536
+
+
+def default_bits(n_rows):
+    """
+    Numărul de biți per tabel: în medie ~64 de rețete per găleată, între 6 și 24 de biți.
+    Profilurile (medii ale mai multor rețete) au similarități mici cu orice rețetă, deci
+    gălețile prea fine scad mult recall-ul (vezi benchmarks/bench_ann.py).
+    """
+    return int(np.clip(np.round(np.log2(max(n_rows, 1) / 64)), 6, 24))
+
+
+def _probe_masks(n_bits, radius):
+    masks = [0]
+    for distance in range(1, radius + 1):
+        for bits in combinations(range(n_bits), distance):
+            masks.append(sum(1 << bit for bit in bits))
+    return np.array(masks, dtype=np.uint32)
+
+
+def _gather_ranges(rows, starts, lengths):
+    """
+    Concatenarea intervalelor rows[start:start + length] (cu eventuale duplicate).
+    """
+    total = int(lengths.sum())
+    if not total:
+        return np.zeros(0, dtype=np.int64)
+    positions = np.arange(total, dtype=np.int64) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return rows[positions].astype(np.int64)
+
+
+def _codes(planes, vectors):
+    """
+    Codul LSH al fiecărui vector în fiecare tabel: bitul b = semnul proiecției pe hiperplanul b.
+    planes are forma (tabele, biți, trăsături); rezultatul are forma (tabele, vectori).
+    """
+    n_tables, n_bits, _ = planes.shape
+    projections = vectors @ planes.reshape(n_tables * n_bits, -1).T
+    bits = (np.asarray(projections).reshape(-1, n_tables, n_bits) > 0).astype(np.uint32)
+    weights = (np.uint32(1) << np.arange(n_bits, dtype=np.uint32))
+    return (bits * weights).sum(axis=2, dtype=np.uint32).T
+
+
+def build_lsh(matrix, n_tables=ANN_TABLES, n_bits=None, seed=ANN_SEED):
+    """
+    Construiește (offline, vezi compile_catalog.py) indexul LSH cu hiperplane aleatoare peste
+    rândurile matricei de trăsături. Returnează coloanele stocate în catalog: hiperplanele și,
+    pentru fiecare tabel, codurile sortate împreună cu rândurile corespunzătoare.
+    """
+    n_bits = n_bits or default_bits(matrix.shape[0])
+    planes = np.random.default_rng(seed).standard_normal((n_tables, n_bits, matrix.shape[1])).astype(np.float32)
+    codes = np.hstack([_codes(planes, matrix[start:start + BUILD_CHUNK_ROWS])
+                       for start in range(0, matrix.shape[0], BUILD_CHUNK_ROWS)] or [np.zeros((n_tables, 0), np.uint32)])
+    order = np.argsort(codes, axis=1, kind='stable')
+    return {
+        'ann_planes': planes,
+        'ann_codes': np.take_along_axis(codes, order, axis=1),
+        'ann_rows': order.astype(np.int32),
+    }
+
+
+class LSHIndex:
+    """
+    Index aproximativ pentru cele mai similare rețete cu profilul unui utilizator: LSH cu
+    hiperplane aleatoare (SimHash), construit offline și păstrat în catalogul compilat.
+
+    La căutare, profilul e codificat în fiecare tabel, iar rândurile din gălețile aflate la cel
+    mult `radius` biți distanță de codul lui devin candidați; doar ei sunt scorați exact.
+    radius (și numărul de tabele folosite) e compromisul recall/latență: radius 0 vizitează o
+    singură găleată per tabel, radius 2 vizitează 1 + b + b(b-1)/2 găleți.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.features = get_recipe_features(catalog)
+        self.planes = catalog.ann_planes
+        self.codes = catalog.ann_codes
+        self.rows = catalog.ann_rows
+        self.n_tables, self.n_bits, _ = self.planes.shape
+        self._masks = {}
+
+    def probe_masks(self, radius):
+        masks = self._masks.get(radius)
+        if masks is None:
+            masks = self._masks[radius] = _probe_masks(self.n_bits, radius)
+        return masks
+
+    def nearby_rows(self, profile, radius=ANN_RADIUS, n_tables=None):
+        """
+        Rândurile (sortate, fără duplicate) din gălețile vizitate pentru profil.
+        """
+        return np.unique(self._probed_rows(profile, radius, n_tables))
+
+    def _probed_rows(self, profile, radius, n_tables):
+        n_tables = min(n_tables or self.n_tables, self.n_tables)
+        codes = _codes(self.planes[:n_tables], profile[np.newaxis, :])[:, 0]
+        probes = codes[:, np.newaxis] ^ self.probe_masks(radius)
+        # intervalele gălețile vizitate în fiecare tabel, ca poziții în rows aplatizat
+        n_rows = self.codes.shape[1]
+        starts = np.concatenate([np.searchsorted(self.codes[table], probes[table], side='left') + table * n_rows
+                                 for table in range(n_tables)])
+        ends = np.concatenate([np.searchsorted(self.codes[table], probes[table], side='right') + table * n_rows
+                               for table in range(n_tables)])
+        return _gather_ranges(self.rows.ravel(), starts, ends - starts)
+
+    def _probed_positions(self, profile, candidate_rows, radius, n_tables):
+        """
+        Pozițiile (crescătoare) din candidate_rows ale rândurilor din gălețile vizitate. Căutăm
+        rândurile vizitate (un rând apare în mai multe tabele, np.unique elimină duplicatele) în
+        candidații sortați, fără un tablou de mărimea catalogului per cerere.
+        """
+        probed = np.unique(self._probed_rows(profile, radius, n_tables))
+        if not len(candidate_rows) or not len(probed):
+            return np.zeros(0, dtype=np.int64)
+        # filter_candidates dă rândurile deja sortate
+        order = None if np.all(candidate_rows[1:] >= candidate_rows[:-1]) else np.argsort(candidate_rows, kind='stable')
+        sorted_rows = candidate_rows if order is None else candidate_rows[order]
+        found = np.minimum(np.searchsorted(sorted_rows, probed), len(sorted_rows) - 1)
+        found = found[sorted_rows[found] == probed]
+        return found if order is None else np.sort(order[found])
+
+    def search(self, profile, candidate_rows, k, radius=ANN_RADIUS, n_tables=None):
+        """
+        Cele mai similare (aproximativ) k rânduri dintre candidate_rows, cu scorurile lor exacte.
+        Dacă gălețile vizitate au mai puțin de k candidați, scorăm toți candidații, deci
+        rezultatul are mereu min(k, len(candidate_rows)) rânduri.
+        Returnează (poziții în candidate_rows, scoruri), în ordinea descrescătoare a scorului.
+        """
+        candidate_rows = np.asarray(candidate_rows, dtype=np.int64)
+        positions = self._probed_positions(profile, candidate_rows, radius, n_tables)
+        if len(positions) < k:
+            positions = np.arange(len(candidate_rows))
+        scores = score_candidates(self.features, candidate_rows[positions], profile)
+        order = select_top_k(scores, k)
+        return positions[order], scores[order]
+
+
+def get_ann_index(catalog):
+    """
+    Indexul ANN al catalogului, sau None dacă nu a fost construit (compile_catalog.py --ann-tables).
+    """
+    if catalog.ann_planes is None:
+        return None
+    return catalog.derived('ann_index', LSHIndex)
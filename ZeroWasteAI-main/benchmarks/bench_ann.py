@@ -0,0 +1,74 @@
+"""
+Recall@K și latența indexului ANN (ann_index.py) față de scorarea exactă din scorer.py,
+pe cataloage sintetice (vezi bench_pipeline.synthetic_frame). Pentru fiecare combinație
+(tabele interogate, rază) raportează recall@K mediu, latența p50/p99 a căutării și câți
+candidați au fost scorați exact, în medie.
+
+Rulare (din ZeroWasteAI-main):
+    python -m benchmarks.bench_ann [--sizes 10000 100000 1000000] [--k 10 50] [--tables 2 4 8] [--radius 0 1 2]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from ann_index import LSHIndex, build_lsh
+from benchmarks.bench_pipeline import synthetic_frame
+from catalog import CATALOG_PATH, CATALOG_SHEET, RecipeCatalog
+from features import get_recipe_features
+from scorer import score_candidates, top_k, user_profile
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--k', type=int, nargs='+', default=[10, 50])
+    parser.add_argument('--tables', type=int, nargs='+', default=[2, 4, 8])
+    parser.add_argument('--radius', type=int, nargs='+', default=[0, 1, 2])
+    parser.add_argument('--bits', type=int, help='hyperplanes per table (default: ann_index.default_bits)')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    source_df = pd.read_excel(CATALOG_PATH, sheet_name=CATALOG_SHEET)
+
+    print(f"{'recipes':>8} {'k':>4} {'tables':>6} {'radius':>6} {'recall@k':>9} {'ann p50 ms':>10} {'ann p99 ms':>10} "
+          f"{'exact p50 ms':>12} {'scored':>8}")
+    for size in args.sizes:
+        catalog = RecipeCatalog.from_frame(synthetic_frame(source_df, size, rng), f'bench-{size}')
+        features = get_recipe_features(catalog)
+        start = time.perf_counter()
+        for name, array in build_lsh(features.matrix, max(args.tables), args.bits).items():
+            setattr(catalog, name, array)
+        print(f"Built LSH index for {size} recipes in {time.perf_counter() - start:.1f}s.")
+        index = LSHIndex(catalog)
+
+        candidate_rows = np.arange(size)
+        profiles = [user_profile(features, rng.choice(size, size=rng.integers(1, 50), replace=False))
+                    for _ in range(args.users)]
+        for k in args.k:
+            exact = []
+            exact_times = []
+            for profile in profiles:
+                start = time.perf_counter()
+                exact.append(set(top_k(score_candidates(features, candidate_rows, profile), k).tolist()))
+                exact_times.append(time.perf_counter() - start)
+
+            for n_tables in args.tables:
+                for radius in args.radius:
+                    recalls, times, scored = [], [], []
+                    for profile, expected in zip(profiles, exact):
+                        start = time.perf_counter()
+                        positions, _ = index.search(profile, candidate_rows, k, radius, n_tables)
+                        times.append(time.perf_counter() - start)
+                        recalls.append(len(expected & set(positions.tolist())) / k)
+                        scored.append(len(index.nearby_rows(profile, radius, n_tables)))
+                    print(f"{size:>8} {k:>4} {n_tables:>6} {radius:>6} {np.mean(recalls):>9.3f} "
+                          f"{np.percentile(times, 50) * 1000:>10.2f} {np.percentile(times, 99) * 1000:>10.2f} "
+                          f"{np.percentile(exact_times, 50) * 1000:>12.2f} {np.mean(scored):>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Compară potrivirea produselor care expiră: implementarea inițială (două lambda-uri per rețetă)
+față de cele două variante din expiring.py (căutarea vectorizată per tipar și automatul
+Aho-Corasick). ExpiringMatcher.match alege între ele după numărul de tipare; coloana
+„match” folosește automatul din cache. Coloanele „index” măsoară indexul inversat din
+ingredient_index.py (cold = prima cerere cu aceste produse, warm = produse deja rezolvate).
+
+Rulare (din ZeroWasteAI-main):
+    python -m benchmarks.bench_expiring [--sizes 870 10000 100000] [--products 1 5 30]
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+import pandas as pd
+
+from catalog import CATALOG_PATH, CATALOG_SHEET, RecipeCatalog
+from expiring import ExpiringMatcher, get_expiring_matcher
+from ingredient_index import IngredientIndex
+
+
+def legacy_match(ingredients, expiring_products):
+    # Codul inițial din use_expiring_ingredients, păstrat ca referință
+    expiring_products = [product.lower() for product in expiring_products]
+
+    def count_matches_excluding(ingredients, expiring_products):
+        ingredients_lower = ingredients.lower()
+        count = 0
+        for product in expiring_products:
+            if product in ingredients_lower and f'mini {product}' not in ingredients_lower:
+                count += 1
+        return count
+
+    def highest_priority_match_excluding(ingredients, expiring_products):
+        ingredients_lower = ingredients.lower()
+        for idx, product in enumerate(expiring_products):
+            if product in ingredients_lower and f'mini {product}' not in ingredients_lower:
+                return idx
+        return len(expiring_products)
+
+    counts = [count_matches_excluding(text, expiring_products) for text in ingredients]
+    priorities = [highest_priority_match_excluding(text, expiring_products) for text in ingredients]
+    return np.array(counts), np.array(priorities)
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[870, 10000, 100000])
+    parser.add_argument('--products', type=int, nargs='+', default=[1, 5, 30])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    source_df = pd.read_excel(CATALOG_PATH, sheet_name=CATALOG_SHEET)
+    source = source_df['Ingredients'].astype(str).tolist()
+    vocabulary = sorted({word.strip() for text in source for word in text.lower().split(',') if word.strip()})
+
+    print(f"{'recipes':>8} {'products':>8} {'legacy ms':>10} {'scan ms':>8} {'automaton ms':>13} {'match ms':>9} "
+          f"{'index cold':>11} {'index warm':>11}")
+    for size in args.sizes:
+        frame = source_df.iloc[np.arange(size) % len(source_df)].assign(id=np.arange(1, size + 1))
+        catalog = RecipeCatalog.from_frame(frame, 'bench')
+        ingredients = frame['Ingredients'].astype(str).tolist()
+        texts = catalog.ingredients_lower
+        rows = np.arange(size)
+        for n_products in args.products:
+            products = random.sample(vocabulary, n_products)
+            legacy_time, expected = best_of(lambda: legacy_match(ingredients, products), args.repeat)
+            matcher = ExpiringMatcher(products)
+            scan_time, scanned = best_of(lambda: matcher.scan_patterns(texts, rows), args.repeat)
+            automaton_time, automaton = best_of(lambda: matcher.found_patterns(texts, rows), args.repeat)
+            match_time, result = best_of(lambda: get_expiring_matcher(products).match(texts, rows), args.repeat)
+            cold_time, indexed = best_of(lambda: IngredientIndex(catalog).dense_match(products, rows), args.repeat)
+            index = IngredientIndex(catalog)
+            index.match(products)
+            warm_time, _ = best_of(lambda: index.match(products), args.repeat)
+            assert np.array_equal(scanned, automaton), 'scan and automaton differ'
+            assert all(np.array_equal(a, b) for a, b in zip(expected, result)), 'results differ from legacy'
+            assert all(np.array_equal(a, b) for a, b in zip(expected, indexed)), 'index differs from legacy'
+            print(f"{size:>8} {n_products:>8} {legacy_time * 1000:>10.1f} {scan_time * 1000:>8.1f} "
+                  f"{automaton_time * 1000:>13.1f} {match_time * 1000:>9.1f} "
+                  f"{cold_time * 1000:>11.1f} {warm_time * 1000:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Tabelul vecinilor (neighbours.py) față de scorarea exactă din scorer.py, pe cataloage sintetice
+(vezi bench_pipeline.synthetic_frame). Pentru fiecare M raportează timpul de construcție,
+mărimea tabelului, recall@K mediu (doar like-uri, ca scorurile exacte să fie comparabile) și
+latența p50/p99 a scorării tuturor candidaților.
+
+Rulare (din ZeroWasteAI-main):
+    python -m benchmarks.bench_neighbours [--sizes 10000 100000] [--m 20 50 100] [--k 10 50] [--likes 5]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_pipeline import synthetic_frame
+from catalog import CATALOG_PATH, CATALOG_SHEET, RecipeCatalog
+from features import get_recipe_features
+from neighbours import NeighbourTable, build_neighbours
+from scorer import score_candidates, top_k, user_profile
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--m', type=int, nargs='+', default=[20, 50, 100])
+    parser.add_argument('--k', type=int, nargs='+', default=[10, 50])
+    parser.add_argument('--likes', type=int, default=5, help='liked recipes per synthetic user')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    source_df = pd.read_excel(CATALOG_PATH, sheet_name=CATALOG_SHEET)
+
+    print(f"{'recipes':>8} {'m':>4} {'build s':>8} {'table MiB':>9} {'k':>4} {'recall@k':>9} "
+          f"{'nbr p50 ms':>10} {'nbr p99 ms':>10} {'exact p50 ms':>12}")
+    for size in args.sizes:
+        catalog = RecipeCatalog.from_frame(synthetic_frame(source_df, size, rng), f'bench-{size}')
+        features = get_recipe_features(catalog)
+        candidate_rows = np.arange(size)
+        users = [rng.choice(size, size=args.likes, replace=False) for _ in range(args.users)]
+
+        exact_scores, exact_times = [], []
+        for liked in users:
+            start = time.perf_counter()
+            exact_scores.append(score_candidates(features, candidate_rows, user_profile(features, liked)))
+            exact_times.append(time.perf_counter() - start)
+
+        for m in args.m:
+            start = time.perf_counter()
+            table = build_neighbours(features.matrix, m)
+            build_seconds = time.perf_counter() - start
+            for name, array in table.items():
+                setattr(catalog, name, array)
+            neighbour_table = NeighbourTable(catalog)
+            size_mib = sum(array.nbytes for array in table.values()) / 2 ** 20
+
+            scores, times = [], []
+            for liked in users:
+                start = time.perf_counter()
+                scores.append(neighbour_table.score_candidates(candidate_rows, liked))
+                times.append(time.perf_counter() - start)
+            for k in args.k:
+                recall = np.mean([len(set(top_k(exact, k).tolist()) & set(top_k(approx, k).tolist())) / k
+                                  for exact, approx in zip(exact_scores, scores)])
+                print(f"{size:>8} {m:>4} {build_seconds:>8.1f} {size_mib:>9.1f} {k:>4} {recall:>9.3f} "
+                      f"{np.percentile(times, 50) * 1000:>10.2f} {np.percentile(times, 99) * 1000:>10.2f} "
+                      f"{np.percentile(exact_times, 50) * 1000:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
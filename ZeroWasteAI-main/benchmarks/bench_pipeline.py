@@ -0,0 +1,269 @@
+"""
+Benchmark pentru etapele din Main.py (filter_recepies, use_expiring_ingredients,
+recomendations și serializarea răspunsului), rulat pe cataloage și utilizatori sintetici,
+fără backend. Pentru fiecare combinație (mărime catalog, număr de like-uri, produse care
+expiră) raportează percentilele latenței pe etape, debitul (cereri servite una câte una și în
+loturi, ca în micro_batch.py), vârful de memorie alocată per etapă (tracemalloc, pe o cerere)
+și vârful RSS al procesului. Rezultatele sunt salvate ca JSON; cu --baseline sunt comparate
+cu o rulare anterioară.
+
+Cataloagele sintetice amestecă segmentele de ingrediente reale (distribuția lor de
+frecvență e păstrată), iar flag-urile, dificultatea, timpul și tipul sunt eșantionate din foaia AI.
+
+Rulare (din ZeroWasteAI-main):
+    python -m benchmarks.bench_pipeline [--sizes 1000 10000 100000 1000000] [--likes 0 10 100 1000]
+                                        [--expiring 0 5 30] [--users 50] [--output results.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import Main
+from bitset_index import get_bitset_index
+from catalog import ALLERGEN_COLUMNS, CATALOG_PATH, CATALOG_SHEET, PREFERENCE_COLUMNS, RecipeCatalog, ingredient_segments
+from features import get_recipe_features
+from ingredient_index import get_ingredient_index
+
+STAGES = ('filter', 'expiring', 'recommend', 'serialize')
+PERCENTILES = (50, 90, 99)
+
+
+def synthetic_frame(source_df, size, rng):
+    """
+    O foaie AI sintetică cu size rețete, construită din segmentele de ingrediente ale foii reale.
+    """
+    segments = [segment.strip() for text in source_df['Ingredients'].astype(str)
+                for segment in ingredient_segments(text) if segment.strip()]
+    segment_counts = source_df['Ingredients'].astype(str).map(lambda text: len(ingredient_segments(text)))
+    lengths = rng.choice(segment_counts.to_numpy(), size=size)
+    picks = rng.integers(0, len(segments), size=int(lengths.sum()))
+    bounds = np.concatenate([[0], np.cumsum(lengths)])
+    ingredients = [', '.join(segments[i] for i in picks[bounds[row]:bounds[row + 1]]) for row in range(size)]
+
+    frame = {
+        'id': np.arange(1, size + 1),
+        'Name': [f'Recipe {row}' for row in range(1, size + 1)],
+        'Link': '',
+        'Ingredients': ingredients,
+    }
+    for column in ('Difficulty', 'Total time', 'Type'):
+        frame[column] = rng.choice(source_df[column].to_numpy(), size=size)
+    for column in [col for col in ALLERGEN_COLUMNS + PREFERENCE_COLUMNS if col in source_df.columns]:
+        frame[column] = (rng.random(size) < source_df[column].astype(float).mean()).astype(int)
+    return pd.DataFrame(frame)
+
+
+def synthetic_users(catalog, n_users, n_likes, n_expiring, rng):
+    ids = catalog.ids
+    vocabulary = catalog.segment_vocabulary.tolist()
+    users = []
+    for user in range(n_users):
+        users.append({
+            'email': f'user{user}@bench',
+            'Allergens': rng.choice(catalog.allergen_columns, size=rng.integers(0, 3), replace=False).tolist(),
+            'Preferences': rng.choice(catalog.preference_columns, size=rng.integers(0, 2), replace=False).tolist(),
+            'Difficulty': rng.choice([1, 2, 3], size=rng.integers(0, 3), replace=False).tolist(),
+            'Time': [None, 1, 2, 3, 4][rng.integers(0, 5)],
+            'Type': None,
+            'Liked Recipes': rng.choice(ids, size=min(n_likes, len(ids)), replace=False).tolist(),
+            'Disliked Recipes': rng.choice(ids, size=min(n_likes // 4, len(ids)), replace=False).tolist(),
+            'Expiring Products': [vocabulary[i].strip() for i in rng.integers(0, len(vocabulary), size=n_expiring)],
+        })
+    return users
+
+
+def run_stages(payload):
+    """
+    O cerere, etapă cu etapă, ca Main.compute_recipe_ids; returnează durata fiecărei etape.
+    """
+    timings = {}
+    start = time.perf_counter()
+    recipes = Main.filter_recepies(payload['Allergens'], payload['Preferences'], payload['Type'],
+                                   payload['Difficulty'], payload['Time'])
+    timings['filter'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if payload['Expiring Products']:
+        recipes = Main.use_expiring_ingredients(recipes, payload['Expiring Products'])
+    timings['expiring'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if payload['Liked Recipes']:
+        recipes = Main.recomendations(recipes, payload['Liked Recipes'], payload['Disliked Recipes'])
+    timings['recommend'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    json.dumps({"type": "run", "payload": {"recipe_ids": recipes["id"].tolist(), "email": payload['email']}})
+    timings['serialize'] = time.perf_counter() - start
+    return timings
+
+
+def stage_peak_memory(payload):
+    """
+    Vârful memoriei alocate (tracemalloc) de fiecare etapă, pentru o singură cerere.
+    """
+    peaks = {}
+    stages = {
+        'filter': lambda state: Main.filter_recepies(payload['Allergens'], payload['Preferences'], payload['Type'],
+                                                     payload['Difficulty'], payload['Time']),
+        'expiring': lambda state: Main.use_expiring_ingredients(state, payload['Expiring Products'])
+        if payload['Expiring Products'] else state,
+        'recommend': lambda state: Main.recomendations(state, payload['Liked Recipes'], payload['Disliked Recipes'])
+        if payload['Liked Recipes'] else state,
+        'serialize': lambda state: json.dumps({"type": "run", "payload": {"recipe_ids": state["id"].tolist()}}),
+    }
+    state = None
+    tracemalloc.start()
+    try:
+        for stage in STAGES:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            result = stages[stage](state)
+            peaks[stage] = tracemalloc.get_traced_memory()[1] - baseline
+            if stage != 'serialize':
+                state = result
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def summarize(samples):
+    samples_ms = np.asarray(samples) * 1000
+    summary = {f'p{q}_ms': float(np.percentile(samples_ms, q)) for q in PERCENTILES}
+    summary['mean_ms'] = float(samples_ms.mean())
+    summary['max_ms'] = float(samples_ms.max())
+    return summary
+
+
+def peak_rss_mb():
+    # ru_maxrss e în KiB pe Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def bench_config(catalog, users, batch_size):
+    # recomendations anunță pe stdout utilizatorii fără like-uri valide; nu le amestecăm cu tabelul
+    with contextlib.redirect_stdout(io.StringIO()):
+        return _bench_config(catalog, users, batch_size)
+
+
+def _bench_config(catalog, users, batch_size):
+    samples = {stage: [] for stage in STAGES + ('total',)}
+    for payload in users:
+        timings = run_stages(payload)
+        for stage, seconds in timings.items():
+            samples[stage].append(seconds)
+        samples['total'].append(sum(timings.values()))
+
+    start = time.perf_counter()
+    for first in range(0, len(users), batch_size):
+        Main.compute_recipe_ids_batch(users[first:first + batch_size])
+    batched_seconds = time.perf_counter() - start
+
+    return {
+        'latency': {stage: summarize(values) for stage, values in samples.items()},
+        'throughput_rps': len(users) / sum(samples['total']),
+        'batched_throughput_rps': len(users) / batched_seconds,
+        'candidates_median': int(np.median([len(Main.filter_candidates(
+            payload['Allergens'], payload['Preferences'], payload['Type'], payload['Difficulty'], payload['Time']))
+            for payload in users])),
+        'stage_peak_bytes': stage_peak_memory(users[0]),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {(r['recipes'], r['likes'], r['expiring']): r for r in json.load(f)['results']}
+    print(f"\nCompared with {baseline_path} (p50 total, new / old):")
+    for result in results:
+        old = baseline.get((result['recipes'], result['likes'], result['expiring']))
+        if old is None:
+            continue
+        new_p50 = result['latency']['total']['p50_ms']
+        old_p50 = old['latency']['total']['p50_ms']
+        print(f"  {result['recipes']:>8} recipes {result['likes']:>5} likes {result['expiring']:>3} expiring: "
+              f"{old_p50:8.2f} ms -> {new_p50:8.2f} ms ({new_p50 / old_p50:.2f}x)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--likes', type=int, nargs='+', default=[0, 10, 100, 1000])
+    parser.add_argument('--expiring', type=int, nargs='+', default=[0, 5, 30])
+    parser.add_argument('--users', type=int, default=50, help='synthetic users per configuration')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON file for the results (default: benchmarks/results/pipeline-<commit>.json)')
+    parser.add_argument('--baseline', help='earlier results JSON to compare against')
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    source_df = pd.read_excel(CATALOG_PATH, sheet_name=CATALOG_SHEET)
+    commit = git_commit()
+    results = []
+
+    print(f"{'recipes':>8} {'likes':>5} {'expiring':>8} {'filter p50':>10} {'expiring p50':>12} {'recommend p50':>13} "
+          f"{'total p50':>9} {'total p99':>9} {'req/s':>7} {'batched':>8} {'rss MB':>7}")
+    for size in args.sizes:
+        start = time.perf_counter()
+        catalog = RecipeCatalog.from_frame(synthetic_frame(source_df, size, rng), f'bench-{size}')
+        build_seconds = time.perf_counter() - start
+        # etapele din Main.py folosesc catalogul sintetic în locul celui rezident
+        Main.get_catalog = lambda catalog=catalog: catalog
+        # structurile derivate (bitset-uri, trăsături, index) sunt construite înainte de măsurători
+        get_bitset_index(catalog)
+        get_recipe_features(catalog)
+        get_ingredient_index(catalog)
+        catalog.df
+
+        for n_likes in args.likes:
+            for n_expiring in args.expiring:
+                users = synthetic_users(catalog, args.users, n_likes, n_expiring, rng)
+                result = {'recipes': size, 'likes': n_likes, 'expiring': n_expiring, 'users': len(users),
+                          'catalog_build_s': build_seconds}
+                result.update(bench_config(catalog, users, args.batch_size))
+                results.append(result)
+                latency = result['latency']
+                print(f"{size:>8} {n_likes:>5} {n_expiring:>8} {latency['filter']['p50_ms']:>10.2f} "
+                      f"{latency['expiring']['p50_ms']:>12.2f} {latency['recommend']['p50_ms']:>13.2f} "
+                      f"{latency['total']['p50_ms']:>9.2f} {latency['total']['p99_ms']:>9.2f} "
+                      f"{result['throughput_rps']:>7.1f} {result['batched_throughput_rps']:>8.1f} "
+                      f"{result['peak_rss_mb']:>7.0f}")
+
+    output = args.output or os.path.join('benchmarks', 'results', f"pipeline-{commit or 'unknown'}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'commit': commit,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'args': vars(args),
+            'results': results,
+        }, f, indent=2)
+    print(f"\nResults saved to {output}.")
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import numpy as np
+
+from catalog import TIME_LIMITS
+
+
+def pack_mask(mask):
+    """
+    Împachetează o mască booleană într-un bitset de cuvinte uint64 (bitul i = rândul i).
+    """
+    packed = np.packbits(np.asarray(mask, dtype=bool), bitorder='little')
+    padding = -len(packed) % 8
+    if padding:
+        packed = np.concatenate([packed, np.zeros(padding, dtype=np.uint8)])
+    return packed.view('<u8')
+
+
+def bitset_rows(bitset, n_rows):
+    """
+    Returnează rândurile (în ordine crescătoare) care au bitul setat.
+    """
+    bits = np.unpackbits(bitset.view(np.uint8), count=n_rows, bitorder='little')
+    return np.flatnonzero(bits)
+
+
+def bitset_count(bitset):
+    return int(np.unpackbits(bitset.view(np.uint8)).sum())
+
+
+class BitsetIndex:
+    """
+    Bitset-uri precalculate pentru filtrele din filter_recepies: fără fiecare alergen,
+    cu fiecare preferință, pe tip, pe dificultate și pe intervalul de timp.
+    Candidații unui utilizator se obțin din câteva AND/OR pe cuvinte de 64 de biți.
+    """
+
+    def __init__(self, catalog):
+        self.n_rows = len(catalog)
+        self.all = pack_mask(np.ones(self.n_rows, dtype=bool))
+        self.allergen_free = {
+            allergen: pack_mask(~catalog.allergen_flags[:, position])
+            for position, allergen in enumerate(catalog.allergen_columns)
+        }
+        self.preference = {
+            preference: pack_mask(catalog.preference_flags[:, position])
+            for position, preference in enumerate(catalog.preference_columns)
+        }
+        self.type = {
+            label: pack_mask(catalog.type_codes == code)
+            for code, label in enumerate(catalog.type_labels)
+        }
+        self.difficulty = {
+            int(value): pack_mask(catalog.difficulty == value)
+            for value in np.unique(catalog.difficulty)
+        }
+        self.time = {
+            bucket: pack_mask(catalog.total_time <= max_time)
+            for bucket, max_time in TIME_LIMITS.items()
+        }
+
+    def _union(self, bitsets, values):
+        result = np.zeros_like(self.all)
+        for value in values:
+            bitset = bitsets.get(value)
+            if bitset is not None:
+                np.bitwise_or(result, bitset, out=result)
+        return result
+
+    def candidates(self, user_allergies, user_preferences, user_type, user_difficulty, user_time):
+        """
+        Același rezultat ca filter_recepies, ca bitset: alergenii și timpul se combină cu AND,
+        valorile din preferințe, tip și dificultate cu OR între ele.
+        """
+        result = self.all.copy()
+
+        for allergen in user_allergies or []:
+            if allergen in self.allergen_free:
+                np.bitwise_and(result, self.allergen_free[allergen], out=result)
+
+        valid_preferences = [preference for preference in user_preferences or [] if preference in self.preference]
+        if valid_preferences:
+            np.bitwise_and(result, self._union(self.preference, valid_preferences), out=result)
+
+        if user_type:
+            np.bitwise_and(result, self._union(self.type, user_type), out=result)
+
+        if user_difficulty:
+            np.bitwise_and(result, self._union(self.difficulty, user_difficulty), out=result)
+
+        if user_time is not None and user_time in self.time:
+            np.bitwise_and(result, self.time[user_time], out=result)
+
+        return result
+
+    def candidate_rows(self, *filters):
+        return bitset_rows(self.candidates(*filters), self.n_rows)
+
+
+def get_bitset_index(catalog):
+    return catalog.derived('bitset_index', BitsetIndex)
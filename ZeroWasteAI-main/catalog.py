@@ -0,0 +1,366 @@
+import hashlib
+import json
+import os
+import re
+import struct
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+# Fișierul sursă al catalogului de rețete
+CATALOG_PATH = 'Files/recipesAllergensPreferences.xlsx'
+CATALOG_SHEET = 'AI'
+# Catalogul compilat (vezi compile_catalog.py), mapat în memorie read-only de fiecare worker
+COMPILED_CATALOG_PATH = 'Files/recipes.catalog'
+
+ALLERGEN_COLUMNS = ['Celery', 'Cereals', 'Crustaceans', 'Eggs', 'Fish', 'Lupin', 'Milk', 'Molluscs', 'Mustard', 'Peanuts', 'Sesame', 'Soybeans', 'Sulphur']
+PREFERENCE_COLUMNS = ['Dairy-Free', 'Gluten-Free', 'Vegan', 'Vegetarian']
+
+""" TIMPI DE GATIRE
+ 1 - pentru retete cu timp de gatire maxim 30 min (inclusiv)
+ 2 - max 60 min
+ 3 - max 120 min
+ 4 - max 180 min """
+TIME_LIMITS = {1: 30, 2: 60, 3: 120, 4: 180}
+
+# Intervalul minim (în secunde) între două verificări ale fișierului sursă
+RELOAD_CHECK_INTERVAL = 1.0
+
+# Formatul fișierului compilat: MAGIC, lungimea header-ului JSON (uint64), header-ul,
+# apoi coloanele aliniate la CATALOG_ALIGNMENT octeți
+CATALOG_MAGIC = b'ZWCATLG1'
+CATALOG_FORMAT = 2
+CATALOG_ALIGNMENT = 64
+
+# Același tipar de cuvinte ca CountVectorizer (token_pattern implicit)
+WORD_PATTERN = re.compile(r'(?u)\b\w\w+\b')
+
+
+def preprocess_ingredients(text):
+    return re.sub(r'\b\d+\b', '', text)  # elimina numerele
+
+
+def ingredient_phrases(text):
+    return [item.strip().lower() for item in preprocess_ingredients(text).split(',')]
+
+
+def ingredient_words(text):
+    return WORD_PATTERN.findall(preprocess_ingredients(text).lower())
+
+
+def ingredient_segments(text_lower):
+    # segmentele dintre virgule, fără strip: un produs fără virgulă apare în text
+    # exact atunci când apare într-unul dintre segmente
+    return text_lower.split(',')
+
+
+def file_digest(file_path):
+    """
+    Calculează hash-ul conținutului fișierului sursă (folosit ca versiune a catalogului).
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+class StringColumn:
+    """
+    Coloană de texte stocată compact: octeții UTF-8 concatenați și offset-urile fiecărui rând.
+    """
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+        self._byte_counts = None
+
+    @classmethod
+    def from_strings(cls, values):
+        encoded = [value.encode('utf-8') for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return cls(offsets, data)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        return bytes(self.data[self.offsets[row]:self.offsets[row + 1]]).decode('utf-8')
+
+    def tolist(self):
+        return [self[row] for row in range(len(self))]
+
+    def byte_counts(self):
+        """
+        Frecvența fiecărei valori de octet în text (calculată o singură dată).
+        """
+        if self._byte_counts is None:
+            self._byte_counts = np.bincount(self.data, minlength=256)
+        return self._byte_counts
+
+
+def _tokenize(texts, tokenizer):
+    """
+    Transformă textele în liste de id-uri de tokeni (format CSR) cu vocabular sortat.
+    """
+    vocabulary = {}
+    tokens = []
+    indptr = np.zeros(len(texts) + 1, dtype=np.int64)
+    for row, text in enumerate(texts):
+        row_tokens = tokenizer(text)
+        for token in row_tokens:
+            vocabulary.setdefault(token, len(vocabulary))
+        tokens.extend(vocabulary[token] for token in row_tokens)
+        indptr[row + 1] = len(tokens)
+
+    terms = sorted(vocabulary)
+    remap = np.empty(len(terms), dtype=np.int32)
+    for new_id, term in enumerate(terms):
+        remap[vocabulary[term]] = new_id
+    ids = remap[np.asarray(tokens, dtype=np.int32)] if tokens else np.zeros(0, dtype=np.int32)
+    return StringColumn.from_strings(terms), indptr, ids
+
+
+def _postings(indptr, ids, n_terms):
+    """
+    Inversează listele de tokeni (CSR rând -> tokeni) în liste de rânduri per token
+    (CSR token -> rânduri distincte, sortate).
+    """
+    rows = np.repeat(np.arange(len(indptr) - 1, dtype=np.int64), np.diff(indptr))
+    order = np.lexsort((rows, ids))
+    ids, rows = ids[order], rows[order]
+    keep = np.ones(len(ids), dtype=bool)
+    keep[1:] = (ids[1:] != ids[:-1]) | (rows[1:] != rows[:-1])
+    ids, rows = ids[keep], rows[keep]
+    postings_indptr = np.zeros(n_terms + 1, dtype=np.int64)
+    np.cumsum(np.bincount(ids, minlength=n_terms), out=postings_indptr[1:])
+    return postings_indptr, rows
+
+
+class RecipeCatalog:
+    """
+    Catalogul de rețete, citit o singură dată și păstrat în memorie, pe coloane.
+    Ingredientele sunt tokenizate la construire (fraze pentru MultiLabelBinarizer,
+    cuvinte pentru CountVectorizer, segmente inversate pentru produsele care expiră),
+    nu la fiecare cerere. Obiectul este read-only;
+    coloanele pot fi array-uri numpy obișnuite sau mapate din catalogul compilat.
+    """
+
+    STRING_COLUMNS = ('names', 'links', 'ingredients', 'ingredients_lower', 'phrase_vocabulary', 'word_vocabulary',
+                      'segment_vocabulary')
+    ARRAY_COLUMNS = ('ids', 'difficulty', 'total_time', 'type_codes', 'allergen_flags', 'preference_flags',
+                     'sorted_ids', 'sorted_rows', 'phrase_indptr', 'phrase_ids', 'word_indptr', 'word_ids',
+                     'segment_postings_indptr', 'segment_postings_rows')
+    # matricea de trăsături (CSR), scrisă de compile_catalog.py ca să fie și ea împărțită între procese,
+    # și, opțional, indexul ANN (vezi ann_index.py) și tabelul vecinilor (vezi neighbours.py)
+    OPTIONAL_ARRAY_COLUMNS = ('feature_indptr', 'feature_indices', 'feature_data', 'ann_planes', 'ann_codes', 'ann_rows',
+                              'neighbour_indptr', 'neighbour_rows', 'neighbour_scores')
+
+    def __init__(self, version, allergen_columns, preference_columns, type_labels, **columns):
+        self.version = version
+        self.allergen_columns = list(allergen_columns)
+        self.preference_columns = list(preference_columns)
+        self.type_labels = list(type_labels)
+        for name in self.STRING_COLUMNS + self.ARRAY_COLUMNS:
+            setattr(self, name, columns[name])
+        for name in self.OPTIONAL_ARRAY_COLUMNS:
+            setattr(self, name, columns.get(name))
+        self._df = None
+        self._derived = {}
+        self._derived_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_frame(cls, df, version):
+        df = df.reset_index(drop=True)
+        allergen_columns = [col for col in ALLERGEN_COLUMNS if col in df.columns]
+        preference_columns = [col for col in PREFERENCE_COLUMNS if col in df.columns]
+        ingredients = df['Ingredients'].fillna('').astype(str).tolist()
+        type_codes, type_labels = pd.factorize(df['Type'])
+
+        ids = df['id'].to_numpy(dtype=np.int64)
+        sorted_rows = np.argsort(ids, kind='stable')
+        phrase_vocabulary, phrase_indptr, phrase_ids = _tokenize(ingredients, ingredient_phrases)
+        word_vocabulary, word_indptr, word_ids = _tokenize(ingredients, ingredient_words)
+        ingredients_lower = [text.lower() for text in ingredients]
+        segment_vocabulary, segment_indptr, segment_ids = _tokenize(ingredients_lower, ingredient_segments)
+        segment_postings_indptr, segment_postings_rows = _postings(segment_indptr, segment_ids, len(segment_vocabulary))
+
+        return cls(
+            version, allergen_columns, preference_columns, [str(label) for label in type_labels],
+            ids=ids,
+            difficulty=df['Difficulty'].to_numpy(dtype=np.int16),
+            total_time=df['Total time'].to_numpy(dtype=np.int32),
+            type_codes=type_codes.astype(np.int16),
+            allergen_flags=df[allergen_columns].to_numpy(dtype=bool).reshape(len(df), len(allergen_columns)),
+            preference_flags=df[preference_columns].to_numpy(dtype=bool).reshape(len(df), len(preference_columns)),
+            sorted_ids=ids[sorted_rows],
+            sorted_rows=sorted_rows.astype(np.int64),
+            names=StringColumn.from_strings(df['Name'].fillna('').astype(str)),
+            links=StringColumn.from_strings(df['Link'].fillna('').astype(str)),
+            ingredients=StringColumn.from_strings(ingredients),
+            ingredients_lower=StringColumn.from_strings(ingredients_lower),
+            phrase_vocabulary=phrase_vocabulary, phrase_indptr=phrase_indptr, phrase_ids=phrase_ids,
+            word_vocabulary=word_vocabulary, word_indptr=word_indptr, word_ids=word_ids,
+            segment_vocabulary=segment_vocabulary, segment_postings_indptr=segment_postings_indptr,
+            segment_postings_rows=segment_postings_rows,
+        )
+
+    @classmethod
+    def from_excel(cls, file_path=CATALOG_PATH, sheet_name=CATALOG_SHEET, version=None):
+        df = pd.read_excel(file_path, sheet_name=sheet_name)
+        return cls.from_frame(df, version or file_digest(file_path))
+
+    @classmethod
+    def open(cls, path=COMPILED_CATALOG_PATH):
+        """
+        Deschide catalogul compilat. Coloanele sunt view-uri read-only peste un singur
+        np.memmap, deci toate procesele care îl deschid împart aceleași pagini fizice.
+        """
+        with open(path, 'rb') as f:
+            magic, header_length = struct.unpack('<8sQ', f.read(16))
+            if magic != CATALOG_MAGIC:
+                raise ValueError(f"{path} is not a compiled recipe catalog.")
+            header = json.loads(f.read(header_length))
+        if header['format'] != CATALOG_FORMAT:
+            raise ValueError(f"Unsupported catalog format {header['format']} in {path}.")
+
+        buffer = np.memmap(path, dtype=np.uint8, mode='r')
+        data_start = header['data_start']
+
+        def column(name):
+            spec = header['columns'][name]
+            dtype = np.dtype(spec['dtype'])
+            start = data_start + spec['offset']
+            count = int(np.prod(spec['shape'], dtype=np.int64))
+            return buffer[start:start + count * dtype.itemsize].view(dtype).reshape(spec['shape'])
+
+        columns = {name: column(name) for name in cls.ARRAY_COLUMNS}
+        columns.update({name: column(name) for name in cls.OPTIONAL_ARRAY_COLUMNS if name in header['columns']})
+        for name in cls.STRING_COLUMNS:
+            columns[name] = StringColumn(column(f'{name}.offsets'), column(f'{name}.data'))
+        return cls(header['version'], header['allergen_columns'], header['preference_columns'],
+                   header['type_labels'], **columns)
+
+    def rows_for_ids(self, recipe_ids):
+        """
+        Returnează pozițiile (rândurile) rețetelor cu id-urile date; id-urile necunoscute sunt ignorate.
+        """
+        recipe_ids = np.asarray(recipe_ids, dtype=np.int64)
+        if not len(recipe_ids) or not len(self.sorted_ids):
+            return np.zeros(0, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.sorted_ids, recipe_ids), len(self.sorted_ids) - 1)
+        found = self.sorted_ids[positions] == recipe_ids
+        return self.sorted_rows[positions[found]]
+
+    def derived(self, name, build):
+        """
+        Structură derivată din catalog (index, matrice de trăsături...), construită o singură dată
+        pentru această versiune și păstrată cât timp catalogul e activ.
+        """
+        value = self._derived.get(name)
+        if value is None:
+            with self._derived_lock:
+                value = self._derived.get(name)
+                if value is None:
+                    value = build(self)
+                    self._derived[name] = value
+        return value
+
+    @property
+    def df(self):
+        """
+        Vedere pandas a catalogului, construită la prima utilizare (pentru codul care lucrează cu DataFrame-uri).
+        """
+        if self._df is None:
+            ingredients = self.ingredients.tolist()
+            df = pd.DataFrame({
+                'id': self.ids,
+                'Name': self.names.tolist(),
+                'Link': self.links.tolist(),
+                'Difficulty': self.difficulty,
+                'Total time': self.total_time,
+                'Type': [self.type_labels[code] if code >= 0 else None for code in self.type_codes],
+                'Ingredients': ingredients,
+            })
+            for position, col in enumerate(self.allergen_columns):
+                df[col] = self.allergen_flags[:, position]
+            for position, col in enumerate(self.preference_columns):
+                df[col] = self.preference_flags[:, position]
+            df['Processed_Ingredients'] = [preprocess_ingredients(text) for text in ingredients]
+            df['Ingredients_List'] = [ingredient_phrases(text) for text in ingredients]
+            df['Ingredients_Lower'] = self.ingredients_lower.tolist()
+            self._df = df
+        return self._df
+
+
+class ResidentCatalog:
+    """
+    Ține catalogul încărcat pe toată durata procesului și îl reîncarcă doar
+    când fișierele se schimbă (mtime, apoi hash pentru confirmare).
+    Dacă există un catalog compilat pentru versiunea curentă a sursei, îl mapează în memorie.
+    """
+
+    def __init__(self, file_path=CATALOG_PATH, sheet_name=CATALOG_SHEET, compiled_path=COMPILED_CATALOG_PATH,
+                 check_interval=RELOAD_CHECK_INTERVAL):
+        self.file_path = file_path
+        self.sheet_name = sheet_name
+        self.compiled_path = compiled_path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._catalog = None
+        self._mtimes = None
+        self._last_check = 0.0
+
+    def _current_mtimes(self):
+        compiled_mtime = None
+        if self.compiled_path and os.path.exists(self.compiled_path):
+            compiled_mtime = os.stat(self.compiled_path).st_mtime_ns
+        return os.stat(self.file_path).st_mtime_ns, compiled_mtime
+
+    def _load(self, version):
+        if self.compiled_path and os.path.exists(self.compiled_path):
+            try:
+                compiled = RecipeCatalog.open(self.compiled_path)
+            except ValueError as e:
+                print(f"Cannot use compiled catalog: {e} Reading {self.file_path} instead.")
+            else:
+                if compiled.version == version:
+                    return compiled, 'compiled'
+                print(f"Compiled catalog {self.compiled_path} is stale, reading {self.file_path} instead.")
+        return RecipeCatalog.from_excel(self.file_path, self.sheet_name, version), 'excel'
+
+    def get(self):
+        """
+        Returnează catalogul curent; verificarea fișierelor se face cel mult o dată pe interval.
+        """
+        catalog = self._catalog
+        now = time.monotonic()
+        if catalog is not None and now - self._last_check < self.check_interval:
+            return catalog
+
+        with self._lock:
+            self._last_check = now
+            mtimes = self._current_mtimes()
+            if self._catalog is not None and mtimes == self._mtimes:
+                return self._catalog
+
+            version = file_digest(self.file_path)
+            if self._catalog is None or version != self._catalog.version or mtimes[1] != self._mtimes[1]:
+                self._catalog, source = self._load(version)
+                print(f"Recipe catalog loaded from {source}: {len(self._catalog)} recipes (version {version}).")
+            self._mtimes = mtimes
+            return self._catalog
+
+
+_resident_catalog = ResidentCatalog()
+
+
+def get_catalog():
+    return _resident_catalog.get()
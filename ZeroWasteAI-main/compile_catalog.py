@@ -0,0 +1,181 @@
+"""
+Compilează foile Excel cu rețete într-un fișier binar pe coloane, care poate fi
+mapat în memorie (read-only) de toate procesele worker.
+
+Utilizare:
+    python compile_catalog.py [--source Files/recipesAllergensPreferences.xlsx]
+                              [--recipes Files/recipes.xlsx] [--output Files/recipes.catalog]
+                              [--ann-tables 8] [--neighbours 50]
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+import pandas as pd
+
+from catalog import (
+    ALLERGEN_COLUMNS, CATALOG_ALIGNMENT, CATALOG_FORMAT, CATALOG_MAGIC, CATALOG_PATH, CATALOG_SHEET,
+    COMPILED_CATALOG_PATH, PREFERENCE_COLUMNS, RecipeCatalog, file_digest,
+)
+from ann_index import build_lsh
+from features import RecipeFeatures
+from neighbours import build_neighbours
+
+RECIPES_PATH = 'Files/recipes.xlsx'
+REQUIRED_COLUMNS = ['id', 'Name', 'Link', 'Difficulty', 'Total time', 'Type', 'Ingredients']
+
+
+class CatalogValidationError(ValueError):
+    def __init__(self, errors):
+        super().__init__('\n'.join(errors))
+        self.errors = errors
+
+
+def validate_sheets(df, recipes_df=None):
+    """
+    Verifică foaia AI (și, opțional, foaia cu rețete) și returnează lista de erori găsite.
+    """
+    errors = []
+    missing = [col for col in REQUIRED_COLUMNS + ALLERGEN_COLUMNS + PREFERENCE_COLUMNS if col not in df.columns]
+    if missing:
+        return [f"Missing columns: {', '.join(missing)}"]
+
+    for col in ['id', 'Difficulty', 'Total time']:
+        values = pd.to_numeric(df[col], errors='coerce')
+        bad = df.index[values.isna() | (values < 0) | (values != values.round())]
+        if len(bad):
+            errors.append(f"Column '{col}' must hold non-negative integers (rows {list(bad[:10] + 2)}).")
+
+    duplicated = df['id'][df['id'].duplicated()]
+    if len(duplicated):
+        errors.append(f"Duplicate recipe ids: {sorted(set(duplicated.tolist()))[:10]}.")
+
+    for col in ALLERGEN_COLUMNS + PREFERENCE_COLUMNS:
+        bad = df.index[~df[col].isin([0, 1, True, False])]
+        if len(bad):
+            errors.append(f"Flag column '{col}' must hold 0/1 values (rows {list(bad[:10] + 2)}).")
+
+    empty = df.index[df['Ingredients'].isna() | (df['Ingredients'].astype(str).str.strip() == '')]
+    if len(empty):
+        errors.append(f"Recipes without ingredients (rows {list(empty[:10] + 2)}).")
+
+    if recipes_df is not None and 'id' in recipes_df.columns:
+        only_ai = set(df['id']) - set(recipes_df['id'])
+        only_recipes = set(recipes_df['id']) - set(df['id'])
+        if only_ai or only_recipes:
+            errors.append(f"Recipe ids differ between sheets (only in AI sheet: {sorted(only_ai)[:10]}, "
+                          f"only in recipes sheet: {sorted(only_recipes)[:10]}).")
+    return errors
+
+
+def _align(offset):
+    return -(-offset // CATALOG_ALIGNMENT) * CATALOG_ALIGNMENT
+
+
+def write_catalog(catalog, output_path, sources=None):
+    """
+    Scrie catalogul în formatul binar citit de RecipeCatalog.open.
+    Fișierul este scris într-un fișier temporar și apoi redenumit, ca worker-ii să nu vadă un fișier parțial.
+    """
+    arrays = {name: np.ascontiguousarray(getattr(catalog, name)) for name in RecipeCatalog.ARRAY_COLUMNS}
+    for name in RecipeCatalog.OPTIONAL_ARRAY_COLUMNS:
+        if getattr(catalog, name) is not None:
+            arrays[name] = np.ascontiguousarray(getattr(catalog, name))
+    for name in RecipeCatalog.STRING_COLUMNS:
+        column = getattr(catalog, name)
+        arrays[f'{name}.offsets'] = np.ascontiguousarray(column.offsets, dtype=np.int64)
+        arrays[f'{name}.data'] = np.ascontiguousarray(column.data, dtype=np.uint8)
+
+    columns = {}
+    offset = 0
+    for name, array in arrays.items():
+        columns[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _align(offset + array.nbytes)
+
+    header = {
+        'format': CATALOG_FORMAT,
+        'version': catalog.version,
+        'n_recipes': len(catalog),
+        'sources': sources or {},
+        'allergen_columns': catalog.allergen_columns,
+        'preference_columns': catalog.preference_columns,
+        'type_labels': catalog.type_labels,
+        'columns': columns,
+    }
+    # data_start depinde de lungimea header-ului, care îl conține; iterăm până se stabilizează
+    header['data_start'] = 0
+    while True:
+        encoded = json.dumps(header).encode('utf-8')
+        data_start = _align(16 + len(encoded))
+        if data_start == header['data_start']:
+            break
+        header['data_start'] = data_start
+
+    tmp_path = f'{output_path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack('<8sQ', CATALOG_MAGIC, len(encoded)))
+        f.write(encoded)
+        for name, array in arrays.items():
+            f.seek(data_start + columns[name]['offset'])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, output_path)
+
+
+def compile_catalog(source_path=CATALOG_PATH, recipes_path=RECIPES_PATH, output_path=COMPILED_CATALOG_PATH,
+                    ann_tables=0, ann_bits=None, neighbours=0):
+    df = pd.read_excel(source_path, sheet_name=CATALOG_SHEET)
+    recipes_df = pd.read_excel(recipes_path) if recipes_path and os.path.exists(recipes_path) else None
+
+    errors = validate_sheets(df, recipes_df)
+    if errors:
+        raise CatalogValidationError(errors)
+
+    sources = {source_path: file_digest(source_path)}
+    if recipes_df is not None:
+        sources[recipes_path] = file_digest(recipes_path)
+    catalog = RecipeCatalog.from_frame(df, sources[source_path])
+    # matricea de trăsături e scrisă în fișier, ca procesele worker să nu o reconstruiască fiecare
+    features = RecipeFeatures(catalog).matrix
+    catalog.feature_indptr, catalog.feature_indices, catalog.feature_data = features.indptr, features.indices, features.data
+    if ann_tables:
+        for name, array in build_lsh(features, ann_tables, ann_bits).items():
+            setattr(catalog, name, array)
+    if neighbours:
+        for name, array in build_neighbours(features, neighbours).items():
+            setattr(catalog, name, array)
+    write_catalog(catalog, output_path, sources)
+    return catalog
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compile the recipe spreadsheets into a memory-mappable catalog.')
+    parser.add_argument('--source', default=CATALOG_PATH, help='workbook with the AI sheet')
+    parser.add_argument('--recipes', default=RECIPES_PATH, help='recipes workbook, cross-checked against the AI sheet')
+    parser.add_argument('--output', default=COMPILED_CATALOG_PATH)
+    parser.add_argument('--ann-tables', type=int, default=0,
+                        help='also build an LSH index with this many hash tables for approximate top-K (0 = none)')
+    parser.add_argument('--ann-bits', type=int, help='hyperplanes per LSH table (default: about 8 recipes per bucket)')
+    parser.add_argument('--neighbours', type=int, default=0,
+                        help='also store the M most similar recipes of every recipe, for --neighbours scoring (0 = none)', metavar='M')
+    args = parser.parse_args(argv)
+
+    try:
+        catalog = compile_catalog(args.source, args.recipes, args.output, args.ann_tables, args.ann_bits,
+                                  args.neighbours)
+    except CatalogValidationError as e:
+        print("Catalog validation failed:", file=sys.stderr)
+        for error in e.errors:
+            print(f"  - {error}", file=sys.stderr)
+        return 1
+
+    size = os.path.getsize(args.output)
+    print(f"Compiled {len(catalog)} recipes (version {catalog.version}) into {args.output} ({size / 1024:.1f} KiB).")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,219 @@
+from collections import OrderedDict, deque
+import threading
+
+import numpy as np
+
+# Câte automate (unul per listă de produse) păstrăm în cache
+MATCHER_CACHE_SIZE = 256
+
+
+class ExpiringMatcher:
+    """
+    Automat Aho-Corasick pentru lista de produse care expiră, construit pe octeții UTF-8
+    ai textului cu litere mici. Pentru fiecare produs caută atât produsul, cât și excluderea
+    „mini {produs}”, cu aceeași semantică ca use_expiring_ingredients:
+    un produs se potrivește dacă apare în ingrediente și „mini {produs}” nu apare.
+
+    Automatul este transformat într-un tabel complet de tranziții (DFA), astfel încât toate
+    rețetele sunt parcurse simultan, octet cu octet, cu operații numpy.
+    """
+
+    # dimensiunea ferestrelor (în octeți) în care sunt tăiate textele, vezi found_patterns
+    WINDOW = 48
+    # sub acest număr de tipare, căutarea vectorizată a fiecărui tipar e mai rapidă decât automatul
+    # (vezi benchmarks/bench_expiring.py)
+    AUTOMATON_MIN_PATTERNS = 32
+
+    def __init__(self, expiring_products):
+        self.products = [product.lower() for product in expiring_products]
+
+        patterns = []
+        pattern_ids = {}
+        for product in self.products:
+            for pattern in (product, f'mini {product}'):
+                if pattern not in pattern_ids:
+                    pattern_ids[pattern] = len(patterns)
+                    patterns.append(pattern)
+        self.patterns = patterns
+        # pentru fiecare produs (în ordinea priorității): id-ul tiparului și al excluderii
+        self.product_patterns = np.array([pattern_ids[product] for product in self.products], dtype=np.int64)
+        self.exclusion_patterns = np.array([pattern_ids[f'mini {product}'] for product in self.products], dtype=np.int64)
+
+        encoded_patterns = [pattern.encode('utf-8') for pattern in patterns]
+        self.max_pattern_length = max((len(pattern) for pattern in encoded_patterns), default=0)
+        self._build(encoded_patterns)
+
+    def _build(self, encoded_patterns):
+        goto = [{}]
+        outputs = [0]
+        for pattern_id, pattern in enumerate(encoded_patterns):
+            state = 0
+            for byte in pattern:
+                if byte not in goto[state]:
+                    goto[state][byte] = len(goto)
+                    goto.append({})
+                    outputs.append(0)
+                state = goto[state][byte]
+            outputs[state] |= 1 << pattern_id
+        # tiparul gol (produs '') apare în orice text, deci pornim cu el deja găsit
+        self.initial_mask = outputs[0]
+        outputs[0] = 0
+
+        n_states = len(goto)
+        delta = np.zeros((n_states, 256), dtype=np.int32)
+        fail = [0] * n_states
+        queue = deque()
+        for byte, state in goto[0].items():
+            delta[0, byte] = state
+            queue.append(state)
+        # BFS: tranzițiile lipsă ale unei stări sunt cele ale stării ei de eșec
+        while queue:
+            state = queue.popleft()
+            outputs[state] |= outputs[fail[state]]
+            delta[state] = delta[fail[state]]
+            for byte, child in goto[state].items():
+                fail[child] = delta[fail[state], byte]
+                delta[state, byte] = child
+                queue.append(child)
+
+        n_words = max(1, -(-len(encoded_patterns) // 64))
+        output_masks = np.zeros((n_states, n_words), dtype=np.uint64)
+        for state, mask in enumerate(outputs):
+            for word in range(n_words):
+                output_masks[state, word] = (mask >> (64 * word)) & 0xFFFFFFFFFFFFFFFF
+        self.delta = delta
+        self.output_masks = output_masks
+        self.has_output = output_masks.any(axis=1)
+        self.initial_found = np.array([(self.initial_mask >> (64 * word)) & 0xFFFFFFFFFFFFFFFF
+                                       for word in range(n_words)], dtype=np.uint64)
+
+    def found_patterns(self, texts, rows):
+        """
+        Rulează automatul peste textele rândurilor date și returnează, pentru fiecare rând,
+        masca (pe biți) a tiparelor găsite. texts este o StringColumn (octeți UTF-8 + offset-uri).
+
+        Textele sunt tăiate în ferestre de WINDOW octeți care se suprapun cu lungimea celui mai
+        lung tipar minus unu, deci orice apariție e conținută integral într-o fereastră. Ferestrele
+        sunt independente, așa că numărul de pași e mărginit de dimensiunea ferestrei, nu de
+        lungimea celui mai lung text, iar la fiecare pas avansăm toate ferestrele deodată.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        n_words = self.output_masks.shape[1]
+        found = np.zeros((len(rows), n_words), dtype=np.uint64)
+        found |= self.initial_found
+        if not len(rows) or self.max_pattern_length == 0:
+            return found
+
+        overlap = self.max_pattern_length - 1
+        starts = texts.offsets[rows]
+        lengths = texts.offsets[rows + 1] - starts
+        windows_per_row = np.maximum(-(-lengths // self.WINDOW), 1)
+        window_rows = np.repeat(np.arange(len(rows)), windows_per_row)
+        first_window = np.cumsum(windows_per_row) - windows_per_row
+        window_index = np.arange(len(window_rows)) - np.repeat(first_window, windows_per_row)
+        window_starts = starts[window_rows] + window_index * self.WINDOW
+        window_ends = np.minimum(window_starts + self.WINDOW + overlap, starts[window_rows] + lengths[window_rows])
+        window_lengths = window_ends - window_starts
+
+        # ferestrele în ordinea descrescătoare a lungimii: cele active sunt mereu un prefix
+        order = np.argsort(-window_lengths, kind='stable')
+        window_starts = window_starts[order]
+        ascending_lengths = window_lengths[order][::-1]
+        data = texts.data
+        delta = self.delta.ravel()
+        has_output = self.has_output
+
+        states = np.zeros(len(order), dtype=np.int64)
+        window_found = np.zeros((len(order), n_words), dtype=np.uint64)
+        max_length = int(ascending_lengths[-1])
+        for offset in range(max_length):
+            active = len(order) - int(np.searchsorted(ascending_lengths, offset, side='right'))
+            current = delta[(states[:active] << 8) | data[window_starts[:active] + offset]]
+            states[:active] = current
+            hits = np.flatnonzero(has_output[current])
+            if len(hits):
+                window_found[hits] |= self.output_masks[current[hits]]
+
+        # OR între ferestrele fiecărui rând
+        unsorted = np.empty_like(window_found)
+        unsorted[order] = window_found
+        found |= np.bitwise_or.reduceat(unsorted, first_window, axis=0)
+        return found
+
+    def scan_patterns(self, texts, rows):
+        """
+        Aceeași mască ca found_patterns, obținută căutând fiecare tipar separat cu operații
+        numpy pe tot textul concatenat: pozițiile celui mai rar octet din tipar, apoi verificarea celorlalți.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        found = np.zeros((len(rows), self.output_masks.shape[1]), dtype=np.uint64)
+        found |= self.initial_found
+        if not len(rows):
+            return found
+
+        data = texts.data
+        offsets = texts.offsets
+        byte_counts = texts.byte_counts()
+        row_position = np.full(len(texts), -1, dtype=np.int64)
+        row_position[rows] = np.arange(len(rows))
+        for pattern_id, pattern in enumerate(self.patterns):
+            encoded = np.frombuffer(pattern.encode('utf-8'), dtype=np.uint8)
+            if not len(encoded):
+                continue
+            anchor = int(np.argmin(byte_counts[encoded]))
+            positions = np.flatnonzero(data[anchor:len(data) - len(encoded) + anchor + 1] == encoded[anchor])
+            for index in range(len(encoded)):
+                if index != anchor:
+                    positions = positions[data[positions + index] == encoded[index]]
+            # apariția trebuie să fie în întregime în textul unui singur rând
+            matched_rows = np.searchsorted(offsets, positions, side='right') - 1
+            matched_rows = matched_rows[positions + len(encoded) <= offsets[matched_rows + 1]]
+            matched_positions = row_position[matched_rows]
+            matched_positions = matched_positions[matched_positions >= 0]
+            found[matched_positions, pattern_id // 64] |= np.uint64(1 << (pattern_id % 64))
+        return found
+
+    def _pattern_present(self, found, pattern_ids):
+        words = pattern_ids // 64
+        bits = (pattern_ids % 64).astype(np.uint64)
+        return ((found[:, words] >> bits) & np.uint64(1)).astype(bool)
+
+    def match(self, texts, rows):
+        """
+        Returnează (match_count, priority) pentru rândurile date, ca use_expiring_ingredients:
+        numărul de produse potrivite și poziția primului produs potrivit (len(produse) dacă niciunul).
+        """
+        if len(self.patterns) < self.AUTOMATON_MIN_PATTERNS:
+            found = self.scan_patterns(texts, rows)
+        else:
+            found = self.found_patterns(texts, rows)
+        matched = self._pattern_present(found, self.product_patterns) & ~self._pattern_present(found, self.exclusion_patterns)
+
+        match_count = matched.sum(axis=1)
+        if not self.products:
+            return match_count, np.zeros(len(match_count), dtype=np.int64)
+        priority = np.where(matched.any(axis=1), matched.argmax(axis=1), len(self.products))
+        return match_count, priority
+
+
+_matcher_cache = OrderedDict()
+_matcher_lock = threading.Lock()
+
+
+def get_expiring_matcher(expiring_products):
+    """
+    Automatul pentru lista dată, luat din cache (aceeași listă de produse = același automat).
+    """
+    key = tuple(product.lower() for product in expiring_products)
+    with _matcher_lock:
+        matcher = _matcher_cache.get(key)
+        if matcher is not None:
+            _matcher_cache.move_to_end(key)
+            return matcher
+
+    matcher = ExpiringMatcher(key)
+    with _matcher_lock:
+        _matcher_cache[key] = matcher
+        if len(_matcher_cache) > MATCHER_CACHE_SIZE:
+            _matcher_cache.popitem(last=False)
+    return matcher
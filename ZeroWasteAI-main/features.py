@@ -0,0 +1,51 @@
+import numpy as np
+import scipy.sparse as sp
+from sklearn.preprocessing import normalize
+
+
+class RecipeFeatures:
+    """
+    Spațiul de trăsături folosit de recomandări, calculat o singură dată pe tot catalogul:
+    lista de ingrediente (echivalentul MultiLabelBinarizer) alăturată de numărul de apariții
+    ale cuvintelor (echivalentul CountVectorizer). Rândurile sunt normalizate L2, deci
+    similaritatea cosinus dintre două rețete este produsul scalar al rândurilor lor.
+    """
+
+    def __init__(self, catalog):
+        n_rows = len(catalog)
+        n_features = len(catalog.phrase_vocabulary) + len(catalog.word_vocabulary)
+        if catalog.feature_data is not None:
+            # matricea precalculată din catalogul compilat: view peste memoria mapată, fără copie
+            self.matrix = sp.csr_matrix(
+                (catalog.feature_data, catalog.feature_indices, catalog.feature_indptr),
+                shape=(n_rows, n_features), copy=False,
+            )
+            self.n_features = n_features
+            return
+
+        phrases = sp.csr_matrix(
+            (np.ones(len(catalog.phrase_ids), dtype=np.float32), catalog.phrase_ids, catalog.phrase_indptr),
+            shape=(n_rows, len(catalog.phrase_vocabulary)),
+        )
+        phrases.sum_duplicates()
+        phrases.data[:] = 1  # prezența ingredientului, nu numărul de apariții
+
+        words = sp.csr_matrix(
+            (np.ones(len(catalog.word_ids), dtype=np.float32), catalog.word_ids, catalog.word_indptr),
+            shape=(n_rows, len(catalog.word_vocabulary)),
+        )
+        words.sum_duplicates()
+
+        matrix = sp.hstack([phrases, words], format='csr', dtype=np.float32)
+        self.matrix = normalize(matrix, norm='l2', copy=False)
+        self.n_features = self.matrix.shape[1]
+
+    def rows(self, rows):
+        """
+        Sub-matricea (tot CSR) a rândurilor date.
+        """
+        return self.matrix[rows]
+
+
+def get_recipe_features(catalog):
+    return catalog.derived('recipe_features', RecipeFeatures)
@@ -0,0 +1,131 @@
+from collections import OrderedDict
+import threading
+
+import numpy as np
+
+from bitset_index import bitset_rows
+from expiring import ExpiringMatcher, get_expiring_matcher
+
+# Pentru câte produse distincte păstrăm rândurile în care apar
+RESOLVED_PRODUCTS_CACHE_SIZE = 4096
+
+
+def _union_postings(indptr, rows, term_ids):
+    """
+    Reuniunea (sortată, fără duplicate) listelor de rânduri ale termenilor dați.
+    Costul e proporțional cu numărul total de intrări din liste, nu cu mărimea catalogului.
+    """
+    term_ids = np.asarray(term_ids, dtype=np.int64)
+    if not len(term_ids):
+        return np.zeros(0, dtype=np.int64)
+    starts = indptr[term_ids]
+    lengths = indptr[term_ids + 1] - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.zeros(0, dtype=np.int64)
+    # pozițiile tuturor intrărilor: start-ul listei + indexul în cadrul listei
+    positions = np.arange(total, dtype=np.int64) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return np.unique(rows[positions])
+
+
+def bitset_contains(bitset, rows):
+    return ((bitset[rows >> 6] >> (rows & 63).astype(np.uint64)) & np.uint64(1)).astype(bool)
+
+
+class IngredientIndex:
+    """
+    Index inversat peste segmentele de ingrediente (textul cu litere mici, împărțit la virgule):
+    pentru fiecare segment, lista rândurilor care îl conțin (precalculată în catalog).
+
+    Un produs (sau excluderea „mini {produs}”) este căutat o singură dată în vocabularul de
+    segmente; rândurile în care apare sunt reuniunea listelor segmentelor potrivite și sunt
+    păstrate în cache. Un produs fără virgulă apare în text exact atunci când apare într-un
+    segment, deci rezultatul e același ca la căutarea în tot textul.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.vocabulary = catalog.segment_vocabulary
+        self.postings_indptr = catalog.segment_postings_indptr
+        self.postings_rows = catalog.segment_postings_rows
+        self._resolved = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _resolve(self, patterns):
+        """
+        Rândurile care conțin fiecare tipar; tiparele noi sunt căutate împreună, într-o singură
+        trecere a automatului peste vocabular.
+        """
+        with self._lock:
+            resolved = {pattern: self._resolved[pattern] for pattern in patterns if pattern in self._resolved}
+            for pattern in resolved:
+                self._resolved.move_to_end(pattern)
+
+        missing = [pattern for pattern in dict.fromkeys(patterns) if pattern not in resolved]
+        if missing:
+            matcher = ExpiringMatcher(missing)
+            found = matcher.found_patterns(self.vocabulary, np.arange(len(self.vocabulary)))
+            for pattern_id, pattern in enumerate(matcher.patterns):
+                if pattern not in missing:
+                    continue
+                has_pattern = (found[:, pattern_id // 64] >> np.uint64(pattern_id % 64)) & np.uint64(1)
+                resolved[pattern] = _union_postings(self.postings_indptr, self.postings_rows, np.flatnonzero(has_pattern))
+            with self._lock:
+                for pattern in missing:
+                    self._resolved[pattern] = resolved[pattern]
+                while len(self._resolved) > RESOLVED_PRODUCTS_CACHE_SIZE:
+                    self._resolved.popitem(last=False)
+        return resolved
+
+    def match(self, expiring_products, candidates=None):
+        """
+        Rândurile care conțin cel puțin un produs care expiră (fără „mini {produs}”), cu numărul
+        de potriviri și prioritatea (poziția primului produs potrivit). Rețetele fără potriviri nu
+        apar în rezultat. candidates este, opțional, bitset-ul rândurilor permise.
+        Returnează (rows, match_count, priority), sortate după rând.
+        """
+        products = [product.lower() for product in expiring_products]
+        if any(',' in product for product in products):
+            # un produs cu virgulă poate trece peste granița dintre segmente: căutăm în tot textul
+            rows = np.arange(len(self.catalog)) if candidates is None else bitset_rows(candidates, len(self.catalog))
+            match_count, priority = get_expiring_matcher(products).match(self.catalog.ingredients_lower, rows)
+            matched = match_count > 0
+            return rows[matched], match_count[matched], priority[matched]
+
+        resolved = self._resolve([pattern for product in products for pattern in (product, f'mini {product}')])
+        matched_rows = []
+        owners = []
+        for position, product in enumerate(products):
+            rows = np.setdiff1d(resolved[product], resolved[f'mini {product}'], assume_unique=True)
+            if candidates is not None:
+                rows = rows[bitset_contains(candidates, rows)]
+            matched_rows.append(rows)
+            owners.append(np.full(len(rows), position, dtype=np.int64))
+
+        if not matched_rows:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        all_rows = np.concatenate(matched_rows)
+        all_owners = np.concatenate(owners)
+        # produsele sunt concatenate în ordinea priorității, deci prima apariție dă prioritatea
+        rows, first, match_count = np.unique(all_rows, return_index=True, return_counts=True)
+        return rows, match_count, all_owners[first]
+
+    def dense_match(self, expiring_products, rows):
+        """
+        Numărul de potriviri și prioritatea pentru toate rândurile date (ca ExpiringMatcher.match).
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        matched_rows, matched_count, matched_priority = self.match(expiring_products)
+        match_count = np.zeros(len(rows), dtype=np.int64)
+        priority = np.full(len(rows), len(expiring_products), dtype=np.int64)
+        if len(matched_rows):
+            positions = np.minimum(np.searchsorted(matched_rows, rows), len(matched_rows) - 1)
+            hit = matched_rows[positions] == rows
+            match_count[hit] = matched_count[positions[hit]]
+            priority[hit] = matched_priority[positions[hit]]
+        return match_count, priority
+
+
+def get_ingredient_index(catalog):
+    return catalog.derived('ingredient_index', IngredientIndex)
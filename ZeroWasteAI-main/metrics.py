@@ -0,0 +1,213 @@
+import asyncio
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9102
+METRIC_PREFIX = 'zerowaste_ai'
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (0, 10, 100, 1000, 10000, 100000, 1000000)
+# Observațiile făcute în afara worker_pool.timed_call nu sunt citite de nimeni; peste limită le aruncăm
+MAX_BUFFERED_OBSERVATIONS = 10000
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.kind = 'counter'
+        self._values = {}
+
+    def observe(self, value, labels):
+        self._values[labels] = self._values.get(labels, 0) + value
+
+    def render(self):
+        for labels, value in sorted(self._values.items()):
+            yield f'{self.name}{_format_labels(labels)} {_format_value(value)}'
+
+    def snapshot(self):
+        return {','.join(f'{name}={value}' for name, value in labels) or 'total': value
+                for labels, value in self._values.items()}
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.kind = 'histogram'
+        self.buckets = tuple(buckets)
+        self._values = {}
+
+    def observe(self, value, labels):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def render(self):
+        for labels, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket{_format_labels(labels + (("le", _format_value(bound)),))} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(labels)} {_format_value(total)}'
+            yield f'{self.name}_count{_format_labels(labels)} {count}'
+
+    def snapshot(self):
+        return {','.join(f'{name}={value}' for name, value in labels) or 'total':
+                {'count': count, 'mean': total / count if count else 0.0}
+                for labels, (counts, total, count) in self._values.items()}
+
+
+class MetricsRegistry:
+    """
+    Metricile worker-ului, în formatul text Prometheus. Observațiile sunt doar adunări sub un
+    lock, deci pot rămâne activate în producție. Pe lângă metricile proprii, la fiecare citire
+    sunt incluse și valorile returnate de colectori (de ex. ResultCache.stats): contoarele care
+    doar cresc ca counter-e, restul (mărimea cozii, a cache-ului) ca gauge-uri.
+    """
+
+    def __init__(self, prefix=METRIC_PREFIX):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = {}
+
+    def counter(self, name, help_text):
+        return self._add(name, Counter(f'{self.prefix}_{name}', help_text))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._add(name, Histogram(f'{self.prefix}_{name}', help_text, buckets))
+
+    def _add(self, name, metric):
+        with self._lock:
+            return self._metrics.setdefault(name, metric)
+
+    def register_collector(self, name, collect, counters=()):
+        """
+        collect() returnează un dict {cheie: valoare numerică}, exportat ca gauge-uri {prefix}_{name}_{cheie};
+        cheile din counters (totaluri care doar cresc) sunt exportate ca counter-e {prefix}_{name}_{cheie}_total.
+
+        Fiecare componentă cu stats() își declară aceste chei în constanta STATS_COUNTERS a modulului
+        ei (result_cache, micro_batch, ws_client, care o include pe cea din request_queue), pe care
+        Main.serve o dă ca counters.
+        O cheie din counters nu are voie să scadă cât trăiește procesul: Prometheus ar lua scăderea
+        drept o repornire. Valorile care pot scădea (dimensiuni, cereri în curs) rămân gauge-uri.
+        """
+        with self._lock:
+            self._collectors[name] = (collect, frozenset(counters))
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            self._metrics[name].observe(value, tuple(sorted(labels.items())))
+
+    def record(self, observations):
+        """
+        Adaugă observațiile strânse cu drain_observations (eventual în alt proces).
+        """
+        with self._lock:
+            for name, labels, value in observations:
+                self._metrics[name].observe(value, labels)
+
+    def _collected(self):
+        with self._lock:
+            collectors = list(self._collectors.items())
+        for name, (collect, counters) in collectors:
+            for key, value in collect().items():
+                if not isinstance(value, (bool, int, float)):
+                    continue
+                if key in counters:
+                    yield f'{self.prefix}_{name}_{key}_total', 'counter', value
+                else:
+                    yield f'{self.prefix}_{name}_{key}', 'gauge', value
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for metric in self._metrics.values():
+                lines.append(f'# HELP {metric.name} {metric.help_text}')
+                lines.append(f'# TYPE {metric.name} {metric.kind}')
+                lines.extend(metric.render())
+        for name, kind, value in self._collected():
+            lines.append(f'# TYPE {name} {kind}')
+            lines.append(f'{name} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = {metric.name: metric.snapshot() for metric in self._metrics.values()}
+        snapshot.update((name, value) for name, _, value in self._collected())
+        return snapshot
+
+
+REGISTRY = MetricsRegistry()
+REGISTRY.histogram('queue_wait_seconds', 'Time a request waited before its computation started, per queue.')
+REGISTRY.histogram('stage_seconds', 'Time spent per request in each pipeline stage.')
+REGISTRY.histogram('candidates', 'Recipes left after filtering, per request.', SIZE_BUCKETS)
+REGISTRY.counter('requests_total', 'Requests handled, by outcome.')
+
+# Observațiile făcute în timpul calculului (posibil într-un proces worker) sunt strânse local
+# și trimise înapoi odată cu rezultatul, vezi worker_pool.timed_call
+_local = threading.local()
+
+
+def observe(name, value, **labels):
+    buffer = getattr(_local, 'observations', None)
+    if buffer is None or len(buffer) >= MAX_BUFFERED_OBSERVATIONS:
+        buffer = _local.observations = []
+    buffer.append((name, tuple(sorted(labels.items())), value))
+
+
+@contextmanager
+def timed_stage(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('stage_seconds', time.perf_counter() - start, stage=stage)
+
+
+def drain_observations():
+    observations = getattr(_local, 'observations', None) or []
+    _local.observations = []
+    return observations
+
+
+async def serve_metrics(registry=REGISTRY, host=METRICS_HOST, port=METRICS_PORT):
+    """
+    Server HTTP minimal pentru GET /metrics (format text Prometheus), doar pe localhost.
+    """
+    async def handle(reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            while (await asyncio.wait_for(reader.readline(), timeout=5)).strip():
+                pass
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, body = '200 OK', registry.render().encode('utf-8')
+            else:
+                status, body = '404 Not Found', b'Not found\n'
+            writer.write(f'HTTP/1.0 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                         f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode('latin-1') + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+from metrics import REGISTRY
+
+# Câte cereri adunăm cel mult într-un lot și cât așteaptă cel mult prima cerere din lot
+BATCH_SIZE = 16
+BATCH_WAIT = 0.005
+STATS_COUNTERS = ('batches', 'full_batches', 'requests')
+
+
+class MicroBatcher:
+    """
+    Adună cererile care sosesc aproape simultan în loturi: un lot pleacă la calcul când are
+    max_size cereri sau când prima lui cerere a așteptat max_wait secunde. compute_batch
+    primește lista de payload-uri și returnează, în ordine, rezultatul sau excepția fiecăreia
+    (vezi Main.compute_recipe_ids_batch, care scorează tot lotul cu un singur produs matrice-matrice).
+
+    Un lot mai mare înseamnă mai puțin timp CPU per cerere, dar o așteptare mai lungă pentru
+    prima cerere din lot; stats() raportează mărimea medie a loturilor și așteptarea medie.
+    Folosit doar din bucla asyncio.
+    """
+
+    def __init__(self, compute_batch, max_size=BATCH_SIZE, max_wait=BATCH_WAIT):
+        self.compute_batch = compute_batch
+        self.max_size = max(1, max_size)
+        self.max_wait = max_wait
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+        self.batches = 0
+        self.requests = 0
+        self.full_batches = 0
+        self.wait_seconds = 0.0
+
+    async def submit(self, payload):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((payload, future, time.monotonic()))
+        if len(self._pending) >= self.max_size or self.max_wait <= 0:
+            self._flush(full=len(self._pending) >= self.max_size)
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self, full=False):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        now = time.monotonic()
+        self.batches += 1
+        self.requests += len(batch)
+        self.full_batches += full
+        for _, _, queued_at in batch:
+            self.wait_seconds += now - queued_at
+            REGISTRY.observe('queue_wait_seconds', now - queued_at, queue='batch')
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        try:
+            results = await self.compute_batch([payload for payload, _, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, future, _), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            'batch_size': self.max_size,
+            'batch_wait_ms': self.max_wait * 1000,
+            'batches': self.batches,
+            'full_batches': self.full_batches,
+            'requests': self.requests,
+            'mean_batch_size': self.requests / self.batches if self.batches else 0.0,
+            'mean_wait_ms': self.wait_seconds / self.requests * 1000 if self.requests else 0.0,
+        }
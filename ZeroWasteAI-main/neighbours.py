@@ -0,0 +1,94 @@
+import numpy as np
+
+# Câți vecini păstrăm pentru fiecare rețetă (inclusiv rețeta însăși, cu similaritatea 1)
+NEIGHBOURS = 50
+# Câte valori de similaritate calculăm deodată la construcție (rânduri din bucată x catalog)
+BUILD_CHUNK_CELLS = 1 << 25
+
+
+def build_neighbours(matrix, m=NEIGHBOURS):
+    """
+    Construiește (offline, vezi compile_catalog.py) tabelul cu cei mai similari m vecini ai
+    fiecărei rețete, pe aceleași trăsături ca recomendations (similaritate cosinus = produs
+    scalar, rândurile fiind normalizate L2). Rezultatul e în format CSR: indptr, rândurile
+    vecinilor (în ordinea descrescătoare a similarității) și similaritățile lor.
+    """
+    n_rows = matrix.shape[0]
+    m = min(m, n_rows)
+    matrix = matrix.tocsr()
+    chunk = max(1, BUILD_CHUNK_CELLS // max(n_rows, 1))
+    neighbour_rows = np.zeros((n_rows, m), dtype=np.int32)
+    neighbour_scores = np.zeros((n_rows, m), dtype=np.float32)
+    for start in range(0, n_rows, chunk):
+        # similaritățile unei bucăți cu tot catalogul sunt aproape dense: produsul matrice rară x
+        # bucată densă e de ~3 ori mai rapid decât produsul a două matrice rare
+        similarity = np.asarray(matrix @ matrix[start:start + chunk].T.toarray()).T
+        if m < n_rows:
+            selected = np.argpartition(-similarity, m - 1, axis=1)[:, :m]
+        else:
+            selected = np.broadcast_to(np.arange(n_rows), similarity.shape)
+        scores = np.take_along_axis(similarity, selected, axis=1)
+        order = np.argsort(-scores, axis=1, kind='stable')
+        neighbour_rows[start:start + chunk] = np.take_along_axis(selected, order, axis=1)
+        neighbour_scores[start:start + chunk] = np.take_along_axis(scores, order, axis=1)
+
+    # vecinii cu similaritate 0 nu aduc nimic la scor, deci nu îi păstrăm
+    keep = neighbour_scores > 0
+    return {
+        'neighbour_indptr': np.concatenate([[0], np.cumsum(keep.sum(axis=1))]).astype(np.int64),
+        'neighbour_rows': neighbour_rows[keep],
+        'neighbour_scores': neighbour_scores[keep],
+    }
+
+
+class NeighbourTable:
+    """
+    Tabelul precalculat al vecinilor (vezi build_neighbours), păstrat în catalogul compilat.
+
+    Scorul unei rețete pentru un utilizator este media similarităților ei cu rețetele plăcute,
+    minus media similarităților cu cele respinse, unde similaritățile din afara celor m vecini
+    sunt considerate 0. Costul e O((like-uri + dislike-uri) x m), nu O(like-uri x catalog).
+    """
+
+    def __init__(self, catalog):
+        self.indptr = catalog.neighbour_indptr
+        self.rows = catalog.neighbour_rows
+        self.scores = catalog.neighbour_scores
+
+    def _aggregate(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        total = int(lengths.sum())
+        if not total:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        positions = np.arange(total, dtype=np.int64) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        neighbours, inverse = np.unique(self.rows[positions], return_inverse=True)
+        sums = np.bincount(inverse, weights=self.scores[positions], minlength=len(neighbours))
+        return neighbours.astype(np.int64), sums / len(rows)
+
+    def score_candidates(self, candidate_rows, liked_rows, disliked_rows=()):
+        """
+        Scorurile candidaților (în ordinea din candidate_rows), float32 ca în scorer.score_candidates.
+        """
+        candidate_rows = np.asarray(candidate_rows, dtype=np.int64)
+        scores = np.zeros(len(candidate_rows), dtype=np.float64)
+        for rows, sign in ((liked_rows, 1.0), (disliked_rows, -1.0)):
+            if not len(rows):
+                continue
+            neighbours, values = self._aggregate(rows)
+            if not len(neighbours):
+                continue
+            found = np.minimum(np.searchsorted(neighbours, candidate_rows), len(neighbours) - 1)
+            hit = neighbours[found] == candidate_rows
+            scores[hit] += sign * values[found[hit]]
+        return scores.astype(np.float32)
+
+
+def get_neighbour_table(catalog):
+    """
+    Tabelul vecinilor, sau None dacă nu a fost construit (compile_catalog.py --neighbours).
+    """
+    if catalog.neighbour_indptr is None:
+        return None
+    return catalog.derived('neighbour_table', NeighbourTable)
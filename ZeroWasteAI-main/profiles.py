@@ -0,0 +1,202 @@
+import asyncio
+import os
+import json
+import sqlite3
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from catalog import get_catalog
+from features import get_recipe_features
+from metrics import REGISTRY
+from scorer import user_profile
+
+PROFILES_PATH = 'Files/profiles.sqlite3'
+
+REGISTRY.counter('profile_updates_total', 'Rating updates received for stored user profiles, by outcome.')
+
+
+class StaleProfileError(Exception):
+    """
+    Profilul stocat lipsește sau e mai vechi decât versiunea din cerere; backend-ul retrimite
+    cererea cu toate rating-urile (vezi ws_client.RecommendationClient._handle).
+    """
+
+    def __init__(self, email, version):
+        super().__init__(f"Stored profile for {email} is older than version {version}")
+        self.email = email
+        self.version = version
+
+
+class StoredProfile(namedtuple('StoredProfile', 'version liked disliked indices values count')):
+    """
+    Profilul persistat al unui utilizator: id-urile rețetelor plăcute/respinse și suma (rară)
+    a rândurilor de trăsături ale celor plăcute, împreună cu numărul lor.
+    """
+
+    def vector(self, features, liked_rows):
+        """
+        Profilul restrâns la liked_rows (rețetele plăcute rămase candidate după filtre), ca
+        scorer.user_profile: din suma stocată scădem doar rândurile plăcute eliminate de filtre.
+        """
+        liked_rows = np.asarray(liked_rows, dtype=np.int64)
+        if len(liked_rows) == self.count:
+            excluded = np.zeros(0, dtype=np.int64)
+        else:
+            excluded = np.setdiff1d(get_catalog().rows_for_ids(self.liked), liked_rows)
+        if not len(liked_rows) or len(excluded) >= len(liked_rows):
+            return user_profile(features, liked_rows)
+        total = np.zeros(features.n_features, dtype=np.float64)
+        total[self.indices] = self.values
+        if len(excluded):
+            total -= np.asarray(features.matrix[excluded].sum(axis=0)).ravel()
+        return (total / len(liked_rows)).astype(np.float32)
+
+
+def _row_sum(features, rows):
+    """
+    Suma rândurilor date, ca vector rar: (indici sortați, valori).
+    """
+    total = features.matrix[np.asarray(rows, dtype=np.int64)].sum(axis=0).A1 if len(rows) else np.zeros(0)
+    indices = np.flatnonzero(total)
+    return indices.astype(np.int32), total[indices]
+
+
+def _add_row(indices, values, features, row, sign):
+    start, end = features.matrix.indptr[row], features.matrix.indptr[row + 1]
+    merged, inverse = np.unique(np.concatenate([indices, features.matrix.indices[start:end]]), return_inverse=True)
+    sums = np.bincount(inverse, weights=np.concatenate([values, sign * features.matrix.data[start:end]]),
+                       minlength=len(merged))
+    # o rețetă scoasă din profil lasă în urmă doar erori de rotunjire
+    keep = np.abs(sums) > 1e-9
+    return merged[keep].astype(np.int32), sums[keep]
+
+
+class ProfileStore:
+    """
+    Profilurile utilizatorilor, persistate într-o bază SQLite și actualizate incremental la
+    fiecare rating (mesajele 'rating' trimise de RateRecipeView): o rețetă plăcută adaugă
+    rândul ei de trăsături la sumă, una scoasă din like-uri îl scade.
+
+    Fiecare schimbare are o versiune (User.profile_version din backend). Dacă o actualizare
+    lipsește (worker deconectat), profilul e șters, iar următoarea cerere primește
+    StaleProfileError și backend-ul o retrimite cu toate rating-urile (vezi rebuild).
+    Suma depinde de catalog: la schimbarea versiunii lui e recalculată din id-uri.
+    Din bucla asyncio metodele se apelează prin run, care le execută pe rând în thread-ul
+    store-ului: commit-ul SQLite (fsync) nu blochează bucla, iar ordinea mesajelor se păstrează.
+    """
+
+    def __init__(self, path=PROFILES_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # un singur thread: operațiile nu se suprapun, deci conexiunea poate fi folosită din el
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='profiles')
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS profiles (email TEXT PRIMARY KEY, version INTEGER NOT NULL, '
+            'catalog_version TEXT NOT NULL, liked TEXT NOT NULL, disliked TEXT NOT NULL, '
+            'sum_indices BLOB NOT NULL, sum_values BLOB NOT NULL, liked_count INTEGER NOT NULL)')
+        self._db.commit()
+
+    async def run(self, function, *args):
+        """
+        Execută function(*args) (de ex. self.resolve, self.apply_rating) în thread-ul store-ului.
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._db.close()
+
+    def _load(self, email):
+        row = self._db.execute('SELECT version, catalog_version, liked, disliked, sum_indices, sum_values, liked_count '
+                               'FROM profiles WHERE email = ?', (email,)).fetchone()
+        if row is None:
+            return None
+        version, catalog_version, liked, disliked, indices, values, count = row
+        profile = StoredProfile(version, json.loads(liked), json.loads(disliked),
+                                np.frombuffer(indices, dtype=np.int32), np.frombuffer(values, dtype=np.float64), count)
+        if catalog_version != get_catalog().version:
+            profile = self._save(email, version, profile.liked, profile.disliked)
+        return profile
+
+    def _save(self, email, version, liked, disliked, indices=None, values=None):
+        catalog = get_catalog()
+        liked, disliked = sorted(set(liked)), sorted(set(disliked))
+        liked_rows = catalog.rows_for_ids(liked)
+        if indices is None:
+            indices, values = _row_sum(get_recipe_features(catalog), liked_rows)
+        self._db.execute('INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         (email, version, catalog.version, json.dumps(liked), json.dumps(disliked),
+                          np.asarray(indices, dtype=np.int32).tobytes(), np.asarray(values, dtype=np.float64).tobytes(),
+                          len(liked_rows)))
+        self._db.commit()
+        return StoredProfile(version, liked, disliked, np.asarray(indices, dtype=np.int32),
+                             np.asarray(values, dtype=np.float64), len(liked_rows))
+
+    def rebuild(self, email, version, liked, disliked):
+        """
+        Recalculează profilul din listele complete de rating-uri.
+        """
+        return self._save(email, version, liked, disliked)
+
+    def get(self, email, version):
+        """
+        Profilul stocat, dacă este la versiunea cerută; altfel StaleProfileError.
+        """
+        profile = self._load(email)
+        if profile is None or profile.version < version:
+            raise StaleProfileError(email, version)
+        return profile
+
+    def apply_rating(self, payload):
+        """
+        Aplică un mesaj 'rating': {'email', 'Recipe', 'Rating' (true, false sau null la ștergere), 'Profile Version'}.
+        """
+        email, recipe_id, rating, version = payload['email'], payload['Recipe'], payload['Rating'], payload['Profile Version']
+        profile = self._load(email)
+        if profile is None:
+            outcome = 'unknown'
+        elif version <= profile.version:
+            outcome = 'duplicate'
+        elif version != profile.version + 1:
+            self._db.execute('DELETE FROM profiles WHERE email = ?', (email,))
+            self._db.commit()
+            outcome = 'gap'
+        else:
+            liked, disliked = set(profile.liked), set(profile.disliked)
+            indices, values = profile.indices, profile.values
+            features = get_recipe_features(get_catalog())
+            rows = get_catalog().rows_for_ids([recipe_id])
+            if recipe_id in liked and rating is not True:
+                liked.discard(recipe_id)
+                for row in rows:
+                    indices, values = _add_row(indices, values, features, row, -1.0)
+            elif recipe_id not in liked and rating is True:
+                liked.add(recipe_id)
+                for row in rows:
+                    indices, values = _add_row(indices, values, features, row, 1.0)
+            if rating is False:
+                disliked.add(recipe_id)
+            else:
+                disliked.discard(recipe_id)
+            self._save(email, version, liked, disliked, indices, values)
+            outcome = 'applied'
+        REGISTRY.observe('profile_updates_total', 1, outcome=outcome)
+
+    def resolve(self, payload):
+        """
+        Completează o cerere care poartă doar versiunea profilului cu rating-urile și profilul
+        stocat ('Profile'). O cerere cu rating-urile complete reconstruiește profilul.
+        Cererile fără 'Profile Version' rămân neschimbate.
+        """
+        version = payload.get('Profile Version')
+        if version is None:
+            return payload
+        if 'Liked Recipes' in payload:
+            profile = self.rebuild(payload['email'], version, payload['Liked Recipes'], payload.get('Disliked Recipes') or [])
+        else:
+            profile = self.get(payload['email'], version)
+        return {**payload, 'Liked Recipes': profile.liked, 'Disliked Recipes': profile.disliked, 'Profile': profile}
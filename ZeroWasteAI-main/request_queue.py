@@ -0,0 +1,144 @@
+import asyncio
+import time
+from collections import deque
+
+from metrics import REGISTRY
+
+# Câte cereri pot aștepta cel mult în coadă și cât timp (secunde) mai merită calculate
+MAX_QUEUED = 1000
+QUEUE_DEADLINE = 30.0
+# Prioritatea după 'Request Type' (mai mic = mai urgent): prima încărcare a listei de rețete
+# (RecipeListView) trece înaintea reîmprospătărilor (RefreshRecipeView)
+PRIORITIES = {'list': 0, 'refresh': 1}
+DEFAULT_PRIORITY = 0
+SHED_REASONS = ('superseded', 'overflow', 'expired')
+STATS_COUNTERS = tuple(f'shed_{reason}' for reason in SHED_REASONS)
+
+REGISTRY.counter('shed_total', 'Requests dropped from the request queue, by reason.')
+
+
+class RequestQueue:
+    """
+    Coada mărginită a cererilor primite de worker, cu priorități.
+
+    - o cerere nouă pentru același email o înlocuiește pe cea din coadă (care nu mai e dorită),
+      cu prioritatea mai mare dintre ele; la aceeași prioritate, îi ia și locul (cererile de
+      continuare a clasamentului se înlocuiesc doar între ele);
+    - peste max_size cereri, e aruncată cea mai veche cerere cu prioritatea cea mai mică;
+    - cererile care au așteptat mai mult de deadline secunde sunt aruncate la scoatere.
+
+    Pentru fiecare cerere aruncată e apelat on_shed(payload, motiv), ca backend-ul să confirme
+    job-ul și, dacă nu a fost doar înlocuită, să anunțe utilizatorul (vezi ws_client.RecommendationClient).
+    Folosită doar din bucla asyncio.
+    """
+
+    def __init__(self, max_size=MAX_QUEUED, deadline=QUEUE_DEADLINE, on_shed=None):
+        self.max_size = max(1, max_size)
+        self.deadline = deadline
+        self.on_shed = on_shed
+        # o coadă FIFO per prioritate; intrările înlocuite sunt marcate și sărite la scoatere
+        self._queues = [deque() for _ in range(max(PRIORITIES.values()) + 1)]
+        self._by_email = {}
+        self._size = 0
+        self._ready = asyncio.Event()
+        self._closed = False
+        self.shed = dict.fromkeys(SHED_REASONS, 0)
+
+    def __len__(self):
+        return self._size
+
+    def put(self, payload):
+        priority = PRIORITIES.get(payload.get('Request Type'), DEFAULT_PRIORITY)
+        email = payload.get('email')
+        if email is not None and payload.get('Continuation'):
+            # continuarea clasamentului nu înlocuiește o cerere de listă nouă (și nici invers)
+            email = (email, 'continuation')
+        now = time.monotonic()
+        previous = self._by_email.get(email) if email is not None else None
+        if previous is not None:
+            self._record_shed('superseded')
+            if self.on_shed is not None:
+                self.on_shed(previous[3], 'superseded')
+            if priority >= previous[0]:
+                # cererea nouă ia locul celei vechi în coadă; termenul curge de la cea nouă
+                previous[1], previous[3] = now, payload
+                self._ready.set()
+                return
+            self._forget(previous)
+        # [prioritate, momentul intrării, email, payload]; payload None = intrare scoasă
+        entry = [priority, now, email, payload]
+        self._queues[priority].append(entry)
+        if email is not None:
+            self._by_email[email] = entry
+        self._size += 1
+        while self._size > self.max_size:
+            self._evict()
+        self._ready.set()
+
+    def _evict(self):
+        for queue in reversed(self._queues):
+            while queue:
+                entry = queue.popleft()
+                if entry[3] is not None:
+                    self._drop(entry, 'overflow')
+                    return
+
+    def _drop(self, entry, reason):
+        payload = entry[3]
+        self._forget(entry)
+        self._record_shed(reason)
+        if self.on_shed is not None:
+            self.on_shed(payload, reason)
+
+    def _forget(self, entry):
+        if self._by_email.get(entry[2]) is entry:
+            del self._by_email[entry[2]]
+        entry[3] = None
+        self._size -= 1
+
+    def _record_shed(self, reason):
+        self.shed[reason] += 1
+        REGISTRY.observe('shed_total', 1, reason=reason)
+
+    def _pop(self):
+        now = time.monotonic()
+        for queue in self._queues:
+            while queue:
+                entry = queue.popleft()
+                if entry[3] is None:
+                    continue
+                if now - entry[1] > self.deadline:
+                    self._drop(entry, 'expired')
+                    continue
+                payload = entry[3]
+                self._forget(entry)
+                REGISTRY.observe('queue_wait_seconds', now - entry[1], queue='requests')
+                return payload
+        return None
+
+    async def get(self):
+        """
+        Următoarea cerere (cea mai urgentă, apoi cea mai veche), sau None după close() când coada e goală.
+        """
+        while True:
+            payload = self._pop()
+            if payload is not None:
+                return payload
+            if self._closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+
+    def close(self):
+        """
+        Nu mai sunt așteptate cereri noi; get() golește coada, apoi returnează None.
+        """
+        self._closed = True
+        self._ready.set()
+
+    def stats(self):
+        return {
+            'queued': self._size,
+            'max_queued': self.max_size,
+            **{f'shed_{reason}': count for reason, count in self.shed.items()},
+        }
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+
+from catalog import get_catalog
+
+RESULT_CACHE_SIZE = 10000
+RESULT_CACHE_TTL = 300.0
+STATS_COUNTERS = ('hits', 'misses', 'coalesced')
+
+# Câmpurile care sunt mulțimi pentru calcul: ordinea lor nu schimbă rezultatul.
+# Ordinea produselor care expiră dă prioritatea, deci rămâne cum a venit.
+# Duplicatele din Liked Recipes contează (media profilului), deci doar sortăm.
+UNORDERED_FIELDS = ('Allergens', 'Preferences', 'Liked Recipes', 'Disliked Recipes')
+# Câmpurile care nu schimbă rezultatul: profilul stocat e determinat de Liked Recipes
+# (vezi profiles.ProfileStore.resolve), deci utilizatori diferiți cu aceleași rating-uri împart
+# rezultatul, Request Type dă doar prioritatea în coadă (vezi request_queue.py), iar Job
+# doar identifică cererea pentru confirmarea din backend
+IGNORED_FIELDS = ('email', 'Profile Version', 'Profile', 'Request Type', 'Job')
+
+
+def payload_key(payload):
+    """
+    Cheia canonică a unei cereri: payload-ul fără email și profil, cu câmpurile neordonate sortate.
+    """
+    canonical = {}
+    for field, value in payload.items():
+        if field in IGNORED_FIELDS:
+            continue
+        if field in UNORDERED_FIELDS and isinstance(value, list):
+            value = sorted(value, key=json.dumps)
+        canonical[field] = value
+    return json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+
+
+def _freeze(result):
+    # un segment (cerere cu 'Limit') e un dict cu Offset, Total și Continuation; id-urile rămân tuplu
+    if isinstance(result, dict):
+        return {**result, 'recipe_ids': tuple(result['recipe_ids'])}
+    return tuple(result)
+
+
+def _thaw(result):
+    # fiecare apelant primește propria copie, ca să nu poată modifica intrarea din cache
+    if isinstance(result, dict):
+        return {**result, 'recipe_ids': list(result['recipe_ids'])}
+    return list(result)
+
+
+class ResultCache:
+    """
+    Memoizează listele de id-uri recomandate (sau segmentele lor, pentru cererile cu 'Limit',
+    care intră în cheie împreună cu 'Continuation') după cheia canonică a payload-ului (vezi payload_key).
+
+    Intrările expiră după ttl secunde și sunt invalidate toate când se schimbă versiunea
+    catalogului; peste max_size sunt eliminate cele mai vechi folosite (LRU). Cererile identice
+    care sosesc cât timp prima e încă în calcul așteaptă același rezultat în loc să îl recalculeze.
+    Folosit doar din bucla asyncio, deci nu are nevoie de lock-uri.
+    """
+
+    def __init__(self, compute, max_size=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL, catalog_version=None):
+        self.compute = compute
+        self.max_size = max_size
+        self.ttl = ttl
+        self.catalog_version = catalog_version or (lambda: get_catalog().version)
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _check_version(self):
+        version = self.catalog_version()
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+        return version
+
+    async def get(self, payload):
+        version = self._check_version()
+        key = (version, payload_key(payload))
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            result, expires_at = entry
+            if time.monotonic() < expires_at:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return _thaw(result)
+            del self._entries[key]
+
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return _thaw(await asyncio.shield(pending))
+
+        self.misses += 1
+        pending = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = pending
+        try:
+            result = _freeze(await self.compute(payload))
+        except asyncio.CancelledError:
+            pending.cancel()
+            raise
+        except Exception as e:
+            pending.set_exception(e)
+            # excepția e raportată de fiecare cerere; fără apelanți în așteptare nu o mai semnalăm din nou
+            pending.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+        pending.set_result(result)
+
+        # catalogul s-a putut schimba cât timp am calculat; rezultatul e păstrat doar pentru versiunea cu care a fost calculat
+        if self.max_size and self._check_version() == version:
+            self._entries[key] = (result, time.monotonic() + self.ttl)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return _thaw(result)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'entries': len(self._entries),
+            'in_flight': len(self._in_flight),
+        }
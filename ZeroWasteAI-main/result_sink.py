@@ -0,0 +1,119 @@
+import json
+import pickle
+import struct
+import time
+import uuid
+
+import numpy as np
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+from metrics import REGISTRY
+
+# Cât timp rămâne lista în cache-ul backend-ului (ca în recipe_requests.handle_worker_reply)
+RESULT_TTL = 3600
+# Canalul pub/sub ascultat de `manage.py listen_recipe_results` din backend
+RESULTS_CHANNEL = 'recipe_results_ready'
+
+# Formatul listelor din cache (api/ranked_ids.py din backend): antet b'RI', formatul, un octet
+# liber și numărul de id-uri; apoi fie id-urile uint32 little endian (packed), fie câte un offset
+# uint32 pe bloc de RANKED_IDS_BLOCK id-uri, urmat de diferențele zigzag varint față de id-ul
+# anterior, reluate de la 0 la fiecare bloc (varint)
+RANKED_IDS_HEADER = struct.Struct('<2sBxI')
+RANKED_IDS_PACKED = 1
+RANKED_IDS_VARINT = 2
+RANKED_IDS_BLOCK = 64
+
+REGISTRY.counter('result_sink_writes_total', 'Results written straight to the backend cache, by outcome.')
+
+
+def _encode_varint(ids):
+    if not len(ids):
+        return b''
+    previous = np.concatenate([[0], ids[:-1]])
+    previous[::RANKED_IDS_BLOCK] = 0
+    delta = ids - previous
+    zigzag = ((delta << 1) ^ (delta >> 63)).astype(np.uint64)
+    lengths = 1 + sum((zigzag >= 1 << (7 * k)).astype(np.int64) for k in range(1, 5))
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    stream = np.zeros(int(lengths.sum()), dtype=np.uint8)
+    for k in range(5):
+        present = lengths > k
+        more = np.where(lengths[present] > k + 1, 0x80, 0)
+        stream[starts[present] + k] = ((zigzag[present] >> np.uint64(7 * k)) & np.uint64(0x7f)).astype(np.uint8) | more
+    return starts[::RANKED_IDS_BLOCK].astype('<u4').tobytes() + stream.tobytes()
+
+
+def encode_ranked_ids(recipe_ids, varint=False):
+    ids = np.asarray(recipe_ids, dtype=np.int64)
+    if varint:
+        return RANKED_IDS_HEADER.pack(b'RI', RANKED_IDS_VARINT, len(ids)) + _encode_varint(ids)
+    return RANKED_IDS_HEADER.pack(b'RI', RANKED_IDS_PACKED, len(ids)) + ids.astype('<u4').tobytes()
+
+
+def django_cache_key(key, key_prefix='', version=1):
+    """
+    Cheia sub care django.core.cache scrie `key` (make_key-ul implicit: prefix:versiune:cheie).
+    """
+    return f'{key_prefix}:{version}:{key}'
+
+
+class CacheResultSink:
+    """
+    Scrie lista de id-uri direct în cache-ul Redis al backend-ului (CACHES['default']), sub
+    recepies_{email}, cum ar scrie-o api.ranked_ids.set_ranked_ids: id-urile împachetate uint32
+    (sau, cu varint=True, în forma delta+varint, mai mică), serializate cu pickle ca în
+    RedisSerializer din Django. Scrierea și anunțul pe canalul pub/sub (email și Job, ca
+    backend-ul să confirme job-ul și să anunțe utilizatorul) merg într-un singur drum până la
+    Redis, fără să mai treacă prin PythonScriptConsumer.
+
+    Cheile listei sunt scrise într-o singură tranzacție MULTI, ca primul segment din
+    api.ranked_ids.set_segment: un segment următor adăugat de backend între timp urmărește
+    (WATCH) lista, deci tranzacția lui eșuează și nu poate scrie înapoi id-urile citite
+    înaintea acestei liste.
+
+    Dacă Redis nu răspunde, write returnează False și clientul trimite rezultatul pe calea
+    obișnuită (mesajul 'run').
+    """
+
+    def __init__(self, url, key_prefix='', version=1, ttl=RESULT_TTL, channel=RESULTS_CHANNEL, varint=False):
+        self.redis = redis.from_url(url)
+        self.varint = varint
+        self.key_prefix = key_prefix
+        self.version = version
+        self.ttl = ttl
+        self.channel = channel
+
+    async def write(self, email, recipe_ids, job=None, continuation=None, total=None):
+        """
+        Scrie lista (primul segment, pentru o cerere cu 'Limit') și, dacă mai urmează segmente,
+        token-ul și numărul total de candidați sub recepies_next_{email}, ca api.ranked_ids.set_segment.
+        """
+        start = time.perf_counter()
+        value = pickle.dumps(encode_ranked_ids(recipe_ids, self.varint), pickle.HIGHEST_PROTOCOL)
+        next_key = django_cache_key(f'recepies_next_{email}', self.key_prefix, self.version)
+        next_value = pickle.dumps({'Continuation': continuation, 'Total': total}, pickle.HIGHEST_PROTOCOL)
+        # o listă nouă are o generație nouă (recepies_generation_{email}, vezi api.ranked_ids.exclude)
+        generation = pickle.dumps(uuid.uuid4().hex, pickle.HIGHEST_PROTOCOL)
+        notice = json.dumps({'email': email, 'Job': job, 'count': len(recipe_ids)})
+        REGISTRY.observe('stage_seconds', time.perf_counter() - start, stage='serialize')
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.set(django_cache_key(f'recepies_{email}', self.key_prefix, self.version), value, ex=self.ttl)
+                pipe.set(django_cache_key(f'recepies_generation_{email}', self.key_prefix, self.version), generation,
+                         ex=self.ttl)
+                if continuation:
+                    pipe.set(next_key, next_value, ex=self.ttl)
+                else:
+                    pipe.delete(next_key)
+                pipe.publish(self.channel, notice)
+                await pipe.execute()
+        except (OSError, RedisError) as e:
+            print(f"Error writing result for {email} to the cache, sending it instead: {e}")
+            REGISTRY.observe('result_sink_writes_total', 1, outcome='error')
+            return False
+        REGISTRY.observe('result_sink_writes_total', 1, outcome='ok')
+        return True
+
+    async def close(self):
+        await self.redis.aclose()
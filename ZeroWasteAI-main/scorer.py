@@ -0,0 +1,112 @@
+import numpy as np
+
+# Ponderile implicite ale scorului combinat (vezi combined_scores): doar similaritatea, iar
+# potrivirile cu produsele care expiră departajează rețetele la egalitate
+SIMILARITY_WEIGHT = 1.0
+EXPIRING_WEIGHT = 0.0
+
+
+def user_profile(features, liked_rows):
+    """
+    Vectorul de profil al utilizatorului: media rândurilor (normalizate) ale rețetelor plăcute.
+    Media similarităților cosinus față de rețetele plăcute este exact produsul scalar cu acest vector.
+    """
+    liked_rows = np.asarray(liked_rows)
+    if not len(liked_rows):
+        return np.zeros(features.n_features, dtype=np.float32)
+    return np.asarray(features.matrix[liked_rows].mean(axis=0), dtype=np.float32).ravel()
+
+
+def score_candidates(features, candidate_rows, profile):
+    """
+    Similaritatea fiecărui candidat cu profilul: un singur produs matrice rară - vector.
+    """
+    if len(candidate_rows) * 2 < features.matrix.shape[0]:
+        return features.matrix[candidate_rows] @ profile
+    # când candidații sunt majoritatea catalogului, e mai ieftin să nu copiem sub-matricea
+    return (features.matrix @ profile)[candidate_rows]
+
+
+def score_batch(features, candidate_rows_list, profiles):
+    """
+    Scorurile mai multor utilizatori deodată: profilurile sunt stivuite într-o matrice densă
+    și înmulțite cu matricea rară a catalogului într-un singur produs matrice-matrice.
+    Returnează, pentru fiecare utilizator, scorurile candidaților lui (ca score_candidates).
+    """
+    if not len(profiles):
+        return []
+    candidate_rows_list = [np.asarray(rows, dtype=np.int64) for rows in candidate_rows_list]
+    stacked = np.ascontiguousarray(np.vstack(profiles).T, dtype=np.float32)
+    rows = np.unique(np.concatenate(candidate_rows_list))
+    if len(rows) * 2 < features.matrix.shape[0]:
+        scores = features.matrix[rows] @ stacked
+        positions = [np.searchsorted(rows, candidate_rows) for candidate_rows in candidate_rows_list]
+    else:
+        scores = features.matrix @ stacked
+        positions = candidate_rows_list
+    return [scores[position, user] for user, position in enumerate(positions)]
+
+
+def top_k(scores, k=None):
+    """
+    Pozițiile celor mai mari k scoruri, în ordine descrescătoare (toate, dacă k lipsește).
+    Folosește selecție parțială (argpartition), apoi sortează doar cele k poziții alese.
+    """
+    scores = np.asarray(scores)
+    if k is None or k >= len(scores):
+        return np.argsort(-scores, kind='stable')
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    selected = np.argpartition(-scores, k - 1)[:k]
+    return selected[np.argsort(-scores[selected], kind='stable')]
+
+
+def combined_scores(similarity, match_count, n_products, similarity_weight=SIMILARITY_WEIGHT,
+                    expiring_weight=EXPIRING_WEIGHT):
+    """
+    Scorul combinat al candidaților: similaritatea (None dacă utilizatorul nu are like-uri) plus
+    fracțiunea din produsele care expiră pe care le folosește rețeta, cu ponderile date.
+    """
+    combined = np.zeros(len(match_count), dtype=np.float64)
+    if similarity is not None and similarity_weight:
+        combined += similarity_weight * np.asarray(similarity, dtype=np.float64)
+    if expiring_weight and n_products:
+        combined += expiring_weight * (np.asarray(match_count, dtype=np.float64) / n_products)
+    return combined
+
+
+def fused_order(combined, match_count, priority, k=None):
+    """
+    Ordinea candidaților după scorul combinat, descrescător; la egalitate, după numărul de
+    potriviri cu produsele care expiră (descrescător), apoi după prioritatea lor (crescător),
+    apoi după poziție. Cu ponderile implicite reproduce ordinea veche (sortarea stabilă după
+    Match Count/Priority, urmată de sortarea stabilă după similaritate) doar până la egalitățile
+    și aproape-egalitățile scorurilor float32: acolo ordinea ține de departajare și de rotunjire,
+    nu de similaritate. Scorul nu e redus la float32 (ar crea egalități noi între scoruri
+    apropiate), iar cheile sunt date separat lui np.lexsort, care e stabil, deci egalitățile
+    rămase păstrează poziția. tests/test_scorer.py compară cu ordinea veche și pe similarități
+    egale sau la un ulp distanță (near_ties).
+    Pentru k dat, o singură selecție parțială păstrează candidații cu scorul cel puțin egal cu
+    al k-lea, iar doar aceștia sunt sortați.
+    """
+    combined = np.asarray(combined, dtype=np.float64)
+    match_count = np.asarray(match_count, dtype=np.int64)
+    priority = np.asarray(priority, dtype=np.int64)
+    if k is not None and k < len(combined):
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64)
+        kth = np.partition(-combined, k - 1)[k - 1]
+        # pozițiile selectate rămân crescătoare, deci departajarea după poziție nu se schimbă
+        selected = np.flatnonzero(-combined <= kth)
+        return selected[np.lexsort((priority[selected], -match_count[selected], -combined[selected]))][:k]
+    return np.lexsort((priority, -match_count, -combined))
+
+
+def top_k_similar(features, candidate_rows, liked_rows, k=None):
+    """
+    Cele mai similare k rânduri candidate cu rețetele plăcute; returnează (rânduri, scoruri).
+    """
+    candidate_rows = np.asarray(candidate_rows)
+    scores = score_candidates(features, candidate_rows, user_profile(features, liked_rows))
+    order = top_k(scores, k)
+    return candidate_rows[order], scores[order]
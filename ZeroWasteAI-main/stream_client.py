@@ -0,0 +1,219 @@
+import asyncio
+import inspect
+import json
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError, ResponseError
+
+from metrics import REGISTRY
+from request_queue import MAX_QUEUED, QUEUE_DEADLINE
+from ws_client import MAX_IN_FLIGHT, RecommendationClient, reconnect_delay, worker_name
+
+# Stream-urile din backend (api/websocket_services/job_stream.py)
+JOBS_STREAM = 'recipe_jobs'
+RATINGS_STREAM = 'recipe_ratings'
+RESULTS_STREAM = 'recipe_results'
+GROUP = 'recommenders'
+RESULTS_MAXLEN = 100000
+# Cât așteaptă un XREAD blocant (ms), ca oprirea să fie observată repede
+READ_BLOCK_MS = 1000
+# Un job nerezolvat de atâtea secunde de la livrare e considerat al unui worker căzut și preluat.
+# Trebuie să depășească timpul cât un job poate sta în coada locală (--queue-deadline) plus calculul.
+CLAIM_IDLE = 60.0
+CLAIM_INTERVAL = 10.0
+# Un job livrat de atâtea ori (a căzut fiecare worker care l-a luat) e abandonat ca 'shed'
+MAX_DELIVERIES = 3
+
+REGISTRY.counter('stream_claimed_total', 'Pending jobs taken over from stopped stream consumers, by outcome.')
+
+
+class StreamClient(RecommendationClient):
+    """
+    Alternativa la websocket: joburile vin dintr-un stream Redis citit printr-un consumer group,
+    deci mai multe instanțe Main.py își împart joburile, iar răspunsurile ('run', 'shed',
+    'profile_stale', 'stats') merg în stream-ul de rezultate, citit de backend
+    (manage.py consume_recipe_results). Rating-urile vin dintr-un stream citit de toți worker-ii.
+
+    Un job rămâne în lista de pending a grupului până când răspunsul lui e scris: răspunsul și
+    XACK-ul merg în aceeași tranzacție (MULTI). Joburile unui worker oprit sau căzut sunt
+    preluate de ceilalți după CLAIM_IDLE secunde (XPENDING + XCLAIM), iar la repornirea cu același
+    nume de consumer, worker-ul își reia întâi joburile proprii.
+    Restul (coada cu priorități, calculul, 'shed') e cel din RecommendationClient; 'Job' este id-ul
+    intrării din stream.
+    """
+
+    def __init__(self, url, compute, max_in_flight=MAX_IN_FLIGHT, handlers=None, max_queued=MAX_QUEUED,
+                 queue_deadline=QUEUE_DEADLINE, consumer=None, claim_idle=CLAIM_IDLE, sink=None):
+        super().__init__(url, compute, max_in_flight=max_in_flight, handlers=handlers,
+                         max_queued=max_queued, queue_deadline=queue_deadline, sink=sink)
+        self.redis = redis.from_url(url)
+        self.consumer = consumer or worker_name()
+        self.claim_idle = claim_idle
+        # joburile citite de acest consumer și încă neconfirmate
+        self._jobs = set()
+
+    async def run(self, stop_event):
+        """
+        Rulează până la setarea stop_event, reîncercând după erorile Redis.
+        La oprire nu mai citește joburi noi, dar le duce la capăt pe cele deja citite.
+        """
+        self._stop_event = stop_event
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.max_in_flight)]
+        readers = [asyncio.create_task(self._retry(self._read_jobs)),
+                   asyncio.create_task(self._retry(self._read_ratings)),
+                   asyncio.create_task(self._retry(self._claim_stale))]
+        try:
+            await stop_event.wait()
+            # citirile blocante se termină în cel mult READ_BLOCK_MS
+            await asyncio.gather(*readers)
+        finally:
+            for reader in readers:
+                reader.cancel()
+            await asyncio.gather(*readers, return_exceptions=True)
+            await self._drain()
+            await self.redis.aclose()
+
+    async def _retry(self, loop):
+        attempt = 0
+        while not self._stop_event.is_set():
+            try:
+                await loop()
+                return
+            except (OSError, RedisError) as e:
+                self._connected.clear()
+                delay = reconnect_delay(attempt)
+                attempt += 1
+                print(f"Redis error: {e}. Retrying in {delay:.1f}s...")
+                try:
+                    await asyncio.wait_for(self._stop_event.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _ensure_group(self):
+        try:
+            await self.redis.xgroup_create(JOBS_STREAM, GROUP, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    async def _read_jobs(self):
+        await self._ensure_group()
+        self._connected.set()
+        self.connections += 1
+        # întâi joburile livrate acestui consumer înainte de o repornire (după id, de la început), apoi cele noi
+        last_pending = '0'
+        while not self._stop_event.is_set():
+            # citim doar cât pot începe task-urile libere: restul rămâne în stream pentru ceilalți worker-i
+            free = self.max_in_flight - self._active - len(self.queue)
+            if free <= 0:
+                await asyncio.sleep(0.01)
+                continue
+            response = await self.redis.xreadgroup(GROUP, self.consumer, {JOBS_STREAM: last_pending or '>'},
+                                                   count=free, block=None if last_pending else READ_BLOCK_MS)
+            self._connected.set()
+            entries = [entry for _, stream_entries in response or [] for entry in stream_entries]
+            if last_pending:
+                last_pending = entries[-1][0] if entries else None
+            self._accept(entries)
+
+    def _accept(self, entries):
+        for entry_id, fields in entries:
+            job = entry_id.decode()
+            if job in self._jobs:
+                continue
+            try:
+                payload = json.loads(fields[b'payload'])
+            except (KeyError, ValueError) as e:
+                print(f"Ignoring malformed job {job}: {e}")
+                self._spawn(self.redis.xack(JOBS_STREAM, GROUP, job))
+                continue
+            self._jobs.add(job)
+            self.queue.put({**payload, 'Job': job})
+
+    async def _read_ratings(self):
+        # profilurile detectează rating-urile pierdute după versiune, deci ajunge să citim de acum înainte
+        last_id = '$'
+        while not self._stop_event.is_set():
+            response = await self.redis.xread({RATINGS_STREAM: last_id}, count=100, block=READ_BLOCK_MS)
+            for _, entries in response or []:
+                for entry_id, fields in entries:
+                    last_id = entry_id
+                    handler = self.handlers.get(fields.get(b'type', b'').decode())
+                    if handler is None:
+                        continue
+                    try:
+                        result = handler(json.loads(fields[b'payload']))
+                        if inspect.isawaitable(result):
+                            await result
+                    except Exception as e:
+                        print(f"Error handling rating message: {e}")
+
+    async def _claim_stale(self):
+        while not self._stop_event.is_set():
+            await self._ensure_group()
+            pending = await self.redis.xpending_range(JOBS_STREAM, GROUP, min='-', max='+', count=self.max_in_flight,
+                                                      idle=int(self.claim_idle * 1000))
+            stale = [entry for entry in pending if entry['consumer'].decode() != self.consumer]
+            abandoned = [entry['message_id'] for entry in stale if entry['times_delivered'] >= MAX_DELIVERIES]
+            claimed = [entry['message_id'] for entry in stale if entry['times_delivered'] < MAX_DELIVERIES]
+            if abandoned:
+                entries = await self.redis.xclaim(JOBS_STREAM, GROUP, self.consumer, int(self.claim_idle * 1000), abandoned)
+                for entry_id, fields in entries:
+                    payload = json.loads(fields[b'payload']) if fields else {}
+                    self._jobs.add(entry_id.decode())
+                    self._shed({**payload, 'Job': entry_id.decode()}, 'failed')
+                REGISTRY.observe('stream_claimed_total', len(abandoned), outcome='abandoned')
+            if claimed:
+                entries = await self.redis.xclaim(JOBS_STREAM, GROUP, self.consumer, int(self.claim_idle * 1000), claimed)
+                self._accept(entries)
+                REGISTRY.observe('stream_claimed_total', len(claimed), outcome='claimed')
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=CLAIM_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _stored(self, payload):
+        # rezultatul e deja în cache: doar confirmăm jobul, fără răspuns în stream
+        job = payload.get('Job')
+        if job in self._jobs:
+            try:
+                await self.redis.xack(JOBS_STREAM, GROUP, job)
+            except (OSError, RedisError) as e:
+                # jobul rămâne în pending și va fi recalculat de cine îl preia
+                print(f"Error acknowledging job {job}: {e}")
+            self._jobs.discard(job)
+
+    async def send(self, message):
+        """
+        Scrie răspunsul în stream-ul de rezultate; dacă poartă un job citit de acest consumer,
+        îl confirmă în aceeași tranzacție. Reîncearcă după erorile Redis până la oprire.
+        Returnează dacă răspunsul a fost scris.
+        """
+        job = message.get('payload', {}).get('Job')
+        fields = {'type': message['type'], 'payload': json.dumps(message['payload'])}
+        attempt = 0
+        while True:
+            try:
+                async with self.redis.pipeline(transaction=True) as pipe:
+                    pipe.xadd(RESULTS_STREAM, fields, maxlen=RESULTS_MAXLEN, approximate=True)
+                    if job in self._jobs:
+                        pipe.xack(JOBS_STREAM, GROUP, job)
+                    await pipe.execute()
+                self._jobs.discard(job)
+                return True
+            except (OSError, RedisError) as e:
+                if self._stop_event.is_set():
+                    # jobul rămâne în pending și e preluat de alt worker
+                    print(f"Client stopped, dropping a message: {e}")
+                    return False
+                delay = reconnect_delay(attempt)
+                attempt += 1
+                print(f"Error writing to {RESULTS_STREAM}, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+
+    def stats(self):
+        return {
+            **super().stats(),
+            'consumer': self.consumer,
+            'jobs_held': len(self._jobs),
+        }
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Modulele worker-ului se importă ca în Main.py, din directorul ZeroWasteAI-main
+sys.path.insert(0, ROOT)
+
+from catalog import CATALOG_PATH, CATALOG_SHEET, RecipeCatalog  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def source_frame():
+    """
+    Foaia AI a catalogului real, citită o singură dată.
+    """
+    return pd.read_excel(os.path.join(ROOT, CATALOG_PATH), sheet_name=CATALOG_SHEET)
+
+
+@pytest.fixture(scope='session')
+def catalog(source_frame):
+    return RecipeCatalog.from_frame(source_frame, 'test')
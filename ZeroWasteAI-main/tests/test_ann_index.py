@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from ann_index import ANN_TABLES, LSHIndex, build_lsh
+from bitset_index import BitsetIndex
+from catalog import RecipeCatalog
+from features import get_recipe_features
+from scorer import score_candidates, top_k, user_profile
+from test_bitset_index import random_filters
+
+K = 20
+# recall-ul minim al celor K rezultate față de scorarea exactă, pe raza căutării
+# (măsurat pe catalogul real cu 8 tabele: ~0.52, ~0.92 și ~1.0)
+MIN_RECALL = {0: 0.4, 1: 0.85, 2: 0.97}
+
+
+@pytest.fixture(scope='module')
+def index(catalog):
+    # o copie, ca tabelele LSH să nu ajungă în catalogul folosit de celelalte teste
+    copy = RecipeCatalog(catalog.version, catalog.allergen_columns, catalog.preference_columns,
+                         catalog.type_labels, **{name: getattr(catalog, name)
+                                                 for name in RecipeCatalog.STRING_COLUMNS + RecipeCatalog.ARRAY_COLUMNS})
+    for name, array in build_lsh(get_recipe_features(copy).matrix, ANN_TABLES).items():
+        setattr(copy, name, array)
+    return LSHIndex(copy)
+
+
+def queries(catalog, features, count, seed=0):
+    rng = np.random.default_rng(seed)
+    bitsets = BitsetIndex(catalog)
+    while count:
+        rows = bitsets.candidate_rows(*random_filters(rng, catalog))
+        if len(rows) < 4 * K:
+            continue
+        liked_rows = rng.choice(rows, size=int(rng.integers(1, 10)), replace=False)
+        yield rows, user_profile(features, liked_rows)
+        count -= 1
+
+
+@pytest.mark.parametrize('radius', sorted(MIN_RECALL))
+def test_recall_against_exact_scorer(catalog, index, radius):
+    # copia catalogului are propriul spațiu de trăsături: profilurile sunt calculate în el
+    features = index.features
+    recalls = []
+    for rows, profile in queries(catalog, features, 50):
+        positions, scores = index.search(profile, rows, K, radius)
+        exact = score_candidates(features, rows, profile)
+        expected = top_k(exact, K)
+        assert len(positions) == K
+        # scorurile întoarse sunt cele exacte, în ordine descrescătoare
+        np.testing.assert_array_equal(scores, exact[positions])
+        assert np.all(np.diff(scores) <= 0)
+        recalls.append(len(np.intersect1d(positions, expected)) / K)
+    assert np.mean(recalls) >= MIN_RECALL[radius]
+
+
+def test_probed_positions_do_not_need_sorted_candidates(catalog, index):
+    rng = np.random.default_rng(1)
+    for rows, profile in queries(catalog, index.features, 20, seed=1):
+        probed = index.nearby_rows(profile)
+        expected = np.flatnonzero(np.isin(rows, probed))
+        assert np.array_equal(index._probed_positions(profile, rows, 1, None), expected)
+        shuffled = rng.permutation(rows)
+        assert np.array_equal(index._probed_positions(profile, shuffled, 1, None), np.flatnonzero(np.isin(shuffled, probed)))
+        assert len(index._probed_positions(profile, rows[:0], 1, None)) == 0
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from bitset_index import BitsetIndex, bitset_count, bitset_rows, pack_mask
+from catalog import ALLERGEN_COLUMNS, PREFERENCE_COLUMNS
+
+
+def pandas_filter(df, user_allergies, user_preferences, user_type, user_difficulty, user_time):
+    # filter_recepies dinaintea bitset-urilor, pe DataFrame
+    allergen_columns = [col for col in df.columns if col in ALLERGEN_COLUMNS]
+    preference_columns = [col for col in df.columns if col in PREFERENCE_COLUMNS]
+    valid_allergies = [allergen for allergen in user_allergies if allergen in allergen_columns]
+    valid_preferences = [preference for preference in user_preferences if preference in preference_columns]
+
+    filtered_recipes = df.copy()
+    for allergen in valid_allergies:
+        filtered_recipes = filtered_recipes[filtered_recipes[allergen] == 0]
+    if valid_preferences:
+        filtered_recipes = filtered_recipes[filtered_recipes[valid_preferences].any(axis=1)]
+    if user_type:
+        filtered_recipes = filtered_recipes[filtered_recipes['Type'].isin(user_type)]
+    if user_difficulty:
+        filtered_recipes = filtered_recipes[filtered_recipes['Difficulty'].isin(user_difficulty)]
+    if user_time is not None:
+        time_limits = {1: 30, 2: 60, 3: 120, 4: 180}
+        if user_time in time_limits:
+            filtered_recipes = filtered_recipes[filtered_recipes['Total time'] <= time_limits[user_time]]
+    return filtered_recipes
+
+
+@pytest.mark.parametrize('length', [0, 1, 63, 64, 65, 130])
+def test_pack_mask_round_trip(length):
+    mask = np.random.default_rng(length).random(length) < 0.4
+    bitset = pack_mask(mask)
+    assert bitset.dtype == np.dtype('<u8')
+    assert bitset_rows(bitset, length).tolist() == np.flatnonzero(mask).tolist()
+    assert bitset_count(bitset) == mask.sum()
+
+
+def random_filters(rng, catalog):
+    def sample(values):
+        return [str(value) for value in rng.choice(values, size=rng.integers(0, 4), replace=False)]
+
+    difficulties = [int(value) for value in np.unique(catalog.difficulty)] + [99]
+    return (
+        sample(ALLERGEN_COLUMNS + ['Unknown']),
+        sample(PREFERENCE_COLUMNS + ['Keto']),
+        sample(catalog.type_labels + ['Brunch']),
+        [int(value) for value in rng.choice(difficulties, size=rng.integers(0, 3), replace=False)],
+        [None, 1, 2, 3, 4, 7][rng.integers(0, 6)],
+    )
+
+
+def test_candidates_match_pandas_filter(source_frame, catalog):
+    index = BitsetIndex(catalog)
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        filters = random_filters(rng, catalog)
+        expected = pandas_filter(source_frame, *filters)['id'].tolist()
+        assert catalog.ids[index.candidate_rows(*filters)].tolist() == expected, filters
+
+
+def test_no_filters_keep_every_recipe(source_frame, catalog):
+    index = BitsetIndex(catalog)
+    assert index.candidate_rows([], [], [], [], None).tolist() == list(range(len(catalog)))
+    assert bitset_count(index.candidates(None, None, None, None, None)) == len(source_frame)
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from ann_index import build_lsh
+from bitset_index import BitsetIndex
+from catalog import RecipeCatalog
+from compile_catalog import validate_sheets, write_catalog
+from features import RecipeFeatures
+from neighbours import build_neighbours
+
+
+@pytest.fixture(scope='module')
+def compiled(catalog):
+    # o copie, ca tabelele adăugate să nu ajungă în catalogul folosit de celelalte teste
+    catalog = RecipeCatalog(catalog.version, catalog.allergen_columns, catalog.preference_columns,
+                            catalog.type_labels, **{name: getattr(catalog, name)
+                                                    for name in RecipeCatalog.STRING_COLUMNS + RecipeCatalog.ARRAY_COLUMNS})
+    features = RecipeFeatures(catalog).matrix
+    catalog.feature_indptr, catalog.feature_indices, catalog.feature_data = features.indptr, features.indices, features.data
+    for name, array in {**build_lsh(features, 2), **build_neighbours(features, 5)}.items():
+        setattr(catalog, name, array)
+    return catalog
+
+
+def test_write_and_open_round_trip(tmp_path, compiled):
+    path = tmp_path / 'recipes.catalog'
+    write_catalog(compiled, str(path), {'recipes.xlsx': 'abc'})
+    opened = RecipeCatalog.open(str(path))
+
+    assert opened.version == compiled.version
+    assert len(opened) == len(compiled)
+    assert (opened.allergen_columns, opened.preference_columns, opened.type_labels) == \
+        (compiled.allergen_columns, compiled.preference_columns, compiled.type_labels)
+    for name in RecipeCatalog.ARRAY_COLUMNS + RecipeCatalog.OPTIONAL_ARRAY_COLUMNS:
+        original, mapped = getattr(compiled, name), getattr(opened, name)
+        assert mapped.dtype == np.asarray(original).dtype, name
+        assert np.array_equal(mapped, original), name
+        assert not mapped.flags.writeable, name
+    for name in RecipeCatalog.STRING_COLUMNS:
+        assert getattr(opened, name).tolist() == getattr(compiled, name).tolist(), name
+
+    # structurile derivate dau același rezultat pe coloanele mapate
+    filters = (['Eggs'], ['Vegan', 'Vegetarian'], ['Mains'], [1, 2], 3)
+    assert np.array_equal(BitsetIndex(opened).candidate_rows(*filters), BitsetIndex(compiled).candidate_rows(*filters))
+    assert opened.rows_for_ids(compiled.ids[[5, 0, 42]]).tolist() == [5, 0, 42]
+
+
+def test_optional_columns_may_be_missing(tmp_path, catalog):
+    path = tmp_path / 'recipes.catalog'
+    write_catalog(catalog, str(path))
+    opened = RecipeCatalog.open(str(path))
+    assert opened.feature_indptr is None and opened.neighbour_rows is None
+    assert opened.names.tolist() == catalog.names.tolist()
+
+
+def test_open_rejects_other_files(tmp_path):
+    path = tmp_path / 'recipes.catalog'
+    path.write_bytes(b'NOTACATL' + bytes(8))
+    with pytest.raises(ValueError):
+        RecipeCatalog.open(str(path))
+
+
+def test_validate_sheets_reports_each_problem(source_frame):
+    assert validate_sheets(source_frame, source_frame[['id']]) == []
+
+    broken = source_frame.head(20).copy()
+    broken.loc[1, 'id'] = broken.loc[0, 'id']
+    broken.loc[2, 'Difficulty'] = -1
+    broken.loc[3, 'Ingredients'] = ' '
+    broken['Vegan'] = broken['Vegan'].astype(object)
+    broken.loc[4, 'Vegan'] = 2
+    errors = validate_sheets(broken, broken[['id']].iloc[2:])
+    # rândurile sunt numerotate ca în Excel (antetul e rândul 1)
+    assert errors[:4] == [
+        "Column 'Difficulty' must hold non-negative integers (rows [4]).",
+        f"Duplicate recipe ids: [{broken.loc[0, 'id']}].",
+        "Flag column 'Vegan' must hold 0/1 values (rows [6]).",
+        'Recipes without ingredients (rows [5]).',
+    ]
+    assert errors[4].startswith('Recipe ids differ between sheets') and len(errors) == 5
+
+    assert validate_sheets(broken.drop(columns=['Link'])) == ['Missing columns: Link']
@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+
+import expiring
+from catalog import StringColumn
+from expiring import ExpiringMatcher, get_expiring_matcher
+
+TEXTS = [
+    'Fresh Mozzarella, basil, tomatoes',
+    'mini mozzarella, cherry tomatoes',
+    'mozzarella, mini mozzarella',
+    'brânză de vaci, smântână, mărar',
+    '',
+    'milk, ' + 'flour, ' * 20 + 'butter, eggs, double cream',
+    'Eggs, EGG yolks, egg whites',
+    'minimozzarella',
+]
+
+
+def count_matches_excluding(ingredients, expiring_products):
+    ingredients_lower = ingredients.lower()
+    count = 0
+    for product in expiring_products:
+        if product in ingredients_lower and f'mini {product}' not in ingredients_lower:
+            count += 1
+    return count
+
+
+def highest_priority_match_excluding(ingredients, expiring_products):
+    ingredients_lower = ingredients.lower()
+    for idx, product in enumerate(expiring_products):
+        if product in ingredients_lower and f'mini {product}' not in ingredients_lower:
+            return idx
+    return len(expiring_products)
+
+
+def expected_match(texts, products):
+    # use_expiring_ingredients dinaintea automatului: căutare de subșiruri rând cu rând
+    products = [product.lower() for product in products]
+    return ([count_matches_excluding(text, products) for text in texts],
+            [highest_priority_match_excluding(text, products) for text in texts])
+
+
+def lower_column(texts):
+    return StringColumn.from_strings([text.lower() for text in texts])
+
+
+@pytest.mark.parametrize('products', [
+    ['mozzarella'],
+    ['Mozzarella', 'tomatoes', 'basil'],
+    ['brânză', 'mărar', 'smântână de casă'],
+    ['double cream', 'eggs', 'egg', 'flour'],
+    ['milk', 'milk'],
+    [],
+    ['butter', 'eggs', 'flour, butter'],
+])
+def test_match_follows_substring_rules(products):
+    texts = lower_column(TEXTS)
+    matcher = ExpiringMatcher(products)
+    rows = np.arange(len(TEXTS))
+    match_count, priority = matcher.match(texts, rows)
+    assert (match_count.tolist(), priority.tolist()) == expected_match(TEXTS, products)
+    # cele două căutări dau aceleași tipare, oricare ar fi aleasă
+    assert np.array_equal(matcher.found_patterns(texts, rows), matcher.scan_patterns(texts, rows))
+
+
+def test_mini_product_is_excluded():
+    texts = lower_column(TEXTS)
+    match_count, priority = ExpiringMatcher(['mozzarella', 'tomatoes']).match(texts, np.arange(3))
+    # „mini mozzarella” anulează și mozzarella care apare separat în același text
+    assert match_count.tolist() == [2, 1, 0]
+    assert priority.tolist() == [0, 1, 2]
+
+
+def test_subset_of_rows():
+    texts = lower_column(TEXTS)
+    rows = np.array([6, 0, 3])
+    match_count, priority = ExpiringMatcher(['egg', 'basil']).match(texts, rows)
+    assert (match_count.tolist(), priority.tolist()) == expected_match([TEXTS[row] for row in rows], ['egg', 'basil'])
+
+
+@pytest.mark.parametrize('n_products', [
+    ExpiringMatcher.AUTOMATON_MIN_PATTERNS // 2 - 1,
+    ExpiringMatcher.AUTOMATON_MIN_PATTERNS // 2,
+])
+def test_automaton_threshold(monkeypatch, catalog, n_products):
+    # fiecare produs aduce două tipare: produsul și „mini {produs}”
+    rng = np.random.default_rng(n_products)
+    vocabulary = catalog.phrase_vocabulary.tolist()
+    products = [vocabulary[position] for position in rng.choice(len(vocabulary), size=n_products, replace=False)]
+    matcher = ExpiringMatcher(products)
+    used = []
+    for method in ('found_patterns', 'scan_patterns'):
+        original = getattr(ExpiringMatcher, method)
+        monkeypatch.setattr(ExpiringMatcher, method,
+                            lambda self, *args, method=method, original=original: used.append(method) or original(self, *args))
+
+    rows = np.arange(len(catalog))
+    match_count, priority = matcher.match(catalog.ingredients_lower, rows)
+    automaton = len(matcher.patterns) >= ExpiringMatcher.AUTOMATON_MIN_PATTERNS
+    assert used == ['found_patterns' if automaton else 'scan_patterns']
+    assert automaton == (n_products * 2 >= ExpiringMatcher.AUTOMATON_MIN_PATTERNS)
+    assert (match_count.tolist(), priority.tolist()) == expected_match(catalog.ingredients.tolist(), products)
+
+
+@pytest.mark.parametrize('n_products', [1, 5, 40])
+def test_catalog_matches_substring_rules(catalog, n_products):
+    rng = np.random.default_rng(100 + n_products)
+    words = catalog.word_vocabulary.tolist()
+    products = [words[position] for position in rng.choice(len(words), size=n_products, replace=False)] + ['mozzarella']
+    rows = np.arange(len(catalog))
+    matcher = ExpiringMatcher(products)
+    found = matcher.found_patterns(catalog.ingredients_lower, rows)
+    assert np.array_equal(found, matcher.scan_patterns(catalog.ingredients_lower, rows))
+    match_count, priority = matcher.match(catalog.ingredients_lower, rows)
+    assert (match_count.tolist(), priority.tolist()) == expected_match(catalog.ingredients.tolist(), products)
+
+
+def test_matchers_are_cached_by_product_list(monkeypatch):
+    monkeypatch.setattr(expiring, '_matcher_cache', type(expiring._matcher_cache)())
+    monkeypatch.setattr(expiring, 'MATCHER_CACHE_SIZE', 2)
+    first = get_expiring_matcher(['Milk', 'eggs'])
+    assert get_expiring_matcher(['milk', 'EGGS']) is first
+    get_expiring_matcher(['flour'])
+    get_expiring_matcher(['butter'])
+    assert get_expiring_matcher(['milk', 'eggs']) is not first
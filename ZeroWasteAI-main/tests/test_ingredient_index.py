@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bitset_index import BitsetIndex, bitset_rows
+from catalog import ALLERGEN_COLUMNS, PREFERENCE_COLUMNS, RecipeCatalog
+from ingredient_index import IngredientIndex
+from test_expiring import TEXTS, expected_match
+
+
+def small_catalog(texts):
+    df = pd.DataFrame({
+        'id': np.arange(1, len(texts) + 1) * 10,
+        'Name': [f'Recipe {row}' for row in range(len(texts))],
+        'Link': '',
+        'Difficulty': 1,
+        'Total time': 30,
+        'Type': 'Mains',
+        'Ingredients': texts,
+        **{column: False for column in ALLERGEN_COLUMNS + PREFERENCE_COLUMNS},
+    })
+    return RecipeCatalog.from_frame(df, 'small')
+
+
+@pytest.mark.parametrize('products', [
+    ['mozzarella', 'tomatoes'],
+    ['Mozzarella', 'basil', 'egg'],
+    ['brânză', 'mărar'],
+    ['double cream', 'flour', 'milk', 'milk'],
+    ['flour, butter', 'eggs'],
+    ['nothing here'],
+    [],
+])
+def test_dense_match_follows_substring_rules(products):
+    index = IngredientIndex(small_catalog(TEXTS))
+    match_count, priority = index.dense_match(products, np.arange(len(TEXTS)))
+    assert (match_count.tolist(), priority.tolist()) == expected_match(TEXTS, products)
+
+
+def test_match_returns_only_matching_rows():
+    index = IngredientIndex(small_catalog(TEXTS))
+    rows, match_count, priority = index.match(['mozzarella', 'tomatoes'])
+    # „mini mozzarella” exclude rândurile 1 și 2 pentru mozzarella, iar „minimozzarella” conține produsul
+    assert rows.tolist() == [0, 1, 7]
+    assert match_count.tolist() == [2, 1, 1]
+    assert priority.tolist() == [0, 1, 0]
+
+
+@pytest.mark.parametrize('n_products', [1, 8, 40])
+def test_catalog_matches_substring_rules(catalog, n_products):
+    rng = np.random.default_rng(n_products)
+    phrases = catalog.phrase_vocabulary.tolist()
+    words = catalog.word_vocabulary.tolist()
+    products = ([phrases[position] for position in rng.choice(len(phrases), size=n_products // 2, replace=False)]
+                + [words[position] for position in rng.choice(len(words), size=n_products - n_products // 2, replace=False)]
+                + ['mozzarella'])
+    index = IngredientIndex(catalog)
+    rows = np.arange(len(catalog))
+    match_count, priority = index.dense_match(products, rows)
+    assert (match_count.tolist(), priority.tolist()) == expected_match(catalog.ingredients.tolist(), products)
+    # a doua oară rândurile produselor vin din cache
+    assert [array.tolist() for array in index.dense_match(products, rows)] == [match_count.tolist(), priority.tolist()]
+
+
+@pytest.mark.parametrize('products', [['milk', 'eggs', 'butter'], ['salt, pepper', 'milk']])
+def test_candidates_restrict_rows(catalog, products):
+    index = IngredientIndex(catalog)
+    candidates = BitsetIndex(catalog).candidates(['Milk'], ['Vegetarian'], [], [], None)
+    allowed = bitset_rows(candidates, len(catalog))
+    rows, match_count, priority = index.match(products, candidates)
+
+    expected_count, expected_priority = expected_match([catalog.ingredients[row] for row in allowed], products)
+    matched = [position for position, count in enumerate(expected_count) if count]
+    assert rows.tolist() == [int(allowed[position]) for position in matched]
+    assert match_count.tolist() == [expected_count[position] for position in matched]
+    assert priority.tolist() == [expected_priority[position] for position in matched]
@@ -0,0 +1,29 @@
+from metrics import MetricsRegistry
+from request_queue import RequestQueue
+from result_cache import STATS_COUNTERS, ResultCache
+
+
+def test_monotonic_collector_values_are_counters():
+    registry = MetricsRegistry('test')
+    cache = ResultCache(None, catalog_version=lambda: 1)
+    cache.hits = 3
+    registry.register_collector('result_cache', cache.stats, counters=STATS_COUNTERS)
+    lines = registry.render().splitlines()
+
+    assert '# TYPE test_result_cache_hits_total counter' in lines
+    assert 'test_result_cache_hits_total 3.0' in lines
+    assert '# TYPE test_result_cache_coalesced_total counter' in lines
+    # valorile curente rămân gauge-uri, fără sufix
+    assert '# TYPE test_result_cache_entries gauge' in lines
+    assert not any(line.startswith('test_result_cache_hits ') for line in lines)
+    assert registry.snapshot()['test_result_cache_hits_total'] == 3
+
+
+def test_queue_shed_counts_are_counters():
+    from ws_client import STATS_COUNTERS as CLIENT_STATS_COUNTERS
+    registry = MetricsRegistry('test')
+    registry.register_collector('client', RequestQueue().stats, counters=CLIENT_STATS_COUNTERS)
+    text = registry.render()
+    for reason in ('superseded', 'overflow', 'expired'):
+        assert f'# TYPE test_client_shed_{reason}_total counter' in text
+    assert '# TYPE test_client_queued gauge' in text
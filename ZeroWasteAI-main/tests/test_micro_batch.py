@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from micro_batch import MicroBatcher
+
+
+def recording_compute():
+    batches = []
+
+    async def compute_batch(payloads):
+        batches.append(list(payloads))
+        await asyncio.sleep(0)
+        return [ValueError(payload) if payload < 0 else payload * 10 for payload in payloads]
+
+    return compute_batch, batches
+
+
+def test_full_batches_leave_at_once_and_the_rest_after_max_wait():
+    compute_batch, batches = recording_compute()
+
+    async def scenario():
+        # max_wait lung: doar lotul plin poate pleca înainte ca restul să aștepte
+        batcher = MicroBatcher(compute_batch, max_size=4, max_wait=0.2)
+        tasks = [asyncio.ensure_future(batcher.submit(value)) for value in range(6)]
+        await asyncio.sleep(0.05)
+        early = [task.done() for task in tasks]
+        return batcher, early, await asyncio.gather(*tasks)
+
+    batcher, early, results = asyncio.run(scenario())
+    assert batches == [[0, 1, 2, 3], [4, 5]]
+    assert early == [True] * 4 + [False] * 2
+    assert results == [0, 10, 20, 30, 40, 50]
+    stats = batcher.stats()
+    assert (stats['batches'], stats['full_batches'], stats['requests'], stats['mean_batch_size']) == (2, 1, 6, 3.0)
+    # doar cererile din lotul parțial au așteptat max_wait
+    assert 0.2 * 2 / 6 * 1000 <= stats['mean_wait_ms'] < 0.2 * 1000
+
+
+def test_each_request_gets_its_own_result_or_error():
+    compute_batch, batches = recording_compute()
+
+    async def scenario():
+        batcher = MicroBatcher(compute_batch, max_size=3, max_wait=0.01)
+        return await asyncio.gather(*(batcher.submit(value) for value in (1, -2, 3)), return_exceptions=True)
+
+    first, error, last = asyncio.run(scenario())
+    assert (first, last) == (10, 30)
+    assert isinstance(error, ValueError)
+    assert batches == [[1, -2, 3]]
+
+
+def test_failed_batch_fails_every_request():
+    async def compute_batch(payloads):
+        raise RuntimeError('scoring failed')
+
+    async def scenario():
+        batcher = MicroBatcher(compute_batch, max_size=8, max_wait=0)
+        # max_wait 0: fiecare cerere pleacă singură
+        return batcher, await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+
+    batcher, results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert batcher.stats()['batches'] == 2
+
+
+@pytest.mark.parametrize('max_size', [1, 5])
+def test_batches_never_exceed_max_size(max_size):
+    compute_batch, batches = recording_compute()
+
+    async def scenario():
+        batcher = MicroBatcher(compute_batch, max_size=max_size, max_wait=0.01)
+        return await asyncio.gather(*(batcher.submit(value) for value in range(23)))
+
+    assert asyncio.run(scenario()) == [value * 10 for value in range(23)]
+    assert max(len(batch) for batch in batches) <= max_size
+    assert [value for batch in batches for value in batch] == list(range(23))
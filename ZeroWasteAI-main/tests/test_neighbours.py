@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import Main
+from features import get_recipe_features
+from neighbours import NeighbourTable, build_neighbours
+
+N_RECIPES = 300
+
+
+@pytest.fixture(scope='module')
+def matrix(catalog):
+    return get_recipe_features(catalog).matrix[:N_RECIPES]
+
+
+def similarities(matrix):
+    return (matrix @ matrix.T).toarray()
+
+
+def unambiguous_rows(matrix, m):
+    # rândurile al căror vecin m e strict mai similar decât următorul: primii m vecini sunt unici
+    ranked = -np.sort(-similarities(matrix), axis=1)
+    if m >= ranked.shape[1]:
+        return np.arange(ranked.shape[0])
+    return np.flatnonzero(ranked[:, m - 1] > ranked[:, m])
+
+
+def brute_force(matrix, m, candidate_rows, liked_rows, disliked_rows):
+    # media similarităților cosinus cu rețetele plăcute minus cea cu cele respinse, păstrând din
+    # fiecare rând doar primii m vecini (ceilalți contează 0)
+    similarity = similarities(matrix)
+    if m < similarity.shape[0]:
+        threshold = -np.sort(-similarity, axis=1)[:, m - 1:m]
+        similarity = np.where(similarity >= threshold, similarity, 0.0)
+    scores = similarity[liked_rows].mean(axis=0)[candidate_rows]
+    if len(disliked_rows):
+        scores -= similarity[disliked_rows].mean(axis=0)[candidate_rows]
+    return scores
+
+
+@pytest.mark.parametrize('m', [N_RECIPES, 20])
+@pytest.mark.parametrize('seed', range(5))
+def test_scores_match_brute_force_top_m(matrix, m, seed):
+    rng = np.random.default_rng(seed)
+    table = NeighbourTable(SimpleNamespace(**build_neighbours(matrix, m)))
+    candidate_rows = np.sort(rng.choice(N_RECIPES, size=120, replace=False))
+    rated = rng.choice(unambiguous_rows(matrix, m), size=20, replace=False)
+    liked_rows, disliked_rows = rated[:int(rng.integers(1, 15))], rated[15:15 + int(rng.integers(0, 5))]
+
+    scores = table.score_candidates(candidate_rows, liked_rows, disliked_rows)
+    assert scores.dtype == np.float32
+    expected = brute_force(matrix, m, candidate_rows, liked_rows, disliked_rows)
+    # scorurile din tabel sunt float32: diferențele rămân la nivelul rotunjirii
+    np.testing.assert_allclose(scores, expected, atol=1e-6)
+
+
+def test_filtered_out_dislikes_still_reach_the_scorer(catalog, monkeypatch):
+    monkeypatch.setattr(Main, 'get_catalog', lambda: catalog)
+    payload = {'Allergens': [], 'Preferences': [], 'Type': [catalog.type_labels[0]]}
+    rows = Main.prepare_request(payload)[0]
+    outside = np.setdiff1d(np.arange(len(catalog)), rows)[:3]
+    inside = rows[:2]
+    payload = {**payload, 'Liked Recipes': catalog.ids[rows[2:6]].tolist(),
+               'Disliked Recipes': catalog.ids[np.concatenate([inside, outside])].tolist()}
+
+    candidates, _, _, _, liked_rows, disliked_rows = Main.prepare_request(payload)
+    # doar cele rămase candidate sunt scoase din candidați, dar toate ajung la scorare
+    assert np.array_equal(candidates, rows[2:])
+    assert sorted(disliked_rows.tolist()) == sorted(np.concatenate([inside, outside]).tolist())
+    assert np.array_equal(np.sort(liked_rows), np.sort(rows[2:6]))
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+import profiles
+from features import get_recipe_features
+from profiles import ProfileStore, StaleProfileError
+from scorer import user_profile
+
+
+@pytest.fixture
+def store(catalog, monkeypatch, tmp_path):
+    monkeypatch.setattr(profiles, 'get_catalog', lambda: catalog)
+    store = ProfileStore(str(tmp_path / 'profiles.sqlite3'))
+    yield store
+    store.close()
+
+
+def rate(store, email, version, recipe_id, rating):
+    store.apply_rating({'email': email, 'Recipe': recipe_id, 'Rating': rating, 'Profile Version': version})
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_incremental_profile_matches_rebuild(catalog, store, seed):
+    # rating-urile aplicate unul câte unul (inclusiv like-uri retrase) dau aceeași sumă și același
+    # vector ca profilul reconstruit din listele finale
+    rng = np.random.default_rng(seed)
+    features = get_recipe_features(catalog)
+    pool = catalog.ids[rng.choice(len(catalog), size=40, replace=False)].tolist()
+    store.rebuild('a@example.com', 0, [], [])
+    for version in range(1, 200):
+        rate(store, 'a@example.com', version, int(rng.choice(pool)), [True, False, None][rng.integers(0, 3)])
+    incremental = store.get('a@example.com', 199)
+    rebuilt = store.rebuild('b@example.com', 199, incremental.liked, incremental.disliked)
+
+    assert incremental.count == rebuilt.count == len(incremental.liked)
+    dense = np.zeros((2, features.n_features))
+    dense[0, incremental.indices] = incremental.values
+    dense[1, rebuilt.indices] = rebuilt.values
+    np.testing.assert_allclose(dense[0], dense[1], atol=1e-9)
+
+    liked_rows = catalog.rows_for_ids(incremental.liked)
+    subset = liked_rows[rng.random(len(liked_rows)) < 0.7]
+    for rows in (liked_rows, subset):
+        np.testing.assert_allclose(incremental.vector(features, rows), user_profile(features, rows), atol=1e-6)
+        np.testing.assert_allclose(incremental.vector(features, rows), rebuilt.vector(features, rows), atol=1e-6)
+
+
+def test_missed_rating_drops_the_profile(catalog, store):
+    store.rebuild('a@example.com', 1, catalog.ids[:3].tolist(), [])
+    rate(store, 'a@example.com', 3, int(catalog.ids[4]), True)
+    with pytest.raises(StaleProfileError):
+        store.get('a@example.com', 1)
+
+
+def test_run_keeps_order_off_the_event_loop(catalog, store):
+    threads = set()
+    apply_rating = store.apply_rating
+
+    def recording(payload):
+        threads.add(threading.get_ident())
+        apply_rating(payload)
+
+    async def main():
+        store.rebuild('a@example.com', 0, [], [])
+        await asyncio.gather(*(store.run(recording, {'email': 'a@example.com', 'Recipe': int(recipe_id),
+                                                     'Rating': True, 'Profile Version': version})
+                               for version, recipe_id in enumerate(catalog.ids[:20], start=1)))
+        return await store.run(store.resolve, {'email': 'a@example.com', 'Profile Version': 20})
+
+    payload = asyncio.run(main())
+    assert threading.get_ident() not in threads and len(threads) == 1
+    assert payload['Liked Recipes'] == sorted(catalog.ids[:20].tolist())
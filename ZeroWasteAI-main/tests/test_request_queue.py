@@ -0,0 +1,118 @@
+import asyncio
+
+import request_queue
+from request_queue import RequestQueue
+
+
+def make_queue(**kwargs):
+    shed = []
+    queue = RequestQueue(on_shed=lambda payload, reason: shed.append((payload['Job'], reason)), **kwargs)
+    return queue, shed
+
+
+def drain(queue):
+    async def take():
+        queue.close()
+        jobs = []
+        while (payload := await queue.get()) is not None:
+            jobs.append(payload['Job'])
+        return jobs
+    return asyncio.run(take())
+
+
+def request(job, email, request_type='list', **fields):
+    return {'Job': job, 'email': email, 'Request Type': request_type, **fields}
+
+
+def test_first_loads_before_refreshes_in_arrival_order():
+    queue, shed = make_queue()
+    queue.put(request(1, 'a', 'refresh'))
+    queue.put(request(2, 'b'))
+    queue.put(request(3, 'c', 'refresh'))
+    queue.put(request(4, 'd'))
+    assert drain(queue) == [2, 4, 1, 3]
+    assert shed == []
+
+
+def test_newer_request_supersedes_queued_one():
+    queue, shed = make_queue()
+    queue.put(request(1, 'a'))
+    queue.put(request(2, 'b'))
+    queue.put(request(3, 'a'))
+    assert len(queue) == 2
+    # la aceeași prioritate cererea nouă ia locul celei vechi
+    assert drain(queue) == [3, 2]
+    assert shed == [(1, 'superseded')]
+    assert queue.stats()['shed_superseded'] == 1
+
+
+def test_supersede_keeps_higher_priority():
+    queue, shed = make_queue()
+    queue.put(request(1, 'b'))
+    queue.put(request(2, 'a', 'refresh'))
+    queue.put(request(3, 'a'))
+    queue.put(request(4, 'a', 'refresh'))
+    assert drain(queue) == [1, 4]
+    assert shed == [(2, 'superseded'), (3, 'superseded')]
+
+
+def test_continuation_does_not_supersede_list():
+    queue, shed = make_queue()
+    queue.put(request(1, 'a'))
+    queue.put(request(2, 'a', Continuation='v:200:x'))
+    queue.put(request(3, 'a', Continuation='v:400:x'))
+    assert drain(queue) == [1, 3]
+    assert shed == [(2, 'superseded')]
+
+
+def test_overflow_sheds_oldest_lowest_priority():
+    queue, shed = make_queue(max_size=3)
+    queue.put(request(1, 'a'))
+    queue.put(request(2, 'b', 'refresh'))
+    queue.put(request(3, 'c', 'refresh'))
+    queue.put(request(4, 'd'))
+    queue.put(request(5, 'e'))
+    assert shed == [(2, 'overflow'), (3, 'overflow')]
+    assert len(queue) == 3
+    assert drain(queue) == [1, 4, 5]
+
+
+def test_expired_requests_are_shed(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(request_queue.time, 'monotonic', lambda: now[0])
+    queue, shed = make_queue(deadline=30.0)
+    queue.put(request(1, 'a'))
+    now[0] += 20
+    queue.put(request(2, 'b'))
+    now[0] += 15
+    assert drain(queue) == [2]
+    assert shed == [(1, 'expired')]
+    assert len(queue) == 0
+
+
+def test_get_waits_for_put():
+    async def scenario():
+        queue, _ = make_queue()
+        waiting = asyncio.ensure_future(queue.get())
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        queue.put(request(1, 'a'))
+        return await asyncio.wait_for(waiting, 1)
+    assert asyncio.run(scenario())['Job'] == 1
+
+
+def test_superseding_restarts_the_deadline_and_requests_without_email_stay(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(request_queue.time, 'monotonic', lambda: now[0])
+    queue, shed = make_queue(deadline=30.0)
+    queue.put(request(1, 'a'))
+    queue.put({'Job': 2})
+    queue.put({'Job': 3})
+    now[0] += 20
+    queue.put(request(4, 'a'))
+    now[0] += 15
+    # la scoatere cererile fără email au depășit termenul, cea înlocuită nu
+    assert drain(queue) == [4]
+    assert shed == [(1, 'superseded'), (2, 'expired'), (3, 'expired')]
+    assert queue.stats() == {'queued': 0, 'max_queued': queue.max_size,
+                             'shed_superseded': 1, 'shed_overflow': 0, 'shed_expired': 2}
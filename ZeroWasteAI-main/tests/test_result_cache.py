@@ -0,0 +1,151 @@
+import asyncio
+
+from result_cache import ResultCache, payload_key
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_segment_results_are_cached_as_segments():
+    calls = []
+
+    async def compute(payload):
+        calls.append(payload)
+        return {'recipe_ids': [5, 3, 9], 'Offset': 0, 'Total': 12, 'Continuation': '1:3:abc'}
+
+    async def scenario():
+        cache = ResultCache(compute, catalog_version=lambda: 1)
+        payload = {'Allergens': [], 'Limit': 3, 'email': 'a@example.com'}
+        first = await cache.get(payload)
+        first['recipe_ids'].append(1)
+        second = await cache.get(payload)
+        # continuarea e o altă cerere, deci o altă intrare
+        await cache.get({**payload, 'Continuation': '1:3:abc'})
+        return first, second
+
+    first, second = run(scenario())
+    assert second == {'recipe_ids': [5, 3, 9], 'Offset': 0, 'Total': 12, 'Continuation': '1:3:abc'}
+    assert first['recipe_ids'] == [5, 3, 9, 1]
+    assert len(calls) == 2
+
+
+def test_payload_key_ignores_requester_fields_and_list_order():
+    payload = {'Allergens': ['nuts', 'milk'], 'Liked Recipes': [3, 1], 'Expiring Products': ['egg', 'milk'], 'Time': 30}
+    same = {'Time': 30, 'Expiring Products': ['egg', 'milk'], 'Liked Recipes': [1, 3], 'Allergens': ['milk', 'nuts'],
+            'email': 'b@example.com', 'Profile Version': 4, 'Profile': object(), 'Request Type': 'refresh', 'Job': 'x'}
+    assert payload_key(payload) == payload_key(same)
+    # ordinea produselor care expiră dă prioritatea potrivirilor, deci contează
+    assert payload_key(payload) != payload_key({**payload, 'Expiring Products': ['milk', 'egg']})
+    assert payload_key(payload) != payload_key({**payload, 'Disliked Recipes': [3]})
+
+
+def counting_compute(results=None):
+    calls = []
+
+    async def compute(payload):
+        calls.append(payload)
+        await asyncio.sleep(0)
+        return list((results or {}).get(payload.get('Time'), [1, 2, 3]))
+
+    return compute, calls
+
+
+def test_hit_returns_copy_and_computes_once():
+    compute, calls = counting_compute()
+
+    async def scenario():
+        cache = ResultCache(compute, catalog_version=lambda: 1)
+        first = await cache.get({'Allergens': ['nuts', 'milk'], 'email': 'a@example.com'})
+        first.append(4)
+        # alt utilizator, alergenii în altă ordine: aceeași cheie canonică
+        second = await cache.get({'Allergens': ['milk', 'nuts'], 'email': 'b@example.com', 'Job': 7})
+        return cache, second
+
+    cache, second = run(scenario())
+    assert second == [1, 2, 3]
+    assert len(calls) == 1
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'coalesced': 0, 'entries': 1, 'in_flight': 0}
+
+
+def test_concurrent_identical_requests_are_coalesced():
+    compute, calls = counting_compute()
+
+    async def scenario():
+        cache = ResultCache(compute, catalog_version=lambda: 1)
+        results = await asyncio.gather(*(cache.get({'Time': 30}) for _ in range(5)))
+        return cache, results
+
+    cache, results = run(scenario())
+    assert results == [[1, 2, 3]] * 5
+    assert len(calls) == 1
+    assert cache.stats()['coalesced'] == 4
+    assert cache.stats()['in_flight'] == 0
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    import result_cache
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, 'monotonic', lambda: now[0])
+    compute, calls = counting_compute()
+
+    async def scenario():
+        cache = ResultCache(compute, ttl=60, catalog_version=lambda: 1)
+        await cache.get({'Time': 30})
+        now[0] += 59
+        await cache.get({'Time': 30})
+        now[0] += 2
+        await cache.get({'Time': 30})
+
+    run(scenario())
+    assert len(calls) == 2
+
+
+def test_catalog_version_change_invalidates():
+    compute, calls = counting_compute()
+    version = [1]
+
+    async def scenario():
+        cache = ResultCache(compute, catalog_version=lambda: version[0])
+        await cache.get({'Time': 30})
+        version[0] = 2
+        await cache.get({'Time': 30})
+        await cache.get({'Time': 30})
+        return cache
+
+    cache = run(scenario())
+    assert len(calls) == 2
+    assert cache.stats()['entries'] == 1
+
+
+def test_lru_eviction():
+    compute, calls = counting_compute()
+
+    async def scenario():
+        cache = ResultCache(compute, max_size=2, catalog_version=lambda: 1)
+        for time in (10, 20, 10, 30, 10, 20):
+            await cache.get({'Time': time})
+
+    run(scenario())
+    assert [payload['Time'] for payload in calls] == [10, 20, 30, 20]
+
+
+def test_failures_are_not_cached():
+    calls = []
+
+    async def compute(payload):
+        calls.append(payload)
+        await asyncio.sleep(0)
+        if len(calls) == 1:
+            raise ValueError('boom')
+        return [7]
+
+    async def scenario():
+        cache = ResultCache(compute, catalog_version=lambda: 1)
+        first = await asyncio.gather(cache.get({'Time': 30}), cache.get({'Time': 30}), return_exceptions=True)
+        return first, await cache.get({'Time': 30})
+
+    first, second = run(scenario())
+    assert all(isinstance(result, ValueError) for result in first)
+    assert second == [7]
+    assert len(calls) == 2
@@ -0,0 +1,80 @@
+import asyncio
+import importlib.util
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+from redis.exceptions import WatchError  # noqa: E402
+
+from result_sink import CacheResultSink, django_cache_key, encode_ranked_ids  # noqa: E402
+
+BACKEND_RANKED_IDS = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                  'ZeroWasteBackEnd-main', 'zerowaste', 'api', 'ranked_ids.py')
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+def make_sink(server, **kwargs):
+    sink = CacheResultSink('redis://fake', key_prefix='zw', **kwargs)
+    sink.redis = fakeredis.FakeAsyncRedis(server=server)
+    return sink
+
+
+def test_write_stores_ranking_continuation_and_generation(server):
+    sink = make_sink(server)
+    assert asyncio.run(sink.write('a@example.com', [5, 3, 9], job='j1', continuation='1:3:abc', total=12))
+    client = fakeredis.FakeRedis(server=server)
+    assert pickle.loads(client.get(django_cache_key('recepies_a@example.com', 'zw'))) == encode_ranked_ids([5, 3, 9])
+    assert pickle.loads(client.get(django_cache_key('recepies_next_a@example.com', 'zw'))) == \
+        {'Continuation': '1:3:abc', 'Total': 12}
+    first = client.get(django_cache_key('recepies_generation_a@example.com', 'zw'))
+
+    asyncio.run(sink.write('a@example.com', [7]))
+    assert client.get(django_cache_key('recepies_next_a@example.com', 'zw')) is None
+    assert client.get(django_cache_key('recepies_generation_a@example.com', 'zw')) != first
+    assert 0 < client.ttl(django_cache_key('recepies_a@example.com', 'zw')) <= sink.ttl
+
+
+def test_write_aborts_a_concurrent_append(server):
+    # un segment adăugat de backend (api.ranked_ids._update) urmărește lista cât o citește
+    sink = make_sink(server)
+    asyncio.run(sink.write('a@example.com', [5, 3, 9], continuation='1:3:abc', total=12))
+    key = django_cache_key('recepies_a@example.com', 'zw')
+    with fakeredis.FakeRedis(server=server).pipeline() as pipe:
+        pipe.watch(key)
+        pipe.get(key)
+        asyncio.run(sink.write('a@example.com', [1, 2]))
+        pipe.multi()
+        pipe.set(key, b'stale')
+        with pytest.raises(WatchError):
+            pipe.execute()
+    assert pickle.loads(fakeredis.FakeRedis(server=server).get(key)) == encode_ranked_ids([1, 2])
+
+
+@pytest.fixture(scope='module')
+def backend_ranked_ids():
+    # modulul din backend care decodează lista: formatul scris aici trebuie să fie exact al lui
+    pytest.importorskip('django')
+    if not os.path.exists(BACKEND_RANKED_IDS):
+        pytest.skip('backend sources not found')
+    spec = importlib.util.spec_from_file_location('backend_ranked_ids', BACKEND_RANKED_IDS)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.mark.parametrize('varint', [False, True])
+def test_encoding_matches_the_backend(backend_ranked_ids, varint):
+    rng = np.random.default_rng(int(varint))
+    cases = [[], [7], list(range(64)), list(range(65, 0, -1)), [0, 2 ** 32 - 1, 1, 2 ** 31]]
+    cases += [rng.integers(0, limit, size=size).tolist() for limit in (100, 1 << 20, 1 << 32) for size in (63, 64, 129, 1000)]
+    for ids in cases:
+        encoded = encode_ranked_ids(np.array(ids, dtype=np.int64), varint=varint)
+        assert encoded == backend_ranked_ids.encode(ids, varint=varint), ids
+        assert list(backend_ranked_ids.RankedIds(encoded)[:]) == ids, ids
@@ -0,0 +1,67 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import Main
+from scorer import combined_scores, fused_order
+from test_bitset_index import random_filters
+
+
+def sorted_order(similarity, match_count, priority):
+    # ordinea de dinaintea scorer.fused_order: sortarea DataFrame-ului după Match Count/Priority,
+    # apoi sortarea stabilă după similaritate (Main.rank_recommendations)
+    frame = pd.DataFrame({'Match Count': match_count, 'Priority': priority})
+    expiring = frame.sort_values(by=['Match Count', 'Priority'], ascending=[False, True]).index.to_numpy()
+    if similarity is None:
+        return expiring
+    return expiring[np.argsort(-similarity[expiring], kind='stable')]
+
+
+def near_ties(rng, size):
+    # puține valori distincte, plus vecinii lor la un ulp distanță în float32
+    values = rng.choice(rng.random(8).astype(np.float32), size=size)
+    nudged = rng.random(size) < 0.3
+    values[nudged] = np.nextafter(values[nudged], np.float32(1))
+    return values
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_default_weights_keep_sorted_order(seed):
+    rng = np.random.default_rng(seed)
+    size = int(rng.integers(1, 400))
+    n_products = int(rng.integers(0, 5))
+    match_count = rng.integers(0, n_products + 1, size=size)
+    priority = np.where(match_count > 0, rng.integers(0, max(n_products, 1), size=size), n_products)
+    similarity = near_ties(rng, size) if seed % 4 else None
+
+    expected = sorted_order(similarity, match_count, priority)
+    combined = combined_scores(similarity, match_count, n_products)
+    assert fused_order(combined, match_count, priority).tolist() == expected.tolist()
+    for k in (0, 1, size // 3, size - 1, size + 5):
+        assert fused_order(combined, match_count, priority, k).tolist() == expected[:max(k, 0)].tolist()
+
+
+def test_pipeline_keeps_dataframe_order(catalog, monkeypatch):
+    monkeypatch.setattr(Main, 'get_catalog', lambda: catalog)
+    rng = np.random.default_rng(0)
+    products = ['chicken', 'milk', 'tomato', 'onion', 'garlic', 'egg', 'cheese', 'mozzarella', 'butter', 'flour']
+    for _ in range(100):
+        filters = random_filters(rng, catalog)
+        payload = {
+            'Allergens': filters[0], 'Preferences': filters[1], 'Type': filters[2],
+            'Difficulty': filters[3], 'Time': filters[4],
+            'Expiring Products': [str(product) for product in rng.choice(products, size=rng.integers(0, 5), replace=False)],
+            'Liked Recipes': catalog.ids[rng.integers(0, len(catalog), size=rng.integers(0, 30))].tolist(),
+            'Disliked Recipes': catalog.ids[rng.integers(0, len(catalog), size=rng.integers(0, 5))].tolist(),
+        }
+        # etapele pe DataFrame, ca înainte de compute_recipe_ids_batch pe tablouri
+        with contextlib.redirect_stdout(io.StringIO()):
+            recipes = Main.filter_recepies(*filters)
+            if payload['Expiring Products']:
+                recipes = Main.use_expiring_ingredients(recipes, payload['Expiring Products'])
+            if payload['Liked Recipes']:
+                recipes = Main.recomendations(recipes, payload['Liked Recipes'], payload['Disliked Recipes'])
+        assert Main.compute_recipe_ids(payload) == recipes['id'].tolist(), payload
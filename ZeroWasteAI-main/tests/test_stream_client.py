@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+
+import stream_client  # noqa: E402
+from stream_client import GROUP, JOBS_STREAM, MAX_DELIVERIES, RATINGS_STREAM, RESULTS_STREAM, StreamClient  # noqa: E402
+from test_ws_client import until  # noqa: E402
+
+
+@pytest.fixture
+def server(monkeypatch):
+    # citiri blocante scurte, ca oprirea să nu aștepte o secundă
+    monkeypatch.setattr(stream_client, 'READ_BLOCK_MS', 20)
+    monkeypatch.setattr(stream_client, 'CLAIM_INTERVAL', 0.05)
+    return fakeredis.FakeServer()
+
+
+def make_client(server, compute, **kwargs):
+    client = StreamClient('redis://fake', compute, consumer='worker-a', **kwargs)
+    client.redis = fakeredis.FakeAsyncRedis(server=server)
+    return client
+
+
+def results(connection):
+    return [(fields[b'type'].decode(), json.loads(fields[b'payload']))
+            for _, fields in connection.xrange(RESULTS_STREAM)]
+
+
+async def echo(payload):
+    await asyncio.sleep(0)
+    return [payload['n']]
+
+
+def add_job(connection, n, email='a@example.com'):
+    return connection.xadd(JOBS_STREAM, {'payload': json.dumps({'email': email, 'n': n})}).decode()
+
+
+def test_jobs_are_answered_and_acknowledged_and_ratings_handled(server):
+    connection = fakeredis.FakeRedis(server=server)
+    jobs = [add_job(connection, n, f'user{n}@example.com') for n in range(5)]
+    ratings = []
+
+    async def rate(payload):
+        await asyncio.sleep(0)
+        ratings.append(payload)
+
+    async def scenario():
+        client = make_client(server, echo, max_in_flight=2, handlers={'rating': rate})
+        stop = asyncio.Event()
+        running = asyncio.ensure_future(client.run(stop))
+        await until(lambda: len(results(connection)) == 5)
+        # rating-urile sunt citite de la pornire încolo
+        connection.xadd(RATINGS_STREAM, {'type': 'rating', 'payload': json.dumps({'email': 'a@example.com', 'Recipe': 3})})
+        await until(lambda: ratings)
+        stop.set()
+        await running
+        return client
+
+    client = asyncio.run(scenario())
+    replies = results(connection)
+    assert {payload['Job']: (kind, payload['recipe_ids']) for kind, payload in replies} == \
+        {job: ('run', [n]) for n, job in enumerate(jobs)}
+    # fiecare răspuns și-a confirmat jobul
+    assert connection.xpending(JOBS_STREAM, GROUP)['pending'] == 0
+    assert client.stats()['jobs_held'] == 0
+    assert ratings == [{'email': 'a@example.com', 'Recipe': 3}]
+
+
+def test_stale_jobs_of_a_stopped_consumer_are_claimed_or_shed(server):
+    connection = fakeredis.FakeRedis(server=server)
+    connection.xgroup_create(JOBS_STREAM, GROUP, id='0', mkstream=True)
+    retried = add_job(connection, 1)
+    failing = add_job(connection, 2, 'b@example.com')
+    # un worker oprit a luat ambele joburi; pe al doilea l-au luat deja MAX_DELIVERIES worker-i
+    connection.xreadgroup(GROUP, 'worker-b', {JOBS_STREAM: '>'})
+    for _ in range(MAX_DELIVERIES - 1):
+        connection.xclaim(JOBS_STREAM, GROUP, 'worker-b', 0, [failing])
+
+    async def scenario():
+        client = make_client(server, echo, claim_idle=0)
+        stop = asyncio.Event()
+        running = asyncio.ensure_future(client.run(stop))
+        await until(lambda: len(results(connection)) == 2)
+        stop.set()
+        await running
+
+    asyncio.run(scenario())
+    replies = {payload['Job']: (kind, payload) for kind, payload in results(connection)}
+    assert replies[retried][0] == 'run' and replies[retried][1]['recipe_ids'] == [1]
+    assert replies[failing][0] == 'shed' and replies[failing][1]['reason'] == 'failed'
+    assert connection.xpending(JOBS_STREAM, GROUP)['pending'] == 0
@@ -0,0 +1,53 @@
+import asyncio
+import functools
+
+import numpy as np
+import pytest
+
+import Main
+from conftest import ROOT
+from test_bitset_index import random_filters
+from worker_pool import RequestRunner
+
+
+def payloads(catalog, count, seed=0):
+    rng = np.random.default_rng(seed)
+    products = ['chicken', 'milk', 'tomato', 'onion', 'garlic', 'egg', 'cheese']
+    requests = []
+    for _ in range(count):
+        filters = random_filters(rng, catalog)
+        requests.append({
+            'Allergens': filters[0], 'Preferences': filters[1], 'Type': filters[2],
+            'Difficulty': filters[3], 'Time': filters[4],
+            'Expiring Products': [str(product) for product in rng.choice(products, size=rng.integers(0, 4), replace=False)],
+            'Liked Recipes': catalog.ids[rng.integers(0, len(catalog), size=rng.integers(0, 20))].tolist(),
+            'Disliked Recipes': catalog.ids[rng.integers(0, len(catalog), size=rng.integers(0, 5))].tolist(),
+        })
+    # o cerere invalidă: excepția ei ajunge înapoi din procesul worker
+    requests.append({'Preferences': []})
+    return requests
+
+
+def outcomes(results):
+    return [repr(result) if isinstance(result, Exception) else result for result in results]
+
+
+@pytest.mark.parametrize('batch_size', [1, 8])
+def test_process_mode_returns_the_thread_mode_results(catalog, monkeypatch, batch_size):
+    # procesele worker (spawn) încarcă singure catalogul, din Files/ relativ la directorul curent
+    monkeypatch.chdir(ROOT)
+    compute = functools.partial(Main.compute_recipe_ids_batch, top_k=50)
+    requests = payloads(catalog, 24, seed=batch_size)
+    batches = [requests[start:start + batch_size] for start in range(0, len(requests), batch_size)]
+
+    async def run_all(runner):
+        try:
+            return [outcomes(results) for results in await asyncio.gather(*(runner.submit(batch) for batch in batches))]
+        finally:
+            runner.shutdown()
+
+    in_threads = asyncio.run(run_all(RequestRunner(compute, 'thread', workers=2)))
+    in_processes = asyncio.run(run_all(RequestRunner(compute, 'process', workers=2)))
+    assert in_processes == in_threads
+    assert any(isinstance(result, list) and result for results in in_threads for result in results)
+    assert in_threads[-1][-1].startswith('KeyError')
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import queue
+import time
+
+import pytest
+from websocket import WebSocketConnectionClosedException
+
+import ws_client
+from ws_client import RecommendationClient
+
+
+class FakeSocket:
+    """
+    Un websocket-client.WebSocket în memorie: recv() blochează până când testul pune un mesaj
+    (None = conexiunea cade), send() păstrează mesajele trimise.
+    """
+
+    def __init__(self, *messages):
+        self.connected = True
+        self.incoming = queue.Queue()
+        self.sent = []
+        for message in ({'type': 'connected'},) + messages:
+            self.push(message)
+
+    def push(self, message):
+        self.incoming.put(None if message is None else json.dumps(message))
+
+    def recv(self):
+        message = self.incoming.get()
+        if message is None or not self.connected:
+            self.connected = False
+            raise WebSocketConnectionClosedException('closed')
+        return message
+
+    def send(self, text):
+        if not self.connected:
+            raise WebSocketConnectionClosedException('closed')
+        self.sent.append(json.loads(text))
+
+    def settimeout(self, timeout):
+        pass
+
+    def close(self):
+        self.connected = False
+        self.incoming.put(None)
+
+
+def request(job, email):
+    return {'type': 'askScript', 'payload': {'email': email, 'Job': job}}
+
+
+def sent(sockets, message_type):
+    return [message['payload'] for socket in sockets for message in socket.sent if message['type'] == message_type]
+
+
+async def until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'timed out'
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+def sockets(monkeypatch):
+    """
+    Socket-urile date pe rând la fiecare conectare; urls reține adresele folosite.
+    """
+    sockets, urls = [], []
+
+    def create_connection(url, timeout=None):
+        urls.append(url)
+        return sockets[len(urls) - 1]
+
+    monkeypatch.setattr(ws_client, 'create_connection', create_connection)
+    monkeypatch.setattr(ws_client, 'reconnect_delay', lambda attempt: 0.0)
+    return sockets, urls
+
+
+async def echo(payload):
+    await asyncio.sleep(0)
+    return [payload['Job']]
+
+
+def test_reconnects_and_sends_each_result_once(sockets):
+    sockets, urls = sockets
+    first = FakeSocket(request(1, 'a@example.com'), None)
+    second = FakeSocket(request(2, 'b@example.com'))
+    sockets += [first, second]
+
+    async def scenario():
+        client = RecommendationClient('ws://backend/ws/python-script/', echo, max_in_flight=2,
+                                      heartbeat_interval=60, worker_id='host-7')
+        stop = asyncio.Event()
+        running = asyncio.ensure_future(client.run(stop))
+        await until(lambda: len(sent(sockets, 'run')) == 2)
+        stop.set()
+        await running
+        return client
+
+    client = asyncio.run(scenario())
+    assert client.connections == 2
+    assert urls == ['ws://backend/ws/python-script/?worker=host-7'] * 2
+    # rezultatul primei cereri pleacă pe prima conexiune sau, dacă a căzut între timp, pe a doua
+    assert sorted(payload['Job'] for payload in sent(sockets, 'run')) == [1, 2]
+    assert all(payload['recipe_ids'] == [payload['Job']] for payload in sent(sockets, 'run'))
+    assert not first.connected and not second.connected
+
+
+def test_sheds_superseded_and_overflowing_requests(sockets):
+    sockets, _ = sockets
+    socket = FakeSocket(request(1, 'a@example.com'))
+    sockets.append(socket)
+    release = asyncio.Event()
+    started = []
+
+    async def compute(payload):
+        started.append(payload['Job'])
+        if payload['Job'] == 1:
+            await release.wait()
+        return [payload['Job']]
+
+    async def scenario():
+        client = RecommendationClient('ws://backend/ws/python-script/', compute, max_in_flight=1, max_queued=1,
+                                      heartbeat_interval=60)
+        stop = asyncio.Event()
+        running = asyncio.ensure_future(client.run(stop))
+        # cu singura cerere în lucru blocată, coada de o cerere se umple
+        await until(lambda: started == [1])
+        socket.push(request(2, 'b@example.com'))
+        socket.push(request(3, 'b@example.com'))
+        socket.push(request(4, 'c@example.com'))
+        await until(lambda: len(sent(sockets, 'shed')) == 2)
+        release.set()
+        await until(lambda: len(sent(sockets, 'run')) == 2)
+        stop.set()
+        await running
+        return client
+
+    client = asyncio.run(scenario())
+    assert [(payload['Job'], payload['reason']) for payload in sent(sockets, 'shed')] == [(2, 'superseded'), (3, 'overflow')]
+    assert [payload['Job'] for payload in sent(sockets, 'run')] == [1, 4]
+    assert started == [1, 4]
+    assert client.stats()['shed_superseded'] == client.stats()['shed_overflow'] == 1
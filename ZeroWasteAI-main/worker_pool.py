@@ -0,0 +1,152 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from ann_index import get_ann_index
+from bitset_index import get_bitset_index
+from catalog import COMPILED_CATALOG_PATH, CATALOG_PATH, RecipeCatalog, file_digest, get_catalog
+from compile_catalog import CatalogValidationError, compile_catalog
+from features import get_recipe_features
+from ingredient_index import get_ingredient_index
+from metrics import REGISTRY, drain_observations, observe
+from neighbours import get_neighbour_table
+
+# La câte secunde raportăm debitul
+REPORT_INTERVAL = 30.0
+
+
+def ensure_compiled_catalog(source_path=CATALOG_PATH, output_path=COMPILED_CATALOG_PATH, ann_tables=0, neighbours=0):
+    """
+    Recompilează catalogul binar dacă lipsește, nu corespunde foii Excel curente sau nu are
+    indexul ANN (ann_tables > 0) sau tabelul vecinilor (neighbours > 0) cerute. Procesele worker îl mapează în memorie, deci paginile
+    lui (inclusiv matricea de trăsături) sunt împărțite între ele în loc să fie copiate în fiecare proces.
+    """
+    version = file_digest(source_path)
+    if os.path.exists(output_path):
+        try:
+            compiled = RecipeCatalog.open(output_path)
+            if (compiled.version == version and (not ann_tables or compiled.ann_planes is not None)
+                    and (not neighbours or compiled.neighbour_indptr is not None)):
+                return True
+        except ValueError:
+            pass
+    try:
+        compile_catalog(source_path, output_path=output_path, ann_tables=ann_tables, neighbours=neighbours)
+    except CatalogValidationError as e:
+        print(f"Cannot compile the recipe catalog, workers will read {source_path}: {e}")
+        return False
+    print(f"Compiled recipe catalog {output_path} (version {version}).")
+    return True
+
+
+def warm_up():
+    """
+    Încarcă catalogul și structurile derivate înainte de prima cerere (inițializatorul proceselor worker).
+    """
+    catalog = get_catalog()
+    get_bitset_index(catalog)
+    get_recipe_features(catalog)
+    get_ingredient_index(catalog)
+    get_ann_index(catalog)
+    get_neighbour_table(catalog)
+
+
+def timed_call(function, payload, submitted_at=None):
+    """
+    Rulează function(payload) și returnează rezultatul, timpul CPU consumat și observațiile
+    (metrics.observe) făcute în timpul calculului, care sunt adunate apoi în procesul principal.
+    """
+    drain_observations()
+    if submitted_at is not None:
+        observe('queue_wait_seconds', max(0.0, time.time() - submitted_at), queue='executor')
+    start = time.thread_time()
+    result = function(payload)
+    return result, time.thread_time() - start, drain_observations()
+
+
+class ThroughputMeter:
+    """
+    Numără cererile procesate și timpul CPU consumat de ele. req/s per core înseamnă câte cereri
+    ar servi pe secundă un core ocupat complet (cereri / secunde CPU), deci poate fi comparat
+    între modul cu thread-uri și cel cu procese.
+    """
+
+    def __init__(self, workers, report_interval=REPORT_INTERVAL):
+        self.workers = workers
+        self.report_interval = report_interval
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._cpu_seconds = 0.0
+        self._started = time.monotonic()
+
+    def record(self, cpu_seconds, requests=1):
+        with self._lock:
+            self._requests += requests
+            self._cpu_seconds += cpu_seconds
+            elapsed = time.monotonic() - self._started
+            if elapsed < self.report_interval:
+                return
+            requests, cpu_seconds = self._requests, self._cpu_seconds
+            self._requests, self._cpu_seconds = 0, 0.0
+            self._started = time.monotonic()
+        per_core = requests / cpu_seconds if cpu_seconds else float('inf')
+        print(f"Processed {requests} requests in {elapsed:.1f}s: {requests / elapsed:.1f} req/s, "
+              f"{per_core:.1f} req/s per core, {self.workers} workers busy {cpu_seconds / elapsed:.2f} cores on average.")
+
+
+class RequestRunner:
+    """
+    Rulează calculul recomandărilor fie într-un pool de thread-uri ('thread'), fie într-un
+    pool de procese ('process'), care ocolește GIL-ul pentru partea numpy/scipy/pandas.
+    function primește un lot (listă) de payload-uri și returnează câte un rezultat pentru fiecare.
+    Apelul direct calculează în thread-ul apelant (modul 'thread') sau așteaptă procesul;
+    submit este varianta pentru asyncio. În ambele moduri raportează debitul prin ThroughputMeter.
+    """
+
+    MODES = ('thread', 'process')
+
+    def __init__(self, function, mode='thread', workers=5, report_interval=REPORT_INTERVAL):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown mode {mode!r}, expected one of {', '.join(self.MODES)}.")
+        self.function = function
+        self.mode = mode
+        self.workers = workers
+        self.meter = ThroughputMeter(workers, report_interval)
+        self._executor = None
+        if mode == 'process':
+            # spawn: procesele nu moștenesc thread-urile (și lock-urile) procesului părinte
+            self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=warm_up)
+        self._threads = None
+
+    def __call__(self, payloads):
+        if self._executor is None:
+            results, cpu_seconds, observations = timed_call(self.function, payloads)
+        else:
+            results, cpu_seconds, observations = self._executor.submit(timed_call, self.function, payloads).result()
+        REGISTRY.record(observations)
+        self.meter.record(cpu_seconds, len(payloads))
+        return results
+
+    async def submit(self, payloads):
+        """
+        Calculează rezultatele lotului fără să blocheze bucla asyncio.
+        """
+        executor = self._executor
+        if executor is None:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='recommendations')
+            executor = self._threads
+        results, cpu_seconds, observations = await asyncio.get_running_loop().run_in_executor(
+            executor, timed_call, self.function, payloads, time.time())
+        REGISTRY.record(observations)
+        self.meter.record(cpu_seconds, len(payloads))
+        return results
+
+    def shutdown(self):
+        for executor in (self._executor, self._threads):
+            if executor is not None:
+                executor.shutdown()
@@ -0,0 +1,273 @@
+import asyncio
+import inspect
+import json
+import os
+import random
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from websocket import WebSocketException, create_connection
+
+from metrics import REGISTRY
+from profiles import StaleProfileError
+from request_queue import MAX_QUEUED, QUEUE_DEADLINE, STATS_COUNTERS as QUEUE_STATS_COUNTERS, RequestQueue
+
+# Backoff-ul reconectării: întârzierea maximă crește exponențial până la RECONNECT_MAX_DELAY,
+# iar întârzierea efectivă e aleasă uniform sub ea (full jitter), ca worker-ii să nu se reconecteze deodată
+RECONNECT_BASE_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30.0
+CONNECT_TIMEOUT = 10.0
+# Câte cereri pot fi calculate în paralel; celelalte așteaptă în coada cu priorități
+MAX_IN_FLIGHT = 64
+# La câte secunde trimitem un 'heartbeat'; backend-ul scoate din dispecerat worker-ii care tac
+# mai mult de WORKER_TTL (api/websocket_services/dispatch.py), deci intervalul trebuie să fie mult sub el
+HEARTBEAT_INTERVAL = 10.0
+STATS_COUNTERS = ('connections',) + QUEUE_STATS_COUNTERS
+
+
+def worker_name():
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+def reconnect_delay(attempt, base=RECONNECT_BASE_DELAY, maximum=RECONNECT_MAX_DELAY):
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
+
+
+class RecommendationClient:
+    """
+    Clientul asyncio al worker-ului AI pentru PythonScriptConsumer.
+
+    Citirea de pe socket rulează într-un thread dedicat (websocket-client e blocant), iar
+    cererile primite intră într-o coadă mărginită cu priorități (vezi request_queue.RequestQueue),
+    din care max_in_flight task-uri le scot pe rând: calculul merge în executorul lui compute (vezi
+    worker_pool.RequestRunner.submit), deci mai multe cereri sunt în lucru simultan pe aceeași
+    conexiune. Cererile aruncate din coadă sunt anunțate backend-ului cu un mesaj 'shed'. Fiecare
+    răspuns ('run', 'shed', 'profile_stale') poartă 'Job' din cerere, cu care backend-ul confirmă
+    job-ul (vezi api/websocket_services/dispatch.py din backend). Trimiterile sunt serializate
+    printr-un lock. Dacă conexiunea cade, clientul se reconectează cu backoff exponențial cu jitter;
+    cererile aflate în lucru își trimit rezultatul pe conexiunea nouă. Cu un sink (vezi
+    result_sink.CacheResultSink), rezultatele merg direct în cache-ul backend-ului, iar mesajul
+    'run' rămâne doar pentru cazul în care scrierea eșuează.
+    """
+
+    def __init__(self, url, compute, max_in_flight=MAX_IN_FLIGHT, connect_timeout=CONNECT_TIMEOUT, handlers=None,
+                 max_queued=MAX_QUEUED, queue_deadline=QUEUE_DEADLINE, sink=None, heartbeat_interval=HEARTBEAT_INTERVAL,
+                 worker_id=None):
+        self.url = url
+        # trimis backend-ului la fiecare conectare: dispecerul 'email_hash' păstrează utilizatorii
+        # pe același worker și după reconectări, deși canalul Channels se schimbă
+        self.worker_id = worker_id or worker_name()
+        self.heartbeat_interval = heartbeat_interval
+        self.compute = compute
+        # result_sink.CacheResultSink: rezultatele sunt scrise direct în cache-ul backend-ului
+        self.sink = sink
+        # mesajele de alte tipuri decât cererile (de ex. 'rating'), tratate pe rând, în ordinea sosirii;
+        # un handler poate întoarce o corutină, așteptată înainte de următorul mesaj
+        self.handlers = handlers or {}
+        self.connect_timeout = connect_timeout
+        self.max_in_flight = max(1, max_in_flight)
+        self.queue = RequestQueue(max_queued, queue_deadline, on_shed=self._shed)
+        self._workers = []
+        self._active = 0
+        self._send_lock = asyncio.Lock()
+        self._connected = asyncio.Event()
+        self._tasks = set()
+        self._ws = None
+        self._stop_event = asyncio.Event()
+        self.connections = 0
+        # un thread pentru recv (blocat cât timp conexiunea e deschisă) și unul pentru send/connect/close
+        self._reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ws-recv')
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ws-io')
+
+    async def _run_io(self, function, *args, executor=None):
+        return await asyncio.get_running_loop().run_in_executor(executor or self._io, function, *args)
+
+    async def _connect(self):
+        url = f"{self.url}{'&' if '?' in self.url else '?'}{urlencode({'worker': self.worker_id})}"
+        ws = await self._run_io(lambda: create_connection(url, timeout=self.connect_timeout))
+        raspuns = json.loads(await self._run_io(ws.recv))
+        if raspuns.get('type') != 'connected':
+            await self._run_io(ws.close)
+            raise WebSocketException(f"Unexpected handshake message: {raspuns}")
+        ws.settimeout(None)
+        return ws
+
+    async def run(self, stop_event):
+        """
+        Rulează până la setarea stop_event (asyncio.Event), reconectându-se după orice eroare.
+        La oprire nu mai acceptă cereri noi, dar le duce la capăt pe cele deja primite.
+        """
+        self._stop_event = stop_event
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.max_in_flight)]
+        attempt = 0
+        stop = asyncio.ensure_future(stop_event.wait())
+        try:
+            while not stop_event.is_set():
+                heartbeat = None
+                try:
+                    self._ws = await self._connect()
+                    print("Connected to WebSocket server.")
+                    self.connections += 1
+                    attempt = 0
+                    self._connected.set()
+                    receive = asyncio.ensure_future(self._receive(self._ws))
+                    heartbeat = asyncio.ensure_future(self._heartbeat())
+                    await asyncio.wait({receive, stop}, return_when=asyncio.FIRST_COMPLETED)
+                    if not receive.done():
+                        await self._drain()
+                        await self._run_io(self._ws.close)
+                    await receive
+                except (OSError, WebSocketException, ValueError) as e:
+                    print(f"WebSocket error: {e}")
+                finally:
+                    self._connected.clear()
+                    if heartbeat is not None:
+                        heartbeat.cancel()
+                if stop_event.is_set():
+                    break
+                delay = reconnect_delay(attempt)
+                attempt += 1
+                print(f"WebSocket disconnected. Reconnecting in {delay:.1f}s...")
+                await asyncio.wait({stop}, timeout=delay)
+        finally:
+            stop.cancel()
+            await self._drain()
+            if self._ws is not None:
+                await self._run_io(self._ws.close)
+            self._reader.shutdown(wait=False)
+            self._io.shutdown()
+
+    async def _heartbeat(self):
+        """
+        Anunță periodic backend-ul că worker-ul e viu, ca job-urile unui worker căzut (fără
+        deconectare curată) să fie trimise altuia.
+        """
+        while self._connected.is_set():
+            await asyncio.sleep(self.heartbeat_interval)
+            if self._connected.is_set():
+                await self.send({"type": "heartbeat", "payload": {}})
+
+    async def _drain(self):
+        # cererile deja primite (din coadă și în lucru) sunt duse la capăt
+        self.queue.close()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _work(self):
+        while True:
+            payload = await self.queue.get()
+            if payload is None:
+                return
+            self._active += 1
+            try:
+                await self._handle(payload)
+            finally:
+                self._active -= 1
+
+    def _shed(self, payload, reason):
+        """
+        Anunță backend-ul că cererea a fost aruncată, ca utilizatorul să nu aștepte degeaba.
+        """
+        self._spawn(self.send({"type": "shed", "payload": {"email": payload.get('email'), "reason": reason,
+                                                           "Request Type": payload.get('Request Type'),
+                                                           "Continuation": payload.get('Continuation'),
+                                                           "Job": payload.get('Job')}}))
+
+    def _spawn(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _receive(self, ws):
+        while ws.connected:
+            try:
+                cerere = json.loads(await self._run_io(ws.recv, executor=self._reader))
+            except (OSError, WebSocketException) as e:
+                if ws.connected:
+                    print(f"Error receiving message: {e}")
+                return
+            except ValueError as e:
+                print(f"Ignoring malformed message: {e}")
+                continue
+            if 'payload' not in cerere or self._stop_event.is_set():
+                continue
+            handler = self.handlers.get(cerere.get('type'))
+            if handler is not None:
+                try:
+                    result = handler(cerere['payload'])
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception as e:
+                    print(f"Error handling {cerere.get('type')} message: {e}")
+                continue
+            self.queue.put(cerere['payload'])
+
+    async def _handle(self, payload):
+        try:
+            email = payload['email']
+            result = await self.compute(payload)
+            # un segment al clasamentului (cerere cu 'Limit') vine cu Offset, Total și Continuation
+            segment = result if isinstance(result, dict) else {'recipe_ids': result}
+            # segmentele următoare se adaugă la lista din backend, deci nu pot fi scrise direct
+            if (self.sink is not None and not segment.get('Offset')
+                    and await self.sink.write(email, segment['recipe_ids'], payload.get('Job'),
+                                              segment.get('Continuation'), segment.get('Total'))):
+                await self._stored(payload)
+                REGISTRY.observe('requests_total', 1, outcome='stored')
+                return
+            sent = await self.send({"type": "run", "payload": {**segment, "email": email, "Job": payload.get('Job')}})
+            REGISTRY.observe('requests_total', 1, outcome='ok' if sent else 'dropped')
+        except StaleProfileError as e:
+            # backend-ul retrimite cererea cu toate rating-urile
+            await self.send({"type": "profile_stale", "payload": {"email": e.email, "Profile Version": e.version,
+                                                                  "Request Type": payload.get('Request Type'),
+                                                                  "Continuation": payload.get('Continuation'),
+                                                                  "Job": payload.get('Job')}})
+            REGISTRY.observe('requests_total', 1, outcome='stale_profile')
+        except Exception as e:
+            REGISTRY.observe('requests_total', 1, outcome='error')
+            print(f"Error processing request: {e}")
+            # backend-ul confirmă job-ul (altfel l-ar retrimite altui worker) și anunță utilizatorul
+            self._shed(payload, 'error')
+
+    async def _stored(self, payload):
+        """
+        Rezultatul a fost scris direct în cache; backend-ul confirmă job-ul la anunțul pub/sub.
+        """
+
+    def stats(self):
+        return {
+            'connected': self._connected.is_set(),
+            'connections': self.connections,
+            'in_flight': self._active,
+            **self.queue.stats(),
+        }
+
+    async def send(self, message):
+        """
+        Trimite mesajul pe conexiunea curentă; dacă nu există una, așteaptă reconectarea
+        (sau renunță, dacă clientul se oprește între timp). Returnează dacă mesajul a fost trimis.
+        """
+        start = time.perf_counter()
+        text = json.dumps(message)
+        REGISTRY.observe('stage_seconds', time.perf_counter() - start, stage='serialize')
+        while True:
+            if not self._connected.is_set():
+                connected = asyncio.ensure_future(self._connected.wait())
+                stopped = asyncio.ensure_future(self._stop_event.wait())
+                await asyncio.wait({connected, stopped}, return_when=asyncio.FIRST_COMPLETED)
+                connected.cancel()
+                stopped.cancel()
+                if not self._connected.is_set():
+                    print("Client stopped while disconnected, dropping a message.")
+                    return False
+            async with self._send_lock:
+                try:
+                    await self._run_io(self._ws.send, text)
+                    return True
+                except (OSError, WebSocketException) as e:
+                    print(f"Error sending message, retrying after reconnect: {e}")
+                    self._connected.clear()
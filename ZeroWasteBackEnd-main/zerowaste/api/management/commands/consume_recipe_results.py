@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from api.websocket_services import job_stream
+from api.websocket_services.recipe_requests import handle_worker_reply
+
+
+class Command(BaseCommand):
+    help = "Reads the AI workers' answers from the results stream (AI_TRANSPORT = 'redis_stream')."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consumer', default=None,
+                            help='consumer name in the results group (default: host-pid); reuse it after a restart '
+                                 'to pick up the answers left unacknowledged')
+        parser.add_argument('--batch', type=int, default=100, help='answers read per call')
+
+    def handle(self, *args, **options):
+        consumer = options['consumer'] or job_stream.consumer_name()
+        job_stream.ensure_results_group()
+        self.stdout.write(f"Consuming {job_stream.RESULTS_STREAM} as {consumer}")
+        # Answers read before a crash, but not acknowledged, come first
+        while job_stream.read_results(consumer, self.handle_reply, count=options['batch'], pending=True):
+            pass
+        try:
+            while True:
+                job_stream.read_results(consumer, self.handle_reply, count=options['batch'])
+        except KeyboardInterrupt:
+            pass
+
+    def handle_reply(self, data):
+        # A stale profile is resent as a new job, for any worker
+        handle_worker_reply(data, job_stream.publish_job)
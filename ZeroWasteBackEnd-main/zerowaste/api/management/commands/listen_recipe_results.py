@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api.websocket_services import job_stream
+from api.websocket_services.recipe_requests import handle_worker_reply
+
+
+class Command(BaseCommand):
+    help = "Notifies users when an AI worker started with --result-sink writes their recipes to the cache."
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Listening on {job_stream.RESULTS_CHANNEL}")
+        try:
+            job_stream.listen_results(self.handle_notice)
+        except KeyboardInterrupt:
+            pass
+
+    def handle_notice(self, data):
+        # 'stored' notices never ask for a resend
+        handle_worker_reply(data, job_stream.publish_job)
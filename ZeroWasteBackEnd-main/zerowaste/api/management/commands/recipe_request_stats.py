@@ -0,0 +1,18 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from api.websocket_services import dispatch
+from api.websocket_services.recipe_requests import suppressed_requests
+
+
+class Command(BaseCommand):
+    help = ("Shows the connected AI workers, the unacknowledged recipe jobs and the duplicate "
+            "requests attached to a computation already in flight.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps({
+            'workers': len(dispatch.workers()),
+            'pending_jobs': len(dispatch.pending_jobs()),
+            'suppressed_duplicates': suppressed_requests(),
+        }, indent=2))
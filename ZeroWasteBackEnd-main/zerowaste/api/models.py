@@ -55,6 +55,7 @@ class User(AbstractBaseUser):
     notification_day = models.IntegerField(default=1)  # User's preferred notification day's before expiry
     product_list = models.ForeignKey(UserProductList, on_delete=models.DO_NOTHING, blank=True, null=True)  # User's product list
     dark_mode = models.BooleanField(default=False)  # User's dark mode preference
+    profile_version = models.IntegerField(default=0)  # Incremented on every recipe rating change
     
 
     USERNAME_FIELD = 'email'
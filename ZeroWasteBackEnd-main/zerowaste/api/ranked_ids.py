@@ -0,0 +1,396 @@
+import struct
+import sys
+import threading
+import uuid
+from array import array
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.redis import RedisCache
+from redis.exceptions import WatchError
+
+# Ranked recipe ids are cached under recepies_{email} as bytes instead of a pickled list:
+#   header: b'RI', format, unused byte, count (uint32, little endian)
+#   PACKED: count little-endian uint32 ids
+#   VARINT: one uint32 byte offset per block of BLOCK ids, then the ids as zigzag varints of the
+#           difference to the previous id, restarting from 0 at each block
+# A page only decodes the ids it shows: a slice of the packed ids, or the blocks it spans.
+# Where the user's disliked ids are in the ranking is cached next to it (see exclude).
+# The AI may send the ranking in segments (see recipe_requests.request_next_segment): the next
+# one is appended to the cached ids, and next_key keeps the token that asks for it.
+# Appending only touches the end of the encoded ids: the packed ids are extended as bytes, and
+# only the last, partial varint block is encoded again.
+MAGIC = b'RI'
+PACKED = 1
+VARINT = 2
+HEADER = struct.Struct('<2sBxI')
+BLOCK = 64
+RESULT_TIMEOUT = 3600
+
+assert array('I').itemsize == 4
+
+
+def _uint32_array(data):
+    values = array('I')
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def _varint_blocks(ids):
+    # the block offsets (relative to the stream) and the stream of ids
+    offsets = array('I')
+    stream = bytearray()
+    previous = 0
+    for position, value in enumerate(ids):
+        if position % BLOCK == 0:
+            offsets.append(len(stream))
+            previous = 0
+        delta = value - previous
+        previous = value
+        zigzag = delta * 2 if delta >= 0 else -delta * 2 - 1
+        while zigzag >= 0x80:
+            stream.append(zigzag & 0x7f | 0x80)
+            zigzag >>= 7
+        stream.append(zigzag)
+    return offsets, stream
+
+
+def _encode_varint(ids):
+    offsets, stream = _varint_blocks(ids)
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+    return offsets.tobytes() + bytes(stream)
+
+
+def encode(ids, varint=None):
+    """
+    Encodes a list of recipe ids. varint defaults to settings.RANKED_IDS_VARINT: the varint
+    form is smaller when ids are small, the packed form is faster to slice.
+    """
+    if varint is None:
+        varint = getattr(settings, 'RANKED_IDS_VARINT', False)
+    ids = [int(value) for value in ids]
+    if varint:
+        return HEADER.pack(MAGIC, VARINT, len(ids)) + _encode_varint(ids)
+    values = array('I', ids)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return HEADER.pack(MAGIC, PACKED, len(ids)) + values.tobytes()
+
+
+def append(data, ids):
+    """
+    Encodes data (as returned by encode) followed by ids, in the same format, without decoding
+    data: the packed ids are copied as they are, and of the varint blocks only the last one,
+    if it is partial, is decoded and encoded again together with ids.
+    """
+    ranked = RankedIds(data)
+    ids = [int(value) for value in ids]
+    header = HEADER.pack(MAGIC, ranked.format, ranked.count + len(ids))
+    if ranked.format == PACKED:
+        values = array('I', ids)
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return header + ranked.data.tobytes() + values.tobytes()
+
+    full_blocks = ranked.count // BLOCK
+    if ranked.count % BLOCK:
+        tail = ranked._decode_block(full_blocks)
+        cut = ranked.offsets[full_blocks]
+    else:
+        tail = []
+        cut = len(ranked.stream)
+    offsets, stream = _varint_blocks(tail + ids)
+    offsets = ranked.offsets[:full_blocks] + array('I', (offset + cut for offset in offsets))
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+    return header + offsets.tobytes() + ranked.stream[:cut].tobytes() + bytes(stream)
+
+
+class RankedIds:
+    """
+    Read-only sequence over encoded ids: len() and indexing/slicing decode only what they need.
+    """
+
+    def __init__(self, data):
+        magic, self.format, self.count = HEADER.unpack_from(data)
+        if magic != MAGIC or self.format not in (PACKED, VARINT):
+            raise ValueError("Not an encoded list of recipe ids")
+        self.data = memoryview(data)[HEADER.size:]
+        if self.format == VARINT:
+            n_blocks = (self.count + BLOCK - 1) // BLOCK
+            self.offsets = _uint32_array(self.data[:4 * n_blocks])
+            self.stream = self.data[4 * n_blocks:]
+
+    def __len__(self):
+        return self.count
+
+    def _decode_block(self, block):
+        stream = self.stream
+        position = self.offsets[block]
+        values = []
+        previous = 0
+        for _ in range(min(BLOCK, self.count - block * BLOCK)):
+            zigzag = shift = 0
+            while True:
+                byte = stream[position]
+                position += 1
+                zigzag |= (byte & 0x7f) << shift
+                if byte < 0x80:
+                    break
+                shift += 7
+            previous += (zigzag >> 1) ^ -(zigzag & 1)
+            values.append(previous)
+        return values
+
+    def _slice(self, start, stop):
+        if start >= stop:
+            return []
+        if self.format == PACKED:
+            return _uint32_array(self.data[4 * start:4 * stop]).tolist()
+        values = []
+        for block in range(start // BLOCK, (stop - 1) // BLOCK + 1):
+            values.extend(self._decode_block(block))
+        first = start // BLOCK * BLOCK
+        return values[start - first:stop - first]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.count)
+            return self._slice(start, stop) if step == 1 else list(self)[index]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("recipe id index out of range")
+        return self._slice(index, index + 1)[0]
+
+    def __iter__(self):
+        for start in range(0, self.count, BLOCK * 16):
+            yield from self._slice(start, min(start + BLOCK * 16, self.count))
+
+    def find(self, ids, start=0):
+        """
+        {id: sorted positions} of the given ids in the list, looking only from start on.
+        """
+        ids = {int(value) for value in ids}
+        found = {value: [] for value in ids}
+        if not ids or start >= self.count:
+            return found
+        if self.format == VARINT:
+            first = start // BLOCK * BLOCK
+            for position, value in enumerate(self._slice(first, self.count), first):
+                if value in found and position >= start:
+                    found[value].append(position)
+            return found
+        data = self.data[4 * start:].tobytes()
+        for value in ids:
+            pattern = struct.pack('<I', value)
+            position = data.find(pattern)
+            while position != -1:
+                if position % 4 == 0:
+                    found[value].append(start + position // 4)
+                position = data.find(pattern, position + 1)
+        return found
+
+    def positions(self, ids):
+        """
+        Sorted positions of the given ids in the list.
+        """
+        return sorted(position for positions in self.find(ids).values() for position in positions)
+
+    def excluding(self, ids, total=None):
+        return ExcludedIds(self, self.positions(ids), total)
+
+
+class ExcludedIds:
+    """
+    The ids of a RankedIds without the ones at the given positions (for example disliked
+    recipes), still sliced lazily: LimitOffsetPagination only needs len() and slicing.
+    With total, len() counts the segments not loaded yet too, so the paginator keeps a next
+    link; slices past the loaded ids are short.
+    """
+
+    def __init__(self, ranked, excluded_positions, total=None):
+        self.ranked = ranked
+        self.excluded = sorted(excluded_positions)
+        # the length of the whole ranking, when only its first segments are loaded
+        self.total = len(ranked) if total is None else max(total, len(ranked))
+
+    def __len__(self):
+        return self.total - len(self.excluded)
+
+    def _raw_index(self, index):
+        # position in the full list of the index-th id that is kept
+        for position in self.excluded:
+            if position > index:
+                break
+            index += 1
+        return index
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError("recipe id index out of range")
+            return self[index:index + 1][0]
+        start, stop, step = index.indices(len(self))
+        if step != 1:
+            return self[:][index]
+        if start >= stop:
+            return []
+        raw_start = self._raw_index(start)
+        raw_stop = min(len(self.ranked), self._raw_index(stop - 1) + 1)
+        excluded = set(self.excluded)
+        kept = [value for position, value in zip(range(raw_start, raw_stop), self.ranked[raw_start:raw_stop])
+                if position not in excluded]
+        return kept[:stop - start]
+
+
+def cache_key(email):
+    return f"recepies_{email}"
+
+
+def next_key(email):
+    # {'Continuation', 'Total'} while the AI has more of the ranking than the cached segments
+    return f"recepies_next_{email}"
+
+
+def generation_key(email):
+    # a token written with every new ranking (not with its later segments), see exclude
+    return f"recepies_generation_{email}"
+
+
+def excluded_key(email):
+    # {'Generation', 'Scanned', 'Found': {id: positions}}: where the user's disliked ids are in the ranking
+    return f"recepies_excluded_{email}"
+
+
+def load(value, generation=None):
+    """
+    The cached value as a RankedIds (a list cached before the binary format is encoded first).
+    """
+    if value is None:
+        return None
+    if isinstance(value, list):
+        value = encode(value, varint=False)
+    ranked = RankedIds(value)
+    ranked.generation = generation
+    return ranked
+
+
+def get_ranked_ids(email):
+    # one read, so the generation always belongs to the ranking
+    values = cache.get_many([cache_key(email), generation_key(email)])
+    return load(values.get(cache_key(email)), values.get(generation_key(email)))
+
+
+def get_continuation(email):
+    return cache.get(next_key(email))
+
+
+def exclude(email, ranked, ids, total=None):
+    """
+    ranked (from get_ranked_ids) without the given ids, as RankedIds.excluding, but the positions
+    of the ids are cached under excluded_key: a page read only looks for ids that were not
+    disliked yet, and in the ids appended since the last read, instead of the whole ranking.
+    The cached positions are used only for the same generation of the ranking.
+    """
+    ids = {int(value) for value in ids}
+    entry = cache.get(excluded_key(email))
+    if ranked.generation is None or not entry or entry['Generation'] != ranked.generation:
+        entry = {'Generation': ranked.generation, 'Scanned': 0, 'Found': {}}
+    scanned = entry['Scanned']
+    found = {value: positions for value, positions in entry['Found'].items() if value in ids}
+    new = ids - found.keys()
+    appended = scanned < len(ranked) and bool(found)
+    if new:
+        # ids disliked since the last read are looked for in the whole ranking, once
+        found.update(ranked.find(new))
+    if appended:
+        for value, positions in ranked.find(ids - new, scanned).items():
+            found[value] = found[value] + positions
+    if (new or appended) and ranked.generation is not None:
+        cache.set(excluded_key(email), {'Generation': ranked.generation, 'Scanned': len(ranked), 'Found': found},
+                  timeout=RESULT_TIMEOUT)
+    return ExcludedIds(ranked, [position for positions in found.values() for position in positions], total)
+
+
+# Serializes _update for cache backends that are not Redis (LocMemCache in tests and
+# development): their values only live in this process, so a process lock is enough
+_update_lock = threading.Lock()
+
+
+def _update(email, build, timeout):
+    """
+    Stores build(current) atomically, current being the cached ranking of the user (None when
+    missing). build returns {key: value, or None to delete the key}, or None to store nothing.
+    On Redis the ranking is WATCHed while build runs and everything is written in one MULTI, so
+    a ranking replaced meanwhile (by another segment or by the AI's result sink) makes the
+    transaction fail, and build runs again on the new ranking. Returns whether anything was stored.
+    """
+    backend = caches[DEFAULT_CACHE_ALIAS]
+    if not isinstance(backend, RedisCache):
+        with _update_lock:
+            values = build(backend.get(cache_key(email)))
+            if values is None:
+                return False
+            for key, value in values.items():
+                if value is None:
+                    backend.delete(key)
+                else:
+                    backend.set(key, value, timeout=timeout)
+            return True
+
+    ranking_key = backend.make_and_validate_key(cache_key(email))
+    serializer = backend._cache._serializer
+    timeout = backend.get_backend_timeout(timeout)
+    with backend._cache.get_client(ranking_key, write=True).pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(ranking_key)
+                current = pipe.get(ranking_key)
+                values = build(None if current is None else serializer.loads(current))
+                if values is None:
+                    pipe.unwatch()
+                    return False
+                pipe.multi()
+                for key, value in values.items():
+                    key = backend.make_and_validate_key(key)
+                    if value is None:
+                        pipe.delete(key)
+                    else:
+                        pipe.set(key, serializer.dumps(value), ex=timeout)
+                pipe.execute()
+                return True
+            except WatchError:
+                continue
+
+
+def set_segment(email, ids, offset=0, total=None, continuation=None, timeout=RESULT_TIMEOUT):
+    """
+    Stores a segment of a user's ranking. The first segment (offset 0) always replaces the
+    cached ids; a later one is appended if it continues them, and dropped otherwise (a newer
+    ranking was stored meanwhile). The ranking and its continuation are written together (see
+    _update), so an append never writes back ids read before another segment replaced them.
+    Returns whether the segment was stored.
+    """
+    next_segment = {'Continuation': continuation, 'Total': total} if continuation else None
+
+    def build(current):
+        if not offset:
+            # a new generation: positions cached for the previous ranking no longer apply
+            return {cache_key(email): encode(ids), generation_key(email): uuid.uuid4().hex, next_key(email): next_segment}
+        if isinstance(current, list):
+            current = encode(current, varint=False)
+        if current is None or len(RankedIds(current)) != offset:
+            return None
+        return {cache_key(email): append(current, ids), next_key(email): next_segment}
+
+    return _update(email, build, timeout)
+
+
+def set_ranked_ids(email, ids, timeout=RESULT_TIMEOUT):
+    set_segment(email, ids, timeout=timeout)
@@ -1,10 +1,54 @@
-from django.test import TestCase
+import asyncio
+import time as time_module
+from django.test import AsyncClient, TestCase
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
-from api.models import User, Preference, Allergy, Recipe 
+from api.models import User, Preference, Allergy, Recipe, UserRecipeRating
 from django.contrib.auth import get_user_model
+from django.test import override_settings
 from datetime import time
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from channels.db import database_sync_to_async
+from api.websocket_services.consumers import PythonScriptConsumer
+from product.models import UserProductList
+from api.websocket_services.recipe_requests import ask_script_message, handle_worker_reply, inflight_key, suppressed_requests
+from api.websocket_services import dispatch
+from django.core.cache import cache
+from unittest import mock, skipUnless
+import json
+from rest_framework_simplejwt.tokens import AccessToken
+from api.websocket_services import job_stream
+from api import ranked_ids
+from api.ranked_ids import (
+    RankedIds, append, encode, exclude, get_continuation, get_ranked_ids, set_ranked_ids, set_segment,
+)
+from api.management.commands.consume_recipe_results import Command
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+# Tests that use the cache or the channel layer get their own in-process backends instead of the
+# project's Redis, which holds real users' rankings and the AI dispatch tables
+LOCAL_BACKENDS = {
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    'CHANNEL_LAYERS': {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+}
+
+
+def use_fake_redis(test):
+    """
+    Points job_stream.get_redis (the AI dispatch tables and streams) at an in-process fake Redis.
+    """
+    connection = fakeredis.FakeRedis()
+    patcher = mock.patch.object(job_stream, 'get_redis', return_value=connection)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    return connection
 
 class UserLoginTest(TestCase):
     def setUp(self):
@@ -274,3 +318,689 @@ class VerifyEmailViewTests(TestCase):
         """
         response = self.client.get(self.verify_url)
         self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+@skipUnless(fakeredis, "fakeredis is not installed")
+@override_settings(**LOCAL_BACKENDS)
+class RecipeProfileMessagesTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(email="profile@example.com")
+        self.user.product_list = UserProductList.objects.create(share_code="ABC123")
+        self.user.save()
+        self.client.force_authenticate(user=self.user)
+        self.recipe = Recipe.objects.create(name="Recipe1")
+        self.other_recipe = Recipe.objects.create(name="Recipe2")
+
+        # Listen on the group the AI workers join, as the only connected worker
+        cache.clear()
+        use_fake_redis(self)
+        self.channel_layer = get_channel_layer()
+        self.channel = async_to_sync(self.channel_layer.new_channel)()
+        async_to_sync(self.channel_layer.group_add)("python_scripts", self.channel)
+        dispatch.register_worker(self.channel)
+
+    def receive(self):
+        return async_to_sync(self.channel_layer.receive)(self.channel)
+
+    def rate(self, recipe, rating):
+        return self.client.post(reverse('rate-recipe'), {'recipe_id': recipe.id, 'rating': rating}, format='json')
+
+    def test_rating_changes_bump_profile_version(self):
+        self.rate(self.recipe, True)
+        self.assertEqual(self.receive()['message'], {
+            'Recipe': self.recipe.id, 'Rating': True, 'Profile Version': 1, 'email': self.user.email})
+
+        self.rate(self.recipe, False)
+        self.assertEqual(self.receive()['message']['Profile Version'], 2)
+
+        self.rate(self.recipe, None)
+        message = self.receive()
+        self.assertEqual(message['type'], 'rateRecipe')
+        self.assertIsNone(message['message']['Rating'])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.profile_version, 3)
+
+    def test_deleting_missing_rating_keeps_version(self):
+        response = self.rate(self.recipe, None)
+        self.assertEqual(response.data['detail'], "Rating does not exist.")
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.profile_version, 0)
+
+    def test_recipe_request_carries_profile_version_only(self):
+        self.rate(self.recipe, True)
+        self.receive()
+        self.client.get(reverse('refresh-recipes'))
+        message = self.receive()
+        self.assertEqual(message['type'], 'askScript')
+        self.assertEqual(message['message']['Profile Version'], 1)
+        self.assertEqual(message['message']['Request Type'], 'refresh')
+        self.assertNotIn('Liked Recipes', message['message'])
+
+    def test_full_request_includes_ratings(self):
+        self.rate(self.recipe, True)
+        self.rate(self.other_recipe, False)
+        self.user.refresh_from_db()
+        payload = ask_script_message(self.user, include_ratings=True)['message']
+        self.assertEqual(payload['Liked Recipes'], [self.recipe.id])
+        self.assertEqual(payload['Disliked Recipes'], [self.other_recipe.id])
+        self.assertEqual(payload['Profile Version'], 2)
+
+
+@skipUnless(fakeredis, "fakeredis is not installed")
+@override_settings(**LOCAL_BACKENDS)
+class PythonScriptConsumerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        use_fake_redis(self)
+
+    async def test_shed_request_notifies_user(self):
+        channel_layer = get_channel_layer()
+        user_channel = await channel_layer.new_channel()
+        await channel_layer.group_add("notificationsshedexample.com", user_channel)
+
+        communicator = WebsocketCommunicator(PythonScriptConsumer.as_asgi(), "/ws/python-script/")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual((await communicator.receive_json_from())['type'], 'connected')
+
+        await communicator.send_json_to({'type': 'shed', 'payload': {'email': 'shed@example.com', 'reason': 'overflow'}})
+        message = await channel_layer.receive(user_channel)
+        self.assertEqual(message, {'type': 'recipe', 'message': 'busy'})
+        await communicator.disconnect()
+
+
+@skipUnless(fakeredis, "fakeredis is not installed")
+@override_settings(**LOCAL_BACKENDS)
+class RecipeDispatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.redis = self.use_registry()
+        self.channel_layer = get_channel_layer()
+        self.workers = [async_to_sync(self.channel_layer.new_channel)() for _ in range(3)]
+
+    def use_registry(self):
+        return use_fake_redis(self)
+
+    def received(self, worker):
+        """
+        The askScript payloads waiting on a worker's channel.
+        """
+        async def drain():
+            messages = []
+            while True:
+                try:
+                    message = await asyncio.wait_for(self.channel_layer.receive(worker), timeout=0.05)
+                except asyncio.TimeoutError:
+                    return messages
+                messages.append(message['message'])
+        return async_to_sync(drain)()
+
+    def connect(self, *workers):
+        for worker in workers:
+            dispatch.register_worker(worker)
+
+    def dispatch_emails(self, count):
+        return [dispatch.dispatch({'email': f'user{i}@example.com'}) for i in range(count)]
+
+    def test_each_request_goes_to_one_worker(self):
+        for strategy in dispatch.STRATEGIES:
+            with self.subTest(strategy=strategy), self.settings(AI_DISPATCH_STRATEGY=strategy):
+                cache.clear()
+                self.connect(*self.workers)
+                job_ids = self.dispatch_emails(9)
+                delivered = [payload['Job'] for worker in self.workers for payload in self.received(worker)]
+                self.assertCountEqual(delivered, job_ids)
+
+    def test_round_robin_and_least_loaded_spread_evenly(self):
+        for strategy in ('round_robin', 'least_loaded'):
+            with self.subTest(strategy=strategy), self.settings(AI_DISPATCH_STRATEGY=strategy):
+                cache.clear()
+                self.connect(*self.workers)
+                self.dispatch_emails(9)
+                self.assertEqual([len(self.received(worker)) for worker in self.workers], [3, 3, 3])
+
+    @override_settings(AI_DISPATCH_STRATEGY='email_hash')
+    def test_email_hash_follows_a_reconnecting_worker(self):
+        for index, worker in enumerate(self.workers):
+            dispatch.register_worker(worker, f'worker-{index}')
+        emails = [f'user{i}@example.com' for i in range(12)]
+        job_ids = {email: dispatch.dispatch({'email': email}) for email in emails}
+        before = {email: dispatch.pending_jobs()[job_id]['worker'] for email, job_id in job_ids.items()}
+        self.assertIn(self.workers[0], before.values())
+        # worker-0 reconnects: same worker id, new channel
+        reconnected = async_to_sync(self.channel_layer.new_channel)()
+        dispatch.unregister_worker(self.workers[0])
+        dispatch.register_worker(reconnected, 'worker-0')
+        renamed = {self.workers[0]: reconnected}
+        for email in emails:
+            job_id = dispatch.dispatch({'email': email})
+            self.assertEqual(dispatch.pending_jobs()[job_id]['worker'], renamed.get(before[email], before[email]))
+
+    @override_settings(AI_DISPATCH_STRATEGY='email_hash')
+    def test_email_hash_keeps_user_on_one_worker(self):
+        self.connect(*self.workers)
+        for _ in range(3):
+            dispatch.dispatch({'email': 'same@example.com'})
+        self.assertEqual(sorted(len(self.received(worker)) for worker in self.workers), [0, 0, 3])
+
+    def test_acknowledged_job_is_not_redelivered(self):
+        self.connect(*self.workers[:2])
+        job_id = dispatch.dispatch({'email': 'ack@example.com'})
+        owner = dispatch.pending_jobs()[job_id]['worker']
+        other = next(worker for worker in self.workers[:2] if worker != owner)
+        self.assertEqual(len(self.received(owner)), 1)
+
+        dispatch.acknowledge(job_id)
+        dispatch.unregister_worker(owner)
+        self.assertEqual(dispatch.pending_jobs(), {})
+        self.assertEqual(self.received(other), [])
+
+    def test_stale_redelivery_does_not_restore_acknowledged_job(self):
+        self.connect(self.workers[0])
+        job_id = dispatch.dispatch({'email': 'race@example.com'})
+        job = dispatch.pending_jobs()[job_id]
+        self.received(self.workers[0])
+        # another backend process acknowledges the job while this one re-delivers it
+        dispatch.acknowledge(job_id)
+        dispatch._deliver(job_id, job, self.workers[1:], exclude=(self.workers[0],))
+        self.assertEqual(dispatch.pending_jobs(), {})
+        self.assertEqual(self.received(self.workers[1]) + self.received(self.workers[2]), [])
+        if self.redis is not None:
+            self.assertEqual(self.redis.keys(f'{dispatch.JOB_KEY_PREFIX}*'), [])
+
+    def test_disconnected_worker_jobs_are_redelivered(self):
+        self.connect(*self.workers[:2])
+        job_ids = self.dispatch_emails(6)
+        owners = {job_id: job['worker'] for job_id, job in dispatch.pending_jobs().items()}
+        lost = self.workers[0]
+        survivor = self.workers[1]
+        self.received(survivor)
+
+        dispatch.unregister_worker(lost)
+        redelivered = [payload['Job'] for payload in self.received(survivor)]
+        self.assertCountEqual(redelivered, [job_id for job_id in job_ids if owners[job_id] == lost])
+        self.assertEqual({job['worker'] for job in dispatch.pending_jobs().values()}, {survivor})
+        self.assertEqual(dispatch.workers(), [survivor])
+
+    def test_silent_worker_is_dropped_and_its_jobs_redelivered(self):
+        self.connect(*self.workers[:2])
+        job_ids = self.dispatch_emails(6)
+        owners = {job_id: job['worker'] for job_id, job in dispatch.pending_jobs().items()}
+        crashed, survivor = self.workers[:2]
+        self.received(crashed)
+        self.received(survivor)
+        # WORKER_TTL later, only the survivor sent a heartbeat, and the other never disconnected cleanly
+        later = mock.patch.object(dispatch.time, 'time', return_value=time_module.time() + dispatch.WORKER_TTL + 1)
+        later.start()
+        self.addCleanup(later.stop)
+        dispatch.heartbeat(survivor)
+
+        self.assertEqual(dispatch.workers(), [survivor])
+        redelivered = [payload['Job'] for payload in self.received(survivor)]
+        self.assertCountEqual(redelivered, [job_id for job_id in job_ids if owners[job_id] == crashed])
+        # users hashed to the crashed worker are served by the survivor
+        self.assertEqual(len(self.dispatch_emails(6)), 6)
+        self.assertEqual(len(self.received(survivor)), 6)
+        self.assertEqual(self.received(crashed), [])
+
+        dispatch.heartbeat(crashed)
+        self.assertEqual(dispatch.workers(), sorted([crashed, survivor]))
+
+    def test_jobs_wait_for_a_worker(self):
+        job_id = dispatch.dispatch({'email': 'early@example.com'})
+        self.assertIsNone(dispatch.pending_jobs()[job_id]['worker'])
+
+        self.connect(self.workers[0])
+        self.assertEqual([payload['Job'] for payload in self.received(self.workers[0])], [job_id])
+        self.assertEqual(dispatch.pending_jobs()[job_id]['worker'], self.workers[0])
+
+    def test_result_stored_by_worker_is_acknowledged(self):
+        self.connect(self.workers[0])
+        job_id = dispatch.dispatch({'email': 'stored@example.com'})
+        user_channel = async_to_sync(self.channel_layer.new_channel)()
+        async_to_sync(self.channel_layer.group_add)("notificationsstoredexample.com", user_channel)
+
+        handle_worker_reply({'type': 'stored', 'payload': {'email': 'stored@example.com', 'Job': job_id, 'count': 3}}, None)
+        self.assertEqual(dispatch.pending_jobs(), {})
+        self.assertEqual(async_to_sync(self.channel_layer.receive)(user_channel), {'type': 'recipe', 'message': 'ok'})
+
+    async def test_consumer_acknowledges_results(self):
+        communicator = WebsocketCommunicator(PythonScriptConsumer.as_asgi(), "/ws/python-script/")
+        await communicator.connect()
+        await communicator.receive_json_from()
+        job_id = await database_sync_to_async(dispatch.dispatch)({'email': 'run@example.com'})
+        request = await communicator.receive_json_from()
+        self.assertEqual(request['payload']['Job'], job_id)
+
+        await communicator.send_json_to({'type': 'run', 'payload': {'recipe_ids': [1, 2], 'email': 'run@example.com', 'Job': job_id}})
+        await communicator.disconnect()
+        self.assertEqual(await database_sync_to_async(dispatch.pending_jobs)(), {})
+        self.assertEqual(await database_sync_to_async(dispatch.workers)(), [])
+
+    async def test_consumer_registers_the_worker_id_it_connects_with(self):
+        communicator = WebsocketCommunicator(PythonScriptConsumer.as_asgi(), "/ws/python-script/?worker=host-42")
+        await communicator.connect()
+        await communicator.receive_json_from()
+        connected = await database_sync_to_async(dispatch.workers)()
+        worker_ids = await database_sync_to_async(lambda: dispatch.registry().worker_ids(connected))()
+        self.assertEqual(list(worker_ids.values()), ['host-42'])
+        await communicator.disconnect()
+
+
+@override_settings(**LOCAL_BACKENDS, AI_STREAM_REDIS_URL=None)
+class LocalRecipeDispatchTests(RecipeDispatchTests):
+    """
+    The same dispatch without Redis: the registry is kept in the backend process.
+    """
+
+    def use_registry(self):
+        patcher = mock.patch.object(dispatch, '_local_registry', dispatch.LocalRegistry())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # any use of Redis fails the test
+        redis_patcher = mock.patch.object(job_stream, 'get_redis', side_effect=AssertionError('Redis used'))
+        redis_patcher.start()
+        self.addCleanup(redis_patcher.stop)
+        return None
+
+
+@skipUnless(fakeredis, "fakeredis is not installed")
+@override_settings(**LOCAL_BACKENDS, AI_TRANSPORT='redis_stream')
+class RecipeJobStreamTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.redis = use_fake_redis(self)
+
+        self.client = APIClient()
+        self.user = User.objects.create(email="stream@example.com")
+        self.user.product_list = UserProductList.objects.create(share_code="STREAM1")
+        self.user.save()
+        self.client.force_authenticate(user=self.user)
+        self.recipe = Recipe.objects.create(name="Recipe1")
+
+        job_stream.ensure_results_group()
+        self.redis.xgroup_create(job_stream.JOBS_STREAM, 'recommenders', id='0', mkstream=True)
+        self.channel_layer = get_channel_layer()
+        self.user_channel = async_to_sync(self.channel_layer.new_channel)()
+        async_to_sync(self.channel_layer.group_add)("notificationsstreamexample.com", self.user_channel)
+
+    def take_jobs(self):
+        """
+        Reads the new jobs as an AI worker would: {job id: payload}.
+        """
+        response = self.redis.xreadgroup('recommenders', 'worker', {job_stream.JOBS_STREAM: '>'}) or []
+        return {entry_id.decode(): json.loads(fields[b'payload']) for _, entries in response for entry_id, fields in entries}
+
+    def reply(self, type, payload):
+        self.redis.xadd(job_stream.RESULTS_STREAM, {'type': type, 'payload': json.dumps(payload)})
+        return job_stream.read_results('backend-test', Command().handle_reply, block=None)
+
+    def test_requests_and_ratings_go_to_streams(self):
+        self.client.get(reverse('receipt-list'))
+        self.client.post(reverse('rate-recipe'), {'recipe_id': self.recipe.id, 'rating': True}, format='json')
+
+        jobs = list(self.take_jobs().values())
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(jobs[0]['email'], self.user.email)
+        self.assertEqual(jobs[0]['Request Type'], 'list')
+        ratings = self.redis.xrange(job_stream.RATINGS_STREAM)
+        self.assertEqual(json.loads(ratings[0][1][b'payload'])['Recipe'], self.recipe.id)
+
+    def test_results_are_cached_and_acknowledged(self):
+        self.client.get(reverse('receipt-list'))
+        job_id = next(iter(self.take_jobs()))
+
+        self.assertEqual(self.reply('run', {'recipe_ids': [self.recipe.id], 'email': self.user.email, 'Job': job_id}), 1)
+        self.assertEqual(get_ranked_ids(self.user.email)[:], [self.recipe.id])
+        self.assertEqual(async_to_sync(self.channel_layer.receive)(self.user_channel), {'type': 'recipe', 'message': 'ok'})
+        self.assertEqual(self.redis.xpending(job_stream.RESULTS_STREAM, job_stream.RESULTS_GROUP)['pending'], 0)
+
+    def test_stale_profile_is_resent_as_new_job(self):
+        self.client.post(reverse('rate-recipe'), {'recipe_id': self.recipe.id, 'rating': True}, format='json')
+        self.client.get(reverse('refresh-recipes'))
+        job_id = next(iter(self.take_jobs()))
+
+        self.reply('profile_stale', {'email': self.user.email, 'Profile Version': 1, 'Request Type': 'refresh', 'Job': job_id})
+        resent = list(self.take_jobs().values())
+        self.assertEqual(len(resent), 1)
+        self.assertEqual(resent[0]['Liked Recipes'], [self.recipe.id])
+        self.assertEqual(resent[0]['Request Type'], 'refresh')
+
+
+@override_settings(**LOCAL_BACKENDS)
+class RankedIdsTests(TestCase):
+    ids = [870, 3, 512, 1, 70000, 4000000000] + list(range(900, 600, -1))
+
+    def test_formats_round_trip_and_slice(self):
+        for varint in (False, True):
+            with self.subTest(varint=varint):
+                ranked = RankedIds(encode(self.ids, varint=varint))
+                self.assertEqual(len(ranked), len(self.ids))
+                self.assertEqual(list(ranked), self.ids)
+                self.assertEqual(ranked[60:130], self.ids[60:130])
+                self.assertEqual(ranked[-1], self.ids[-1])
+                self.assertEqual(ranked[300:1000], self.ids[300:])
+
+    def test_varint_is_smaller_for_small_ids(self):
+        ids = list(range(1, 871))
+        self.assertLess(len(encode(ids, varint=True)), len(encode(ids, varint=False)))
+        self.assertEqual(len(encode(ids, varint=False)), 8 + 4 * len(ids))
+
+    def test_excluding_keeps_order_and_count(self):
+        excluded = [512, 899, 650, 12345]
+        kept = [pk for pk in self.ids if pk not in excluded]
+        for varint in (False, True):
+            with self.subTest(varint=varint):
+                view = RankedIds(encode(self.ids, varint=varint)).excluding(excluded)
+                self.assertEqual(len(view), len(kept))
+                self.assertEqual(view[0:10], kept[0:10])
+                self.assertEqual(view[40:90], kept[40:90])
+                self.assertEqual(view[-1], kept[-1])
+
+    def test_legacy_pickled_list_is_read(self):
+        cache.set("recepies_legacy@example.com", [4, 2, 9])
+        self.assertEqual(get_ranked_ids("legacy@example.com")[:], [4, 2, 9])
+        self.assertIsNone(get_ranked_ids("missing@example.com"))
+
+    def test_exclude_matches_excluding(self):
+        email = "exclude@example.com"
+        for varint in (False, True):
+            with self.subTest(varint=varint), self.settings(RANKED_IDS_VARINT=varint):
+                cache.clear()
+                set_segment(email, self.ids[:150], 0, len(self.ids), '1:150:abc')
+                for disliked, stored in (([512, 899], 150), ([512, 899, 650], 150), ([899, 650, 700], len(self.ids))):
+                    if stored > len(get_ranked_ids(email)):
+                        set_segment(email, self.ids[150:], 150, len(self.ids))
+                    ranked = get_ranked_ids(email)
+                    expected = ranked.excluding(disliked, len(self.ids))
+                    view = exclude(email, ranked, disliked, len(self.ids))
+                    self.assertEqual(view.excluded, expected.excluded)
+                    self.assertEqual(view[0:200], expected[0:200])
+
+    def test_exclude_only_looks_for_what_changed(self):
+        email = "exclude@example.com"
+        set_segment(email, self.ids[:150], 0, len(self.ids), '1:150:abc')
+        with mock.patch.object(RankedIds, 'find', autospec=True, side_effect=RankedIds.find) as find:
+            def searched():
+                calls = [(sorted(call.args[1]), call.args[2] if len(call.args) > 2 else 0) for call in find.call_args_list]
+                find.reset_mock()
+                return calls
+
+            exclude(email, get_ranked_ids(email), [512, 899])
+            self.assertEqual(searched(), [([512, 899], 0)])
+            # the next page read uses the cached positions
+            exclude(email, get_ranked_ids(email), [512, 899])
+            self.assertEqual(searched(), [])
+            # a new dislike is looked for alone; a removed one is forgotten
+            self.assertEqual(exclude(email, get_ranked_ids(email), [899, 650]).excluded, [self.ids.index(899)])
+            self.assertEqual(searched(), [([650], 0)])
+            # an appended segment is searched only from where the last read stopped
+            set_segment(email, self.ids[150:], 150, len(self.ids))
+            self.assertEqual(exclude(email, get_ranked_ids(email), [899, 650]).excluded,
+                             [self.ids.index(899), self.ids.index(650)])
+            self.assertEqual(searched(), [([650, 899], 150)])
+            # a new ranking is a new generation: everything is looked for again
+            set_segment(email, self.ids[:10], 0)
+            self.assertEqual(exclude(email, get_ranked_ids(email), [899, 650]).excluded, [self.ids.index(899)])
+            self.assertEqual(searched(), [([650, 899], 0)])
+
+    def test_append_matches_encoding_the_whole_list(self):
+        for varint in (False, True):
+            for split in (1, 63, 64, 65, 128, 200):
+                with self.subTest(varint=varint, split=split):
+                    data = append(encode(self.ids[:split], varint=varint), self.ids[split:])
+                    self.assertEqual(data, encode(self.ids, varint=varint))
+
+    def test_append_decodes_only_the_last_partial_block(self):
+        with mock.patch.object(RankedIds, '_decode_block', autospec=True,
+                               side_effect=RankedIds._decode_block) as decode_block:
+            append(encode(self.ids[:128], varint=True), self.ids[128:])
+            decode_block.assert_not_called()
+            append(encode(self.ids[:150], varint=True), self.ids[150:])
+            self.assertEqual([call.args[1] for call in decode_block.call_args_list], [2])
+            append(encode(self.ids[:150], varint=False), self.ids[150:])
+            self.assertEqual(decode_block.call_count, 1)
+
+
+@override_settings(**LOCAL_BACKENDS)
+class RecipeListPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(email="pages@example.com")
+        self.client.force_authenticate(user=self.user)
+        self.recipes = [Recipe.objects.create(name=f"Recipe{i}") for i in range(30)]
+
+    def test_pages_follow_ranking_without_disliked(self):
+        ranking = [recipe.id for recipe in reversed(self.recipes)]
+        set_ranked_ids(self.user.email, ranking)
+        disliked = self.recipes[25]
+        UserRecipeRating.objects.create(user=self.user, recipe=disliked, rating=False)
+        expected = [pk for pk in ranking if pk != disliked.id]
+
+        response = self.client.get(reverse('receipt-list'), {'limit': 10, 'offset': 0})
+        self.assertEqual(response.data['count'], 29)
+        self.assertEqual([recipe['id'] for recipe in response.data['results']], expected[:10])
+        response = self.client.get(reverse('receipt-list'), {'limit': 10, 'offset': 20})
+        self.assertEqual([recipe['id'] for recipe in response.data['results']], expected[20:])
+
+
+@override_settings(**LOCAL_BACKENDS, RECIPE_SEGMENT_SIZE=20, RECIPE_PREFETCH_MARGIN=5)
+class RecipeSegmentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(email="segments@example.com")
+        self.user.product_list = UserProductList.objects.create(share_code="SEGMENT1")
+        self.user.save()
+        self.client.force_authenticate(user=self.user)
+        self.ranking = [Recipe.objects.create(name=f"Recipe{i}").id for i in range(50)]
+        patcher = mock.patch('api.websocket_services.recipe_requests._notify')
+        self.notify = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def segment(self, offset, size=20):
+        end = offset + size
+        return {'recipe_ids': self.ranking[offset:end], 'Offset': offset, 'Total': len(self.ranking),
+                'Continuation': f'1:{end}:abc' if end < len(self.ranking) else None, 'email': self.user.email}
+
+    def test_request_asks_for_a_segment(self):
+        payload = ask_script_message(self.user, continuation='1:20:abc')['message']
+        self.assertEqual(payload['Limit'], 20)
+        self.assertEqual(payload['Continuation'], '1:20:abc')
+
+    def test_segments_are_appended_in_order(self):
+        handle_worker_reply({'type': 'run', 'payload': self.segment(0)}, None)
+        self.notify.assert_called_once_with(self.user.email, 'ok')
+        handle_worker_reply({'type': 'run', 'payload': self.segment(20)}, None)
+        # an extension does not reload the user's list
+        self.notify.assert_called_once()
+        self.assertEqual(get_ranked_ids(self.user.email)[:], self.ranking[:40])
+        self.assertEqual(get_continuation(self.user.email), {'Continuation': '1:40:abc', 'Total': 50})
+
+        handle_worker_reply({'type': 'run', 'payload': self.segment(40, 10)}, None)
+        self.assertEqual(get_ranked_ids(self.user.email)[:], self.ranking)
+        self.assertIsNone(get_continuation(self.user.email))
+
+    def test_unstored_first_segment_does_not_reload_the_list(self):
+        cache.set(inflight_key(self.user.email), {'Fingerprint': 'f', 'Request Type': 'list'})
+        with mock.patch('api.websocket_services.recipe_requests.set_segment', return_value=False):
+            handle_worker_reply({'type': 'run', 'payload': self.segment(0)}, None)
+        self.notify.assert_called_once_with(self.user.email, 'busy')
+        self.assertIsNotNone(cache.get(inflight_key(self.user.email)))
+
+    def test_segment_of_an_older_ranking_is_dropped(self):
+        set_segment(self.user.email, self.ranking[:20], 0, 50, '1:20:abc')
+        self.assertFalse(set_segment(self.user.email, self.ranking[30:50], 30, 50))
+        self.assertEqual(get_ranked_ids(self.user.email)[:], self.ranking[:20])
+
+    def test_legacy_list_is_extended(self):
+        cache.set(f"recepies_{self.user.email}", self.ranking[:20])
+        self.assertTrue(set_segment(self.user.email, self.ranking[20:30], 20, 50, '1:30:abc'))
+        self.assertEqual(get_ranked_ids(self.user.email)[:], self.ranking[:30])
+
+    def test_list_counts_whole_ranking_and_prefetches_next_segment(self):
+        set_segment(self.user.email, self.ranking[:20], 0, 50, '1:20:abc')
+        with mock.patch('api.websocket_services.recipe_requests.dispatch') as dispatch_job:
+            response = self.client.get(reverse('receipt-list'), {'limit': 10, 'offset': 0})
+            self.assertEqual(response.data['count'], 50)
+            self.assertIsNotNone(response.data['next'])
+            dispatch_job.assert_not_called()
+
+            self.client.get(reverse('receipt-list'), {'limit': 10, 'offset': 10})
+            self.client.get(reverse('receipt-list'), {'limit': 10, 'offset': 10})
+            dispatch_job.assert_called_once()
+            self.assertEqual(dispatch_job.call_args[0][0]['Continuation'], '1:20:abc')
+
+        handle_worker_reply({'type': 'run', 'payload': self.segment(20)}, None)
+        response = self.client.get(reverse('receipt-list'), {'limit': 10, 'offset': 20})
+        self.assertEqual([recipe['id'] for recipe in response.data['results']], self.ranking[20:30])
+
+
+@skipUnless(fakeredis, "fakeredis is not installed")
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                                       'LOCATION': 'redis://fake:6379/2'}})
+class RankedIdsRedisTests(TestCase):
+    """
+    set_segment on a Redis cache, with the cache's client pointed at an in-process fake Redis.
+    """
+
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeRedis(server=server)
+        patcher = mock.patch('django.core.cache.backends.redis.RedisCacheClient.get_client',
+                             lambda client, key=None, write=False: fakeredis.FakeRedis(server=server))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.email = "redis@example.com"
+        self.ranking = list(range(100, 150))
+
+    def test_segments_are_stored_with_their_continuation(self):
+        self.assertTrue(set_segment(self.email, self.ranking[:20], 0, 50, '1:20:abc'))
+        self.assertTrue(set_segment(self.email, self.ranking[20:50], 20, 50))
+        self.assertEqual(get_ranked_ids(self.email)[:], self.ranking)
+        self.assertIsNone(get_continuation(self.email))
+        self.assertGreater(self.redis.ttl(cache.make_and_validate_key(f"recepies_{self.email}")), 0)
+
+    def test_append_retries_when_the_ranking_is_replaced_meanwhile(self):
+        set_segment(self.email, self.ranking[:20], 0, 50, '1:20:abc')
+        replacement = list(range(900, 910))
+        calls = []
+
+        def replaced_while_appending(data, ids):
+            calls.append(ids)
+            if len(calls) == 1:
+                # a new first segment is stored between the read and the write of the append
+                set_segment(self.email, replacement, 0, 30, '2:10:def')
+            return append(data, ids)
+
+        with mock.patch.object(ranked_ids, 'append', side_effect=replaced_while_appending):
+            self.assertFalse(set_segment(self.email, self.ranking[20:40], 20, 50, '1:40:abc'))
+        # the append ran once on the old ranking; its transaction failed and the retry saw the new one
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(get_ranked_ids(self.email)[:], replacement)
+        self.assertEqual(get_continuation(self.email), {'Continuation': '2:10:def', 'Total': 30})
+
+    def test_first_segment_always_replaces(self):
+        set_segment(self.email, self.ranking[:20], 0, 50, '1:20:abc')
+        self.assertTrue(set_segment(self.email, self.ranking[5:10], 0))
+        self.assertEqual(get_ranked_ids(self.email)[:], self.ranking[5:10])
+        self.assertIsNone(get_continuation(self.email))
+
+
+@override_settings(**LOCAL_BACKENDS, RECIPE_SEGMENT_SIZE=0)
+class RecipeListWaitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="wait@example.com")
+        self.user.product_list = UserProductList.objects.create(share_code="WAIT1")
+        self.user.save()
+        self.ranking = [Recipe.objects.create(name=f"Recipe{i}").id for i in range(15)]
+        self.client = AsyncClient()
+        self.headers = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def answer(self, payload):
+        # an AI worker answering right away
+        handle_worker_reply({'type': 'run', 'payload': {'recipe_ids': self.ranking, 'email': payload['email']}}, None)
+
+    async def test_cached_recipes_are_returned_right_away(self):
+        await database_sync_to_async(set_ranked_ids)(self.user.email, self.ranking)
+        response = await self.client.get(reverse('receipt-list-wait'), {'limit': 10}, headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([recipe['id'] for recipe in response.json()['results']], self.ranking[:10])
+
+    async def test_first_page_comes_back_with_the_answer(self):
+        with mock.patch('api.websocket_services.recipe_requests.dispatch', side_effect=self.answer) as dispatch_job:
+            response = await self.client.get(reverse('receipt-list-wait'), {'limit': 10}, headers=self.headers)
+        dispatch_job.assert_called_once()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['count'], 15)
+        self.assertEqual([recipe['id'] for recipe in response.json()['results']], self.ranking[:10])
+
+    async def test_timeout_answers_accepted(self):
+        with mock.patch('api.websocket_services.recipe_requests.dispatch'), mock.patch('zerowaste.settings.RECIPE_WAIT_TIMEOUT', 0.1):
+            response = await self.client.get(reverse('receipt-list-wait'), headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.json(), "ok")
+
+    async def test_requires_authentication(self):
+        response = await self.client.get(reverse('receipt-list-wait'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(**LOCAL_BACKENDS)
+class RecipeSingleFlightTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(email="flight@example.com")
+        self.user.product_list = UserProductList.objects.create(share_code="FLIGHT1")
+        self.user.save()
+        self.client.force_authenticate(user=self.user)
+        self.recipe = Recipe.objects.create(name="Recipe1")
+        for target in ('dispatch', '_notify'):
+            patcher = mock.patch(f'api.websocket_services.recipe_requests.{target}')
+            setattr(self, target.strip('_'), patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def test_duplicate_triggers_attach_to_pending_computation(self):
+        self.client.get(reverse('refresh-recipes'))
+        self.client.get(reverse('receipt-list'))
+        self.client.get(reverse('refresh-recipes'))
+        self.dispatch.assert_called_once()
+        self.assertEqual(suppressed_requests(), {'list': 1, 'refresh': 1})
+
+        handle_worker_reply({'type': 'run', 'payload': {'recipe_ids': [self.recipe.id], 'email': self.user.email}}, None)
+        self.client.get(reverse('refresh-recipes'))
+        self.assertEqual(self.dispatch.call_count, 2)
+
+    def test_rating_change_computes_again(self):
+        self.client.get(reverse('refresh-recipes'))
+        with mock.patch('api.websocket_services.recipe_requests.async_to_sync'):
+            self.client.post(reverse('rate-recipe'), {'recipe_id': self.recipe.id, 'rating': True}, format='json')
+        self.client.get(reverse('refresh-recipes'))
+        self.assertEqual(self.dispatch.call_count, 2)
+        self.assertEqual(self.dispatch.call_args[0][0]['Profile Version'], 1)
+
+    def test_changed_request_is_not_suppressed(self):
+        self.client.get(reverse('refresh-recipes'))
+        self.user.allergies.add(Allergy.objects.create(name="Peanuts"))
+        self.client.get(reverse('refresh-recipes'))
+        self.assertEqual(self.dispatch.call_count, 2)
+        self.assertEqual(self.dispatch.call_args[0][0]['Allergens'], ["Peanuts"])
+        self.assertEqual(suppressed_requests(), {'list': 0, 'refresh': 0})
+
+    def test_refresh_replaces_pending_first_load(self):
+        self.client.get(reverse('receipt-list'))
+        self.client.get(reverse('refresh-recipes'))
+        self.client.get(reverse('receipt-list'))
+        self.assertEqual([call[0][0]['Request Type'] for call in self.dispatch.call_args_list], ['list', 'refresh'])
+        self.assertEqual(suppressed_requests(), {'list': 1, 'refresh': 0})
+
+    def test_dropped_request_clears_marker(self):
+        self.client.get(reverse('receipt-list'))
+        handle_worker_reply({'type': 'shed', 'payload': {'email': self.user.email, 'reason': 'busy'}}, None)
+        self.notify.assert_called_once_with(self.user.email, 'busy')
+        self.client.get(reverse('receipt-list'))
+        self.assertEqual(self.dispatch.call_count, 2)
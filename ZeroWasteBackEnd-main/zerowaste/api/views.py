@@ -1,4 +1,9 @@
+import asyncio
 from urllib.parse import urlparse
+from django.http import HttpResponseNotAllowed, JsonResponse
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import status
@@ -13,10 +18,11 @@ from django.contrib.auth.tokens import default_token_generator
 from django.core.mail import send_mail
 from rest_framework.exceptions import AuthenticationFailed
 from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from asgiref.sync import async_to_sync, sync_to_async
 from django.core.cache import cache
 from rest_framework.pagination import LimitOffsetPagination
-from django.db.models import Case, When
+from .websocket_services.recipe_requests import notification_group, publish_rating_change, request_next_segment, request_recipes
+from .ranked_ids import exclude, get_continuation, get_ranked_ids
 
 
 class LoginView(generics.CreateAPIView):
@@ -374,6 +380,27 @@ class RecipePaginator(LimitOffsetPagination):
     default_limit = 10
     max_limit = 50
 
+def ranked_recipes_page(request, user, pagination_class=RecipePaginator):
+    """
+    The paginated recipes of the user's cached ranking, or None when it is not cached yet.
+    """
+    recipe_ids = get_ranked_ids(user.email)
+    if not recipe_ids:
+        return None
+    disliked_recipies_ids = UserRecipeRating.objects.filter(user=user, rating=False).values_list('recipe', flat=True)
+    next_segment = get_continuation(user.email)
+    paginator = pagination_class()
+    # Only the ids of the requested page are decoded and loaded, in ranking order
+    page_ids = paginator.paginate_queryset(
+        exclude(user.email, recipe_ids, disliked_recipies_ids, total=next_segment and next_segment['Total']), request)
+    if next_segment:
+        # More of the ranking is left on the AI side: fetch it before the user gets there
+        request_next_segment(user, next_segment, len(recipe_ids), paginator.offset + paginator.limit)
+    recipes = Recipe.objects.in_bulk(page_ids)
+    serializer = RecipeSerializer([recipes[pk] for pk in page_ids if pk in recipes], many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer.data).data
+
+
 class RecipeListView(APIView):
     permission_classes = [IsAuthenticated]
     pagination_class = RecipePaginator
@@ -382,51 +409,84 @@ class RecipeListView(APIView):
        
         user = request.user
         
-        if cache.get(f"recepies_{user.email}"):
-            recipe_ids = cache.get(f"recepies_{user.email}")
-            recipes = Recipe.objects.filter(id__in=recipe_ids).order_by(
-                Case(*[When(id=pk, then=pos) for pos, pk in enumerate(recipe_ids)]))
-            disliked_recipies_ids = UserRecipeRating.objects.filter(user=user, rating=False).values_list('recipe', flat=True)         
-            recipes = recipes.exclude(id__in=disliked_recipies_ids)
-            paginator = self.pagination_class()
-            serializer = RecipeSerializer(paginator.paginate_queryset(recipes, request), many=True, context={'request': request})
-            return paginator.get_paginated_response(serializer.data)
-        
-        user_preferences = user.preferences.all()
-        user_allergies = user.allergies.all()
-        user_liked_recipes = list(UserRecipeRating.objects.filter(user=user, rating=True).values_list('recipe', flat=True))
-        user_disliked_recipes = list(UserRecipeRating.objects.filter(user=user, rating=False).values_list('recipe', flat=True))
+        page = ranked_recipes_page(request, user, self.pagination_class)
+        if page is not None:
+            return Response(page, status=status.HTTP_200_OK)
         
-        product_list = user.product_list
-        message = {
-            'type': 'askScript',
-            'message': {
-                'Allergens': [allergy.name for allergy in user_allergies],
-                'Preferences': [preference.name for preference in user_preferences],
-                'Expiring Products' : product_list.getExpiringProducts(user.notification_day),
-                'Liked Recipes' : user_liked_recipes,
-                'Disliked Recipes' : user_disliked_recipes,
-                'email': user.email
-            }
-        }
-        
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            "python_scripts",  
-            message
-            )
+        request_recipes(user)
 
         return Response("ok", status=status.HTTP_200_OK)
-    
 
-    
+
+async def _wait_for_recipes(channel_layer, channel, timeout):
+    """
+    The first 'recipe' notification received on the channel within timeout seconds, or None.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return None
+        try:
+            message = await asyncio.wait_for(channel_layer.receive(channel), timeout=remaining)
+        except asyncio.TimeoutError:
+            return None
+        # The group also carries the product notifications
+        if message.get('type') == 'recipe':
+            return message.get('message')
+
+
+async def recipe_list_wait(request):
+    """
+    Async variant of RecipeListView for ASGI servers. On a cache miss it asks the AI workers and
+    waits for their answer on the user's notification group, without holding a thread, so the
+    first page comes back in the same request. After settings.RECIPE_WAIT_TIMEOUT seconds (or
+    if the workers are busy) it answers 202 and the recipes arrive the usual way: a 'recipe'
+    websocket notification, then a GET on recipes/.
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    try:
+        authenticated = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed as e:
+        return JsonResponse({"detail": e.detail}, status=status.HTTP_401_UNAUTHORIZED)
+    if authenticated is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."},
+                            status=status.HTTP_401_UNAUTHORIZED)
+    user = authenticated[0]
+    request = Request(request)
+    request.user = user
+
+    channel_layer = get_channel_layer()
+    channel = await channel_layer.new_channel()
+    group = notification_group(user.email)
+    # Joined before the cache is read, so an answer stored meanwhile is not missed
+    await channel_layer.group_add(group, channel)
+    answer = None
+    try:
+        page = await sync_to_async(ranked_recipes_page)(request, user)
+        if page is None:
+            # Attaches to the computation already in flight for the user, if any
+            await sync_to_async(request_recipes)(user)
+            answer = await _wait_for_recipes(channel_layer, channel, getattr(settings, 'RECIPE_WAIT_TIMEOUT', 10))
+            if answer == 'ok':
+                page = await sync_to_async(ranked_recipes_page)(request, user)
+    finally:
+        await channel_layer.group_discard(group, channel)
+
+    if page is None:
+        return JsonResponse(answer or "ok", status=status.HTTP_202_ACCEPTED, safe=False)
+    return JsonResponse(page, encoder=JSONEncoder)
+
+
 class FilterRecipeView(APIView):
     permission_classes = [IsAuthenticated]
     pagination_class = RecipePaginator
 
     def get(self, request):
         user = request.user
-        cached_recipes = cache.get(f"recepies_{user.email}")
+        cached_recipes = get_ranked_ids(user.email)
         
         time = request.query_params.get('filter[time]', None)
         recipe_type = request.query_params.get('filter[recipe_type]', None)
@@ -454,7 +514,7 @@ class FilterRecipeView(APIView):
             if not cached_recipes:
                 return Response({"detail": "No recipes found."}, status=status.HTTP_404_NOT_FOUND)
 
-            recipes = Recipe.objects.filter(id__in=cached_recipes)
+            recipes = Recipe.objects.filter(id__in=list(cached_recipes))
 
 
         if recipe_type is not None:
@@ -489,15 +549,18 @@ class RateRecipeView(APIView):
         if rating == None:
             if UserRecipeRating.objects.filter(user=user, recipe=recipe).exists():
                 UserRecipeRating.objects.filter(user=user, recipe=recipe).delete()
+                publish_rating_change(user, recipe.id, None)
                 return Response({"detail": "Rating deleted successfully."}, status=status.HTTP_200_OK)
             return Response({"detail": "Rating does not exist."}, status=status.HTTP_200_OK)
         
         if UserRecipeRating.objects.filter(user=user, recipe=recipe).exists():
             UserRecipeRating.objects.filter(user=user, recipe=recipe).update(rating=rating)
+            publish_rating_change(user, recipe.id, rating)
             return Response({"detail": "Rating updated successfully."}, status=status.HTTP_200_OK)
 
 
         UserRecipeRating.objects.create(user=user, recipe=recipe, rating=rating)
+        publish_rating_change(user, recipe.id, rating)
         
         return Response({"detail": "Rating added successfully."}, status=status.HTTP_200_OK)
     
@@ -509,14 +572,14 @@ class SearchRecipeView(APIView):
         user = request.user
         query = request.query_params.get('search', None)
         query = query.lower()
-        cached_recipes = cache.get(f"recepies_{user.email}")
+        cached_recipes = get_ranked_ids(user.email)
         if not cached_recipes:
             return Response({"detail": "No recipes found."}, status=status.HTTP_404_NOT_FOUND)
         
         if query is None:
             return Response({"detail": "No query provided."}, status=status.HTTP_400_BAD_REQUEST)
         
-        recipes = Recipe.objects.filter(id__in=cached_recipes)
+        recipes = Recipe.objects.filter(id__in=list(cached_recipes))
         
         recipes = recipes.filter(name__icontains=query)
         if not recipes.exists():
@@ -534,28 +597,6 @@ class RefreshRecipeView(APIView):
     def get(self, request):
         user = request.user
 
-        user_preferences = user.preferences.all()
-        user_allergies = user.allergies.all()
-        user_liked_recipes = list(UserRecipeRating.objects.filter(user=user, rating=True).values_list('recipe', flat=True))
-        user_disliked_recipes = list(UserRecipeRating.objects.filter(user=user, rating=False).values_list('recipe', flat=True))
-        
-        product_list = user.product_list
-        message = {
-            'type': 'askScript',
-            'message': {
-                'Allergens': [allergy.name for allergy in user_allergies],
-                'Preferences': [preference.name for preference in user_preferences],
-                'Expiring Products' : product_list.getExpiringProducts(user.notification_day),
-                'Liked Recipes' : user_liked_recipes,
-                'Disliked Recipes' : user_disliked_recipes,
-                'email': user.email
-            }
-        }
-        
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            "python_scripts",  
-            message
-            )
+        request_recipes(user, request_type='refresh')
 
         return Response("ok", status=status.HTTP_200_OK)
\ No newline at end of file
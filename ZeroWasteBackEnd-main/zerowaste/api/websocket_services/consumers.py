@@ -1,7 +1,9 @@
 import json
+from urllib.parse import parse_qs
 from channels.generic.websocket import WebsocketConsumer
 from asgiref.sync import async_to_sync
-from django.core.cache import cache
+from .recipe_requests import handle_worker_reply
+from .dispatch import heartbeat, register_worker, unregister_worker
 
 class NotificationConsumer(WebsocketConsumer):
     def connect(self):
@@ -87,6 +89,8 @@ class NotificationConsumer(WebsocketConsumer):
 class PythonScriptConsumer(WebsocketConsumer):
     def connect(self):
         self.accept()
+        # Rating changes are broadcast to every worker (each keeps its own profiles);
+        # recipe requests go to a single worker (see dispatch.py)
         async_to_sync(self.channel_layer.group_add)(
             "python_scripts",
             self.channel_name
@@ -95,33 +99,30 @@ class PythonScriptConsumer(WebsocketConsumer):
             'message': 'Conectat la WebSocket',
             'type': 'connected',
         }))
+        # The worker's own id (?worker=...), stable across its reconnects, unlike the channel name
+        query = parse_qs(self.scope.get('query_string', b'').decode('latin-1'))
+        self.worker_id = (query.get('worker') or [None])[0]
+        register_worker(self.channel_name, self.worker_id)
 
     def disconnect(self, close_code):
         async_to_sync(self.channel_layer.group_discard)(
             "python_scripts", 
             self.channel_name
         )
+        # The worker's unanswered requests go to the remaining workers
+        unregister_worker(self.channel_name)
 
 
     def receive(self, text_data):
-        data = json.loads(text_data)
-        if data['type'] == 'run':
-            payload = data['payload']
-            email = payload.get('email')
-            recepies_ids = payload.get('recipe_ids')
-            if cache.get(f"recepies_{email}"):
-                cache.delete(f"recepies_{email}")
-            cache.set(f"recepies_{email}", recepies_ids, timeout=3600)
-            
-            message = {
-                'type': 'recipe',
-                'message': 'ok'
-            }
-            async_to_sync(self.channel_layer.group_send)(
-                f"notifications{email.split('@')[0] + email.split('@')[1]}",
-                message
-            )
-            
+        # Any message keeps the worker registered; 'heartbeat' messages carry nothing else
+        heartbeat(self.channel_name, self.worker_id)
+        handle_worker_reply(json.loads(text_data), self.resend)
+
+    def resend(self, payload):
+        self.send(text_data=json.dumps({
+            'type': 'message',
+            'payload': payload
+        }))
 
     def askScript(self, event):
         message = event['message']
@@ -129,3 +130,10 @@ class PythonScriptConsumer(WebsocketConsumer):
             'type': 'message',
             'payload': message
         }))
+
+    def rateRecipe(self, event):
+        message = event['message']
+        self.send(text_data=json.dumps({
+            'type': 'rating',
+            'payload': message
+        }))
@@ -0,0 +1,345 @@
+import json
+import threading
+import time
+import uuid
+import zlib
+
+import redis
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from . import job_stream
+
+# Connected AI workers and the jobs sent to them that were not acknowledged yet. With
+# AI_STREAM_REDIS_URL they are kept in Redis (job_stream.get_redis) so every backend process
+# sees them; without it, in this process (RedisRegistry / LocalRegistry). A worker silent for
+# WORKER_TTL seconds (its process crashed, or the backend process holding its websocket did) is
+# dropped and its jobs re-delivered. Each job is stored on its own: a dispatch or an ack only
+# touches its own job, and a re-delivery is a compare-and-set on the job's worker, so concurrent
+# requests do not overwrite each other's jobs.
+WORKERS_KEY = 'ai_workers'
+WORKER_IDS_KEY = 'ai_worker_ids'
+JOBS_KEY = 'ai_jobs'
+JOB_KEY_PREFIX = 'ai_job:'
+ROUND_ROBIN_KEY = 'ai_dispatch_round_robin'
+# Unacknowledged jobs older than this are forgotten (the user has long given up on them)
+JOB_TTL = 3600
+# The AI workers send a heartbeat every 10 seconds (HEARTBEAT_INTERVAL in ws_client.py)
+WORKER_TTL = 30
+
+STRATEGIES = ('round_robin', 'least_loaded', 'email_hash')
+DEFAULT_STRATEGY = 'email_hash'
+
+
+class RedisRegistry:
+    """
+    The workers are a sorted set of channel names scored by their last heartbeat, with the id
+    each worker sent at connect in a hash. Each job is a hash (payload, worker, queued_at)
+    expiring after JOB_TTL, indexed by a sorted set scored by queue time.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def add_worker(self, channel, worker_id, now):
+        with self.connection.pipeline() as pipe:
+            pipe.zadd(WORKERS_KEY, {channel: now})
+            pipe.hset(WORKER_IDS_KEY, channel, worker_id)
+            pipe.execute()
+
+    def touch_worker(self, channel, now):
+        # False if the worker is not registered (anymore)
+        return bool(self.connection.zadd(WORKERS_KEY, {channel: now}, xx=True, ch=True))
+
+    def remove_worker(self, channel):
+        # only the caller that removes a worker re-delivers its jobs
+        with self.connection.pipeline() as pipe:
+            pipe.zrem(WORKERS_KEY, channel)
+            pipe.hdel(WORKER_IDS_KEY, channel)
+            return bool(pipe.execute()[0])
+
+    def silent_workers(self, since):
+        return [worker.decode() for worker in self.connection.zrangebyscore(WORKERS_KEY, '-inf', since)]
+
+    def live_workers(self, since):
+        return sorted(worker.decode() for worker in self.connection.zrangebyscore(WORKERS_KEY, since, '+inf'))
+
+    def worker_ids(self, channels):
+        if not channels:
+            return {}
+        return {channel: (worker_id or b'').decode() or channel
+                for channel, worker_id in zip(channels, self.connection.hmget(WORKER_IDS_KEY, channels))}
+
+    def next_turn(self):
+        return self.connection.incr(ROUND_ROBIN_KEY) - 1
+
+    def add_job(self, job_id, payload, worker, queued_at):
+        key = _job_key(job_id)
+        with self.connection.pipeline() as pipe:
+            pipe.hset(key, mapping={'payload': json.dumps(payload), 'worker': worker or '', 'queued_at': queued_at})
+            pipe.expire(key, JOB_TTL)
+            pipe.zadd(JOBS_KEY, {job_id: queued_at})
+            pipe.execute()
+
+    def jobs(self, since):
+        self.connection.zremrangebyscore(JOBS_KEY, '-inf', since)
+        job_ids = [job_id.decode() for job_id in self.connection.zrange(JOBS_KEY, 0, -1)]
+        with self.connection.pipeline(transaction=False) as pipe:
+            for job_id in job_ids:
+                pipe.hgetall(_job_key(job_id))
+            values = pipe.execute()
+        jobs = {}
+        for job_id, fields in zip(job_ids, values):
+            # acknowledged or expired meanwhile
+            if fields:
+                jobs[job_id] = {
+                    'payload': json.loads(fields[b'payload']),
+                    'worker': fields[b'worker'].decode() or None,
+                    'queued_at': float(fields[b'queued_at']),
+                }
+        return jobs
+
+    def reassign(self, job_id, worker, expected):
+        key = _job_key(job_id)
+        with self.connection.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                current = pipe.hget(key, 'worker')
+                if current is None or current.decode() != (expected or ''):
+                    return False
+                pipe.multi()
+                pipe.hset(key, 'worker', worker or '')
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+
+    def remove_job(self, job_id):
+        with self.connection.pipeline() as pipe:
+            pipe.delete(_job_key(job_id))
+            pipe.zrem(JOBS_KEY, job_id)
+            pipe.execute()
+
+
+class LocalRegistry:
+    """
+    The same registry in this process, for the websocket transport without AI_STREAM_REDIS_URL
+    (a single backend process, or tests on the in-memory channel layer).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._workers = {}
+        self._worker_ids = {}
+        self._jobs = {}
+        self._turn = 0
+
+    def add_worker(self, channel, worker_id, now):
+        with self._lock:
+            self._workers[channel] = now
+            self._worker_ids[channel] = worker_id
+
+    def touch_worker(self, channel, now):
+        with self._lock:
+            if channel not in self._workers:
+                return False
+            self._workers[channel] = now
+            return True
+
+    def remove_worker(self, channel):
+        with self._lock:
+            self._worker_ids.pop(channel, None)
+            return self._workers.pop(channel, None) is not None
+
+    def silent_workers(self, since):
+        with self._lock:
+            return [channel for channel, seen in self._workers.items() if seen <= since]
+
+    def live_workers(self, since):
+        with self._lock:
+            return sorted(channel for channel, seen in self._workers.items() if seen >= since)
+
+    def worker_ids(self, channels):
+        with self._lock:
+            return {channel: self._worker_ids.get(channel) or channel for channel in channels}
+
+    def next_turn(self):
+        with self._lock:
+            self._turn += 1
+            return self._turn - 1
+
+    def add_job(self, job_id, payload, worker, queued_at):
+        with self._lock:
+            self._jobs[job_id] = {'payload': payload, 'worker': worker, 'queued_at': queued_at}
+
+    def jobs(self, since):
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items() if job['queued_at'] <= since]:
+                del self._jobs[job_id]
+            return {job_id: dict(job) for job_id, job in self._jobs.items()}
+
+    def reassign(self, job_id, worker, expected):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['worker'] != expected:
+                return False
+            job['worker'] = worker
+            return True
+
+    def remove_job(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+
+_local_registry = LocalRegistry()
+
+
+def registry():
+    if getattr(settings, 'AI_STREAM_REDIS_URL', None):
+        return RedisRegistry(job_stream.get_redis())
+    return _local_registry
+
+
+def _strategy():
+    strategy = getattr(settings, 'AI_DISPATCH_STRATEGY', DEFAULT_STRATEGY)
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown AI_DISPATCH_STRATEGY {strategy!r}, expected one of {STRATEGIES}")
+    return strategy
+
+
+def _job_key(job_id):
+    return f'{JOB_KEY_PREFIX}{job_id}'
+
+
+def workers():
+    """
+    The workers heard from within WORKER_TTL seconds. The jobs of the others go to these.
+    """
+    workers = registry()
+    for worker in workers.silent_workers(time.time() - WORKER_TTL):
+        if workers.remove_worker(worker):
+            _redeliver_from(worker)
+    return workers.live_workers(time.time() - WORKER_TTL)
+
+
+def pending_jobs():
+    """
+    Unacknowledged jobs: {job id: {'payload', 'worker' (None while no worker is connected), 'queued_at'}}.
+    """
+    return registry().jobs(time.time() - JOB_TTL)
+
+
+def choose_worker(payload, connected, jobs=None, strategy=None):
+    """
+    Picks the worker for a request:
+    - round_robin: the next worker in turn;
+    - least_loaded: the worker with the fewest unacknowledged jobs (jobs defaults to pending_jobs());
+    - email_hash: the same worker for the same email while the set of workers does not change
+      (rendezvous hashing on the id each worker sends at connect, not on its channel, so a
+      reconnecting worker keeps its users), so the worker's result cache and stored profile
+      keep being reused.
+    """
+    if not connected:
+        return None
+    strategy = strategy or _strategy()
+    if strategy == 'round_robin':
+        return connected[registry().next_turn() % len(connected)]
+    if strategy == 'least_loaded':
+        load = {worker: 0 for worker in connected}
+        for job in (pending_jobs() if jobs is None else jobs).values():
+            if job['worker'] in load:
+                load[job['worker']] += 1
+        return min(connected, key=load.get)
+    email = payload.get('email') or ''
+    worker_ids = registry().worker_ids(connected)
+    return max(connected, key=lambda worker: zlib.crc32(f'{worker_ids[worker]}|{email}'.encode('utf-8')))
+
+
+def _send(worker, payload):
+    async_to_sync(get_channel_layer().send)(worker, {
+        'type': 'askScript',
+        'message': payload
+    })
+
+
+def _reassign(job_id, worker, expected):
+    """
+    Moves a job from the expected worker (None: waiting for one) to worker, unless it was
+    acknowledged or moved by another process meanwhile. Returns whether it was moved.
+    """
+    return registry().reassign(job_id, worker, expected)
+
+
+def _deliver(job_id, job, connected, exclude=()):
+    candidates = [worker for worker in connected if worker not in exclude]
+    worker = choose_worker(job['payload'], candidates)
+    if worker != job['worker'] and _reassign(job_id, worker, job['worker']) and worker is not None:
+        _send(worker, job['payload'])
+
+
+def dispatch(payload):
+    """
+    Sends a recommendation request to exactly one AI worker and remembers it until the worker
+    acknowledges it (acknowledge). Without a connected worker, the job waits for the next one.
+    Returns the job id, also sent to the worker as payload['Job'].
+    With AI_TRANSPORT = 'redis_stream' the job goes to the jobs stream instead, whose consumer
+    group does the same (see job_stream.py).
+    """
+    if job_stream.enabled():
+        return job_stream.publish_job(payload)
+    job_id = uuid.uuid4().hex
+    payload = {**payload, 'Job': job_id}
+    worker = choose_worker(payload, workers())
+    registry().add_job(job_id, payload, worker, time.time())
+    if worker is not None:
+        _send(worker, payload)
+    else:
+        # a worker that registered while the job was stored did not see it
+        _deliver(job_id, {'payload': payload, 'worker': None}, workers())
+    return job_id
+
+
+def acknowledge(job_id):
+    """
+    The worker answered the job (results, shed or stale profile), so it is not re-delivered.
+    """
+    if not job_id:
+        return
+    registry().remove_job(job_id)
+
+
+def register_worker(channel_name, worker_id=None):
+    """
+    Adds a worker and hands it the jobs that were waiting for one. worker_id is the id the
+    worker sent at connect (its channel name if it sent none).
+    """
+    registry().add_worker(channel_name, worker_id or channel_name, time.time())
+    connected = workers()
+    for job_id, job in pending_jobs().items():
+        if job['worker'] is None:
+            _deliver(job_id, job, connected)
+
+
+def heartbeat(channel_name, worker_id=None):
+    """
+    The worker is alive (any message from it counts). A worker dropped meanwhile as silent is
+    registered again.
+    """
+    if not registry().touch_worker(channel_name, time.time()):
+        register_worker(channel_name, worker_id)
+
+
+def _redeliver_from(channel_name):
+    connected = registry().live_workers(time.time() - WORKER_TTL)
+    for job_id, job in pending_jobs().items():
+        if job['worker'] == channel_name:
+            _deliver(job_id, job, connected, exclude=(channel_name,))
+
+
+def unregister_worker(channel_name):
+    """
+    Removes a worker and re-delivers its unacknowledged jobs to the remaining workers.
+    """
+    registry().remove_worker(channel_name)
+    _redeliver_from(channel_name)
@@ -0,0 +1,108 @@
+import json
+import logging
+import os
+import socket
+
+import redis
+from django.conf import settings
+
+# Redis streams used instead of the ws/python-script/ websocket when AI_TRANSPORT = 'redis_stream'.
+# The AI workers read the jobs through a consumer group (each job goes to one worker, and stays
+# in the group's pending entries until the worker acknowledges it), read every rating change,
+# and add their answers ('run', 'shed', 'profile_stale', 'stats') to the results stream, which
+# the consume_recipe_results command reads through its own consumer group.
+JOBS_STREAM = 'recipe_jobs'
+RATINGS_STREAM = 'recipe_ratings'
+RESULTS_STREAM = 'recipe_results'
+RESULTS_GROUP = 'backend'
+# Workers started with --result-sink write the recipe ids straight into the cache and publish
+# {'email', 'Job', 'count'} on this pub/sub channel instead of sending a 'run' answer
+RESULTS_CHANNEL = 'recipe_results_ready'
+# Approximate stream lengths kept by XADD (older entries are trimmed)
+JOBS_MAXLEN = 100000
+RATINGS_MAXLEN = 100000
+
+logger = logging.getLogger("daphne")
+
+_connection = None
+
+
+def get_redis():
+    global _connection
+    if _connection is None:
+        _connection = redis.Redis.from_url(getattr(settings, 'AI_STREAM_REDIS_URL', 'redis://127.0.0.1:6379/3'))
+    return _connection
+
+
+def enabled():
+    return getattr(settings, 'AI_TRANSPORT', 'websocket') == 'redis_stream'
+
+
+def publish_job(payload):
+    """
+    Adds a recommendation request to the jobs stream. The stream entry id is the job id:
+    the worker sends it back as payload['Job'].
+    """
+    return get_redis().xadd(JOBS_STREAM, {'type': 'askScript', 'payload': json.dumps(payload)},
+                            maxlen=JOBS_MAXLEN, approximate=True).decode()
+
+
+def publish_rating(message):
+    """
+    Adds a rating change to the ratings stream, read by every worker.
+    """
+    return get_redis().xadd(RATINGS_STREAM, {'type': 'rating', 'payload': json.dumps(message)},
+                            maxlen=RATINGS_MAXLEN, approximate=True).decode()
+
+
+def ensure_results_group():
+    try:
+        get_redis().xgroup_create(RESULTS_STREAM, RESULTS_GROUP, id='0', mkstream=True)
+    except redis.ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def consumer_name():
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+def read_results(consumer, handle, count=100, block=5000, pending=False):
+    """
+    Reads a batch of worker answers from the results stream and passes each one to
+    handle({'type', 'payload'}), acknowledging it afterwards. An answer that fails to be handled
+    is logged and acknowledged too, so it does not block the stream. With pending=True, re-reads
+    the answers this consumer received but did not acknowledge (it stopped while handling them).
+    Returns the number of answers read.
+    """
+    connection = get_redis()
+    response = connection.xreadgroup(RESULTS_GROUP, consumer, {RESULTS_STREAM: '0' if pending else '>'},
+                                     count=count, block=None if pending else block)
+    handled = 0
+    for _, entries in response or []:
+        for entry_id, fields in entries:
+            try:
+                handle({'type': fields[b'type'].decode(), 'payload': json.loads(fields[b'payload'])})
+            except Exception:
+                logger.exception(f"Failed to handle AI worker answer {entry_id!r}")
+            connection.xack(RESULTS_STREAM, RESULTS_GROUP, entry_id)
+            handled += 1
+    return handled
+
+
+def listen_results(handle):
+    """
+    Passes every notice published on the results channel to handle({'type': 'stored', 'payload'}).
+    Pub/sub does not keep messages: notices published while nobody listens are lost, but the
+    results are already in the cache and are served on the user's next request.
+    """
+    pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(RESULTS_CHANNEL)
+    try:
+        for message in pubsub.listen():
+            try:
+                handle({'type': 'stored', 'payload': json.loads(message['data'])})
+            except Exception:
+                logger.exception("Failed to handle AI worker result notice")
+    finally:
+        pubsub.close()
@@ -0,0 +1,213 @@
+import hashlib
+import json
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from api.models import User, UserRecipeRating
+from api.ranked_ids import set_segment
+from . import job_stream
+from .dispatch import acknowledge, dispatch
+
+# How long a request for the next segment of a user's ranking blocks asking for it again
+EXTEND_TIMEOUT = 60
+# How long a user's recommendation counts as being computed if no answer comes back; longer
+# than a request may wait in a busy worker's queue (Main.py --queue-deadline) plus the computation
+INFLIGHT_TIMEOUT = 120
+REQUEST_TYPES = ('list', 'refresh')
+
+
+def ask_script_message(user, include_ratings=False, request_type='list', continuation=None):
+    """
+    Builds the askScript message sent to the AI workers for a recipe recommendation.
+    The workers keep a profile vector per user, updated on every rating change, so the
+    payload only carries the profile version. The liked/disliked recipe ids are included
+    when a worker reports its stored profile as stale (see PythonScriptConsumer.receive).
+    request_type is 'list' for a first load (RecipeListView) or 'refresh' (RefreshRecipeView);
+    busy workers compute first loads before refreshes.
+    With settings.RECIPE_SEGMENT_SIZE, the worker answers with the first 'Limit' ids of the
+    ranking and a continuation token; passing that token asks for the segment after it.
+    """
+    payload = {
+        'Allergens': [allergy.name for allergy in user.allergies.all()],
+        'Preferences': [preference.name for preference in user.preferences.all()],
+        'Expiring Products': user.product_list.getExpiringProducts(user.notification_day),
+        'Profile Version': user.profile_version,
+        'Request Type': request_type,
+        'email': user.email
+    }
+    if getattr(settings, 'RECIPE_SEGMENT_SIZE', 0):
+        payload['Limit'] = settings.RECIPE_SEGMENT_SIZE
+    if continuation:
+        payload['Continuation'] = continuation
+    if include_ratings:
+        payload['Liked Recipes'] = list(UserRecipeRating.objects.filter(user=user, rating=True).values_list('recipe', flat=True))
+        payload['Disliked Recipes'] = list(UserRecipeRating.objects.filter(user=user, rating=False).values_list('recipe', flat=True))
+    return {
+        'type': 'askScript',
+        'message': payload
+    }
+
+
+def publish_rating_change(user, recipe_id, rating):
+    """
+    Bumps the user's profile version and sends the rating change (True, False, or None when
+    the rating was deleted) to the AI workers, which update the stored profile incrementally.
+    """
+    User.objects.filter(pk=user.pk).update(profile_version=F('profile_version') + 1)
+    user.refresh_from_db(fields=['profile_version'])
+    message = {
+        'Recipe': recipe_id,
+        'Rating': rating,
+        'Profile Version': user.profile_version,
+        'email': user.email
+    }
+    if job_stream.enabled():
+        job_stream.publish_rating(message)
+        return
+    async_to_sync(get_channel_layer().group_send)(
+        "python_scripts",
+        {
+            'type': 'rateRecipe',
+            'message': message
+        }
+    )
+
+
+def inflight_key(email):
+    return f"recepies_inflight_{email}"
+
+
+def suppressed_key(request_type):
+    return f"recipe_requests_suppressed_{request_type}"
+
+
+def suppressed_requests():
+    """
+    How many list and refresh requests were attached to a computation already in flight.
+    """
+    return {request_type: cache.get(suppressed_key(request_type)) or 0 for request_type in REQUEST_TYPES}
+
+
+def request_fingerprint(payload):
+    """
+    A digest of everything in an askScript payload that changes the result: allergens,
+    preferences, expiring products, profile version and segment size.
+    """
+    relevant = {field: value for field, value in payload.items() if field not in ('Request Type', 'email')}
+    return hashlib.sha1(json.dumps(relevant, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def request_recipes(user, request_type='list'):
+    """
+    Asks the AI workers for the user's recommendations, unless the same request is already being
+    computed: duplicate triggers (several devices, repeated pulls to refresh) then wait for the
+    pending answer and its 'ok' notification. A request counts as the same when its fingerprint
+    matches (see request_fingerprint), so a changed allergen, product or rating computes again,
+    and a refresh always replaces a pending first load. The in-flight marker lives in the shared
+    cache until the answer arrives, or INFLIGHT_TIMEOUT if it never does.
+    Returns whether a request was sent.
+    """
+    payload = ask_script_message(user, request_type=request_type)['message']
+    key = inflight_key(user.email)
+    marker = {'Fingerprint': request_fingerprint(payload), 'Request Type': request_type}
+    if not cache.add(key, marker, timeout=INFLIGHT_TIMEOUT):
+        pending = cache.get(key)
+        if (pending is not None and pending['Fingerprint'] == marker['Fingerprint']
+                and not (request_type == 'refresh' and pending['Request Type'] == 'list')):
+            cache.add(suppressed_key(request_type), 0, timeout=None)
+            cache.incr(suppressed_key(request_type))
+            return False
+        cache.set(key, marker, timeout=INFLIGHT_TIMEOUT)
+    dispatch(payload)
+    return True
+
+
+def extend_key(email):
+    return f"recepies_extend_{email}"
+
+
+def request_next_segment(user, next_segment, loaded, end):
+    """
+    Asks the AI workers for the next segment of the user's ranking once a page ends within
+    settings.RECIPE_PREFETCH_MARGIN ids of the loaded ones, so it is cached before the user
+    scrolls there. next_segment is ranked_ids.get_continuation(); one request per token at a time.
+    """
+    if end + getattr(settings, 'RECIPE_PREFETCH_MARGIN', 0) < loaded:
+        return False
+    if not cache.add(extend_key(user.email), next_segment['Continuation'], timeout=EXTEND_TIMEOUT):
+        return False
+    dispatch(ask_script_message(user, continuation=next_segment['Continuation'])['message'])
+    return True
+
+
+def notification_group(email):
+    # the group NotificationConsumer joins for the user's notifications
+    return f"notifications{email.split('@')[0] + email.split('@')[1]}"
+
+
+def _notify(email, message):
+    async_to_sync(get_channel_layer().group_send)(
+        notification_group(email),
+        {
+            'type': 'recipe',
+            'message': message
+        }
+    )
+
+
+def handle_worker_reply(data, resend):
+    """
+    Handles an answer from an AI worker, received on the websocket (PythonScriptConsumer),
+    on the results stream (consume_recipe_results) or on the results channel (listen_recipe_results). resend(payload) sends a request back to
+    the worker that answered, or to any worker for the stream transport.
+    """
+    payload = data['payload']
+    if data['type'] == 'run':
+        acknowledge(payload.get('Job'))
+        email = payload.get('email')
+        offset = payload.get('Offset') or 0
+        stored = set_segment(email, payload.get('recipe_ids'), offset, payload.get('Total'), payload.get('Continuation'))
+        if offset:
+            # A later segment extends the list the user is scrolling: a notification would reload it.
+            # One that was dropped (it belonged to a replaced ranking) is asked for again by the next page read
+            cache.delete(extend_key(email))
+        elif stored:
+            cache.delete(inflight_key(email))
+            _notify(email, 'ok')
+        else:
+            # Nothing new to load: the in-flight marker stays until it expires, and the user retries later
+            _notify(email, 'busy')
+    elif data['type'] == 'stored':
+        # The worker wrote the recipe ids straight into the cache (see listen_recipe_results)
+        acknowledge(payload.get('Job'))
+        cache.delete(inflight_key(payload['email']))
+        _notify(payload['email'], 'ok')
+    elif data['type'] == 'profile_stale':
+        # The worker missed a rating update (or never saw this user): resend the request
+        # with all the ratings, so it can rebuild the stored profile. The job stays
+        # assigned to this worker until it answers the resent request.
+        user = User.objects.filter(email=payload.get('email')).first()
+        if user is not None:
+            request = ask_script_message(user, include_ratings=True,
+                                         request_type=payload.get('Request Type') or 'list',
+                                         continuation=payload.get('Continuation'))['message']
+            request['Job'] = payload.get('Job')
+            resend(request)
+        else:
+            acknowledge(payload.get('Job'))
+    elif data['type'] == 'shed':
+        # The worker was too busy (or failed) and dropped the request: tell the user to retry later.
+        # A refresh keeps serving the previously cached recipes meanwhile. A request
+        # superseded by a newer one from the same user needs no notification.
+        acknowledge(payload.get('Job'))
+        email = payload.get('email')
+        if email and payload.get('Continuation'):
+            # A dropped segment request is asked for again by the next page read
+            cache.delete(extend_key(email))
+        elif email and payload.get('reason') != 'superseded':
+            cache.delete(inflight_key(email))
+            _notify(email, 'busy')
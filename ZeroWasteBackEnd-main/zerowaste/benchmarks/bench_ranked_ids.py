@@ -0,0 +1,77 @@
+"""
+Memory and read cost of the ranked recipe id lists cached per user (recepies_{email}): the
+pickled list stored before, against the packed uint32 and delta+varint forms of api/ranked_ids.py.
+
+Sizes are those of the values Django's Redis cache stores (pickle.dumps of the cached object),
+measured on --sample synthetic users and scaled to --users. The read cost is one page of
+RecipePaginator.max_limit ids: unpickling the whole list, against decoding only the page.
+With --redis-url, the values of --sample users are also written to that Redis and measured
+with MEMORY USAGE (the database is left as it was).
+
+Run (from ZeroWasteBackEnd-main/zerowaste):
+    python -m benchmarks.bench_ranked_ids [--catalog-sizes 870 10000] [--users 100000] [--redis-url redis://localhost:6379/15]
+"""
+import argparse
+import pickle
+import random
+import time
+
+from api.ranked_ids import RankedIds, encode
+
+PAGE = 50
+
+
+def per_call(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--catalog-sizes', type=int, nargs='+', default=[870, 10000, 100000])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--sample', type=int, default=200, help='synthetic users actually encoded')
+    parser.add_argument('--redis-url', default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    connection = None
+    if args.redis_url:
+        import redis
+        connection = redis.Redis.from_url(args.redis_url)
+
+    print(f"{'recipes':>8} {'format':>7} {'bytes/user':>10} {f'MiB @ {args.users} users':>18} "
+          f"{'page read us':>12}" + (f" {'redis bytes/user':>16}" if connection else ''))
+    for size in args.catalog_sizes:
+        # the ranking is unrelated to the id order, so each user gets a shuffled catalog
+        catalog_ids = list(range(1, size + 1))
+        users = [rng.sample(catalog_ids, size) for _ in range(args.sample)]
+        formats = {
+            'pickle': lambda ids: ids,
+            'packed': lambda ids: encode(ids, varint=False),
+            'varint': lambda ids: encode(ids, varint=True),
+        }
+        for name, to_cached in formats.items():
+            stored = [pickle.dumps(to_cached(ids), pickle.HIGHEST_PROTOCOL) for ids in users]
+            per_user = sum(map(len, stored)) / len(stored)
+            offset = size // 2
+            if name == 'pickle':
+                read = lambda value=stored[0]: pickle.loads(value)[offset:offset + PAGE]
+            else:
+                read = lambda value=stored[0]: RankedIds(pickle.loads(value))[offset:offset + PAGE]
+            assert read() == users[0][offset:offset + PAGE]
+            row = (f"{size:>8} {name:>7} {per_user:>10.0f} {per_user * args.users / 2 ** 20:>18.1f} "
+                   f"{per_call(read, 200) * 1e6:>12.1f}")
+            if connection is not None:
+                keys = [f'bench_ranked_ids:{name}:{i}' for i in range(len(stored))]
+                connection.mset(dict(zip(keys, stored)))
+                row += f" {sum(connection.memory_usage(key) for key in keys) / len(keys):>16.0f}"
+                connection.delete(*keys)
+            print(row)
+
+
+if __name__ == '__main__':
+    main()
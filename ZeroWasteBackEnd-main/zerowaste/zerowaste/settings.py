@@ -212,6 +212,27 @@ CACHES = {
     }
 }
 
+# How recipe requests are spread over the connected AI workers (see api/websocket_services/dispatch.py):
+# 'email_hash' keeps a user on the same worker, 'round_robin' or 'least_loaded' spread the load evenly
+AI_DISPATCH_STRATEGY = 'email_hash'
+# 'websocket' (ws/python-script/) or 'redis_stream': jobs, ratings and results go through Redis
+# streams (see api/websocket_services/job_stream.py), read back by `manage.py consume_recipe_results`
+AI_TRANSPORT = 'websocket'
+# Also carries the notices of workers that write results straight to the cache (`manage.py listen_recipe_results`)
+# and, for the websocket transport, the connected workers and unacknowledged jobs (api/websocket_services/dispatch.py);
+# set it to None to keep those in the backend process instead (a single process, no Redis)
+AI_STREAM_REDIS_URL = 'redis://127.0.0.1:6379/3'
+# Ranked recipe ids are cached as packed uint32 (4 bytes per id, fastest page reads) or, with
+# RANKED_IDS_VARINT, as delta+varint (about 2 bytes per id for a catalog under 10k recipes, ~30%
+# less than the pickled list used before); see api/ranked_ids.py and benchmarks/bench_ranked_ids.py
+RANKED_IDS_VARINT = False
+# The AI sends the ranking in segments of this many ids (0: all at once); RecipeListView asks for
+# the next segment when a page ends within RECIPE_PREFETCH_MARGIN ids of the ones already cached
+RECIPE_SEGMENT_SIZE = 200
+RECIPE_PREFETCH_MARGIN = 50
+# How long recipes/wait/ (an async view, needs the ASGI server) waits for the AI before answering 202
+RECIPE_WAIT_TIMEOUT = 10
+
 
 LOGGING = {
     'version': 1,